@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from database import Database
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, abort
+from database import RATING_SORTS, Database, ViewCounter
 from spotify_api import SpotifyAPI
+from recommender import create_recommender
+from importer import DiscographyImporter, MetadataRefresher, NewReleasesIngester
+from jobs import JobQueue
+from concurrency import FanOut, SingleFlight
 from functools import wraps
+import atexit
+import click
 import secrets
 from datetime import datetime, timedelta
 import os
@@ -44,6 +50,45 @@ except Exception as e:
     spotify = None
     print(f"⚠️  Erreur dans la base Spotify: {e}")
 
+recommender = create_recommender(db)
+
+# Tâches en arrière-plan (imports Spotify) : les workers démarrent au premier ajout de tâche
+job_queue = JobQueue(db, workers=2)
+
+# Deux utilisateurs qui ajoutent le même artiste / album en même temps : un seul import
+import_flight = SingleFlight()
+
+# Recherche : les appels Spotify tournent en arrière-plan (au plus 8 en même temps par processus)
+# pendant que la requête interroge la base locale
+fan_out = FanOut(max_workers=8)
+SEARCH_DEADLINE = 1.5  # Secondes (pour toute la recherche) avant d'afficher la page sans les résultats Spotify
+NEW_RELEASES_INTERVAL = 6 * 60 * 60  # Les nouveautés Spotify sont importées toutes les 6 heures
+REFRESH_INTERVAL = 60 * 60  # Rafraîchissement des artistes/albums depuis Spotify toutes les heures...
+REFRESH_BUDGET = 10  # ... avec au plus 10 appels groupés à Spotify par passage
+RECONCILE_INTERVAL = 24 * 60 * 60  # Vérification des compteurs des profils une fois par jour
+TRIM_TIMELINES_INTERVAL = 24 * 60 * 60  # Les fils d'actualité sont raccourcis une fois par jour...
+TIMELINE_KEEP = 500  # ... en gardant les 500 notes les plus récentes de chacun
+PURGE_HTTP_CACHE_INTERVAL = 24 * 60 * 60  # Nettoyage du cache disque des réponses Spotify une fois par jour
+HISTORY_PAGE_SIZE = 20  # Notes par page dans l'historique d'un profil
+
+# Vues des pages albums / artistes : comptées en mémoire, écrites en base par paquets
+view_counter = ViewCounter(db)
+atexit.register(view_counter.flush)
+
+@app.before_request
+def start_job_workers():
+    """Démarre les workers au premier appel (et après un fork) pour reprendre les tâches en attente"""
+    job_queue.start()
+
+def get_loader():
+    """
+    Chargeur par lots propre à la requête en cours (stocké dans flask.g).
+    Un album/artiste/utilisateur déjà chargé pendant la requête n'est jamais redemandé.
+    """
+    if 'loader' not in g:
+        g.loader = db.loader()
+    return g.loader
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -53,46 +98,154 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def import_artist_albums(artist_id, spotify_artist_id):
+@job_queue.handler('import_discography')
+def import_discography_job(payload):
     """
-    Importe tous les albums d'un artiste depuis Spotify
-    
-    Args:
-        artist_id: L'ID de l'artiste dans votre base de données
-        spotify_artist_id: L'ID Spotify de l'artiste
-    
-    Returns:
-        Le nombre d'albums importés
+    Tâche en arrière-plan : importe tous les albums (et singles) d'un artiste depuis Spotify.
+    payload = {'artist_id': ID dans notre base, 'spotify_artist_id': ID Spotify}
+    Retourne le rapport de l'import (nombre d'albums ajoutés, durées par étape)
     """
     if not spotify:
-        return 0
+        raise RuntimeError("Spotify API non configurée")
+    
+    report = DiscographyImporter(db, spotify).run(payload['artist_id'], payload['spotify_artist_id'])
+    print(f"Import de la discographie {payload['spotify_artist_id']}: {report['added']} albums ajoutés "
+          f"({report['found']} trouvés, {report['already_known']} déjà connus), "
+          f"durées par étape: {report['timings']}")
+    return report
 
-    artist_albums = spotify.get_artist_albums(spotify_artist_id)
+@job_queue.handler('ingest_new_releases')
+def ingest_new_releases_job(payload):
+    """
+    Tâche planifiée : ajoute les nouvelles sorties Spotify (albums, pistes et artistes) à la base,
+    pour que le premier visiteur d'une nouveauté la trouve déjà en local.
+    """
+    if not spotify:
+        raise RuntimeError("Spotify API non configurée")
     
-    if not artist_albums:
-        return 0
+    report = NewReleasesIngester(db, spotify).run()
+    print(f"Nouveautés Spotify: {report['added']} albums et {report['artists_added']} artistes ajoutés "
+          f"({report['found']} trouvés sur {report['pages']} pages), durées par étape: {report['timings']}")
+    return report
+
+@job_queue.handler('refresh_metadata')
+def refresh_metadata_job(payload):
+    """
+    Tâche planifiée : remet à jour depuis Spotify les noms, images et genres
+    des artistes et albums périmés les plus vus. payload = {'budget': appels à Spotify}
+    """
+    if not spotify:
+        raise RuntimeError("Spotify API non configurée")
+    
+    view_counter.flush()  # Les vues les plus récentes comptent dans le choix des lignes
+    return MetadataRefresher(db, spotify).run(payload.get('budget', REFRESH_BUDGET))
+
+@job_queue.handler('reconcile_user_stats')
+def reconcile_user_stats_job(payload):
+    """Tâche planifiée : vérifie les compteurs des profils (notes, abonnés...) et corrige les faux"""
+    fixed = db.reconcile_user_stats()
+    if fixed:
+        print(f"⚠️  Compteurs des utilisateurs : {fixed} lignes corrigées")
+    return {'fixed': fixed}
+
+@job_queue.handler('trim_timelines')
+def trim_timelines_job(payload):
+    """Tâche planifiée : raccourcit les fils d'actualité (sinon la table timeline grandit sans fin)"""
+    return {'deleted': db.trim_timelines(payload.get('keep', TIMELINE_KEEP))}
+
+@job_queue.handler('purge_http_cache')
+def purge_http_cache_job(payload):
+    """
+    Tâche planifiée : supprime du cache disque partagé (http_cache) les réponses Spotify
+    trop vieilles pour être servies, même en secours (sinon le fichier grandit sans fin)
+    """
+    if not spotify:
+        raise RuntimeError("Spotify API non configurée")
     
-    albums_added = 0
+    return {'deleted': spotify.cache.purge()}
+
+job_queue.schedule('reconcile_user_stats', RECONCILE_INTERVAL)
+job_queue.schedule('trim_timelines', TRIM_TIMELINES_INTERVAL, {'keep': TIMELINE_KEEP})
+if spotify:
+    job_queue.schedule('ingest_new_releases', NEW_RELEASES_INTERVAL)
+    job_queue.schedule('refresh_metadata', REFRESH_INTERVAL, {'budget': REFRESH_BUDGET})
+    job_queue.schedule('purge_http_cache', PURGE_HTTP_CACHE_INTERVAL)
+
+def enqueue_artist_albums_import(artist_id, spotify_artist_id):
+    """
+    Programme l'import de la discographie d'un artiste (sans attendre la fin).
+    Une seule tâche en attente par artiste, même si on clique plusieurs fois.
+    Retourne l'ID de la tâche (à suivre sur /jobs/<id>)
+    """
+    return job_queue.enqueue(
+        'import_discography',
+        {'artist_id': artist_id, 'spotify_artist_id': spotify_artist_id},
+        dedupe_key=f'import_discography:{spotify_artist_id}'
+    )
+
+def get_or_create_artist_from_spotify(spotify_artist_id):
+    """
+    Retourne l'ID (dans notre base) de l'artiste Spotify, en le créant s'il n'existe pas encore.
+    Les appels simultanés pour le même artiste sont regroupés (un seul appel à Spotify).
+    Retourne (artist_id, created) ; artist_id vaut None si Spotify ne répond pas.
+    """
+    def load():
+        artist = db.get_artist_by_spotify_id(spotify_artist_id)
+        if artist:
+            return artist.id, False
+        
+        artist_data = spotify.get_artist_details(spotify_artist_id)
+        if not artist_data:
+            return None, False
+        
+        artist_id = db.create_artist(
+            artist_data['name'],
+            artist_data['id'],
+            artist_data['image_url'],
+            artist_data['genres']
+        )
+        if artist_id is None:
+            # Un autre processus du serveur vient de le créer (spotify_id est UNIQUE) : on le relit
+            artist = db.get_artist_by_spotify_id(spotify_artist_id)
+            return (artist.id if artist else None), False
+        return artist_id, True
     
-    for album_data in artist_albums:
-   
-        existing_album = db.get_album_by_spotify_id(album_data['id'])
+    return import_flight.do(('artist', spotify_artist_id), load)
+
+def get_or_create_album_from_spotify(spotify_album_id):
+    """
+    Même chose pour un album (et son artiste).
+    Retourne (album_id, artist_id, spotify_artist_id, created) ; album_id vaut None en cas d'échec.
+    """
+    def load():
+        album = db.get_album_by_spotify_id(spotify_album_id)
+        if album:
+            return album.id, album.artist_id, None, False
         
-        if not existing_album:
-
-            album_id = db.create_album(
-                album_data['name'],
-                artist_id,
-                album_data['release_date'],
-                album_data['id'],
-                album_data['image_url'],
-                album_data.get('genres', [])
-            )
-            
-            if album_id:
-                albums_added += 1
+        album_data = spotify.get_album_details(spotify_album_id)
+        if not album_data:
+            return None, None, None, False
+        
+        artist_id, _ = get_or_create_artist_from_spotify(album_data['artist_id'])
+        if artist_id is None:
+            return None, None, None, False
+        
+        album_id = db.create_album(
+            album_data['name'],
+            artist_id,
+            album_data['release_date'],
+            album_data['id'],
+            album_data['image_url'],
+            album_data['genres'],
+            album_data['tracks']
+        )
+        if album_id is None:
+            # Créé entre-temps par un autre processus
+            album = db.get_album_by_spotify_id(spotify_album_id)
+            return (album.id if album else None), artist_id, album_data['artist_id'], False
+        return album_id, artist_id, album_data['artist_id'], True
     
-    return albums_added
+    return import_flight.do(('album', spotify_album_id), load)
 
 # ========== ROUTES PRINCIPALES ==========
 
@@ -102,20 +255,22 @@ def index():
     top_albums = db.get_top_rated_albums(limit=12)
     worst_albums = db.get_worst_rated_albums(limit=8)
     
-
-    for item in top_albums:
-        artist = db.get_artist_by_id(item['album'].artist_id)
-        item['artist'] = artist
+    # Recommandations personnalisées (modèle calculé hors-ligne, voir recommender.py)
+    recommendations = []
+    if 'user_id' in session:
+        recommendations = recommender.recommend(session['user_id'], limit=12)
     
-    for item in worst_albums:
-        artist = db.get_artist_by_id(item['album'].artist_id)
-        item['artist'] = artist
+    # Tous les artistes des trois listes en une seule requête
+    items = top_albums + worst_albums + recommendations
+    artists = get_loader().artists(item['album'].artist_id for item in items)
     
-
+    for item in items:
+        item['artist'] = artists.get(item['album'].artist_id)
     
     return render_template('index.html', 
                           top_albums=top_albums,
-                          worst_albums=worst_albums,)
+                          worst_albums=worst_albums,
+                          recommendations=recommendations)
 
 
 # ========== AUTHENTIFICATION ==========
@@ -200,21 +355,39 @@ def search():
         'spotify_artists': []
     }
     
+    # Curseurs des pages suivantes (None = pas d'autre page) ; on ne pagine qu'un seul type à la fois
+    cursor = request.args.get('cursor') or None
+    next_cursors = {'albums': None, 'artists': None}
 
+    # Recherches Spotify lancées en arrière-plan, recherches locales faites pendant ce temps dans ce thread :
+    # au bout de SEARCH_DEADLINE, on affiche la page avec les résultats locaux seuls si Spotify n'a pas répondu
+    local_searches = {}
+    spotify_searches = {}
     if search_type in ['all', 'albums']:
-        results['albums'] = db.search_albums(query)
+        local_searches['albums'] = lambda: db.search_albums_page(
+            query, cursor=cursor if search_type == 'albums' else None)
+        if spotify:
+            spotify_searches['spotify_albums'] = lambda: spotify.search_albums(query, limit=10)
     
     if search_type in ['all', 'artists']:
-        results['artists'] = db.search_artists(query)
+        local_searches['artists'] = lambda: db.search_artists_page(
+            query, cursor=cursor if search_type == 'artists' else None)
+        if spotify:
+            spotify_searches['spotify_artists'] = lambda: spotify.search_artists(query, limit=10)
 
-    if spotify:
-        if search_type in ['all', 'albums']:
-            results['spotify_albums'] = spotify.search_albums(query, limit=10)
-        
-        if search_type in ['all', 'artists']:
-            results['spotify_artists'] = spotify.search_artists(query, limit=10)
+    found = fan_out.run(local_searches, spotify_searches, timeout=SEARCH_DEADLINE,
+                        defaults={'spotify_albums': [], 'spotify_artists': []})
+    
+    for kind in ['albums', 'artists']:
+        if kind in found:
+            results[kind], next_cursors[kind] = found[kind]
+        # Un résultat Spotify déjà présent dans nos résultats locaux n'est affiché qu'une fois
+        known = {item.spotify_id for item in results[kind] if item.spotify_id}
+        results['spotify_' + kind] = [item for item in found.get('spotify_' + kind, [])
+                                      if item['id'] not in known]
     
-    return render_template('search.html', query=query, results=results, search_type=search_type)
+    return render_template('search.html', query=query, results=results, search_type=search_type,
+                          next_cursors=next_cursors)
 
 
 # ========== ALBUMS ==========
@@ -227,31 +400,42 @@ def album_detail(album_id):
     if not album:
         flash('Album introuvable', 'danger')
         return redirect(url_for('index'))
+    view_counter.record('albums', album_id)
     
     artist = db.get_artist_by_id(album.artist_id)
-    ratings = db.get_album_ratings(album_id)
-    avg_rating = db.get_album_average_rating(album_id)
+    album_stats = db.get_album_stats(album_id)
+    avg_rating = album_stats['avg_score']
     
- 
-    for rating in ratings:
-        rating.user = db.get_user_by_id(rating.user_id)
-        rating.replies_count = db.get_replies_count(rating.id)
+    # Une page de critiques (avec auteur et nombre de réponses) : ?sort=newest|highest|discussed&cursor=...
+    sort = request.args.get('sort', 'newest')
+    if sort not in RATING_SORTS:
+        sort = 'newest'
+    ratings, next_cursor = db.get_album_ratings_page(album_id, sort=sort, cursor=request.args.get('cursor') or None)
+    
+    # "Les fans de cet album ont aussi aimé" (précalculé hors-ligne)
+    similar_albums = db.get_album_neighbors(album_id)
+    similar_artists = get_loader().artists(item['album'].artist_id for item in similar_albums)
+    for item in similar_albums:
+        item['artist'] = similar_artists.get(item['album'].artist_id)
 
     user_rating = None
     if 'user_id' in session:
         user_rating = db.get_user_rating(session['user_id'], album_id)
     
 
-    tracks = []
-    if spotify and album.spotify_id:
-        tracks = spotify.get_album_tracks(album.spotify_id)
+    # Pistes enregistrées à l'import de l'album : aucun appel à Spotify ici
+    tracks = db.get_album_tracks(album_id)
     
     return render_template('album.html', 
                           album=album, 
                           artist=artist,
                           ratings=ratings,
+                          sort=sort,
+                          next_cursor=next_cursor,
                           avg_rating=avg_rating,
+                          album_stats=album_stats,
                           user_rating=user_rating,
+                          similar_albums=similar_albums,
                           tracks=tracks)
 
 
@@ -266,12 +450,8 @@ def album_tracklist(album_id):
     
     artist = db.get_artist_by_id(album.artist_id)
     
-    tracks = []
-    total_duration_ms = 0
-    
-    if spotify and album.spotify_id:
-        tracks = spotify.get_album_tracks(album.spotify_id)
-        total_duration_ms = sum(track['duration_ms'] for track in tracks)
+    tracks = db.get_album_tracks(album_id)
+    total_duration_ms, _ = db.get_album_duration(album_id)  # Précalculée à l'import
     
     total_minutes = total_duration_ms // 60000
     total_seconds = (total_duration_ms % 60000) // 1000
@@ -294,7 +474,9 @@ def rate_album(album_id):
         flash('Note invalide (doit être entre 0 et 10)', 'danger')
         return redirect(url_for('album_detail', album_id=album_id))
     
-    db.create_rating(session['user_id'], album_id, score, review if review else None)
+    if db.create_rating(session['user_id'], album_id, score, review if review else None) is None:
+        abort(404)  # L'album n'existe pas
+    recommender.on_rating_saved(session['user_id'], album_id)
     flash('Note enregistrée avec succès!', 'success')
     
     return redirect(url_for('album_detail', album_id=album_id))
@@ -304,6 +486,7 @@ def rate_album(album_id):
 def delete_rating(album_id, rating_id):
     """Supprimer une note"""
     if db.delete_rating(rating_id, session['user_id']):
+        recommender.on_rating_deleted(session['user_id'])
         flash('Note supprimée avec succès!', 'success')
     else:
         flash('Impossible de supprimer cette note', 'danger')
@@ -315,42 +498,20 @@ def delete_rating(album_id, rating_id):
 
 @app.route('/rating/<int:rating_id>/replies')
 def rating_replies(rating_id):
-    """Page de conversation pour une critique"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM ratings WHERE id = ?', (rating_id,))
-    rating = cursor.fetchone()
-    conn.close()
+    """Page de conversation pour une critique (?after=<id de réponse> pour charger la suite)"""
+    after = request.args.get('after', type=int)
+    thread = db.get_rating_thread(rating_id, after_reply_id=after)
     
-    if not rating:
+    if not thread:
         flash('Critique introuvable', 'danger')
         return redirect(url_for('index'))
     
-    album = db.get_album_by_id(rating['album_id'])
-    artist = db.get_artist_by_id(album.artist_id)
-    rating_user = db.get_user_by_id(rating['user_id'])
-    
-    replies = db.get_rating_replies(rating_id)
-    
-    for reply in replies:
-        reply.user = db.get_user_by_id(reply.user_id)
-    
-    from models import Rating
-    rating_obj = Rating(
-        rating['id'],
-        rating['user_id'],
-        rating['album_id'],
-        rating['score'],
-        rating['review'],
-        rating['created_at']
-    )
-    rating_obj.user = rating_user
-    
     return render_template('rating_replies.html',
-                          rating=rating_obj,
-                          album=album,
-                          artist=artist,
-                          replies=replies)
+                          rating=thread['rating'],
+                          album=thread['album'],
+                          artist=thread['artist'],
+                          replies=thread['replies'],
+                          next_after=thread['next_after'])
 
 
 @app.route('/rating/<int:rating_id>/reply', methods=['POST'])
@@ -363,7 +524,8 @@ def add_reply(rating_id):
         flash('La réponse ne peut pas être vide', 'danger')
         return redirect(url_for('rating_replies', rating_id=rating_id))
     
-    db.create_reply(rating_id, session['user_id'], content)
+    if db.create_reply(rating_id, session['user_id'], content) is None:
+        abort(404)  # La critique n'existe pas
     flash('Réponse ajoutée avec succès!', 'success')
     
     return redirect(url_for('rating_replies', rating_id=rating_id))
@@ -393,12 +555,14 @@ def artist_detail(artist_id):
     if not artist:
         flash('Artiste introuvable', 'danger')
         return redirect(url_for('index'))
+    view_counter.record('artists', artist_id)
     
     albums = db.get_albums_by_artist(artist_id)
     tags = db.get_artist_tags(artist_id)
     
+    averages = db.get_albums_average_ratings(album.id for album in albums)
     for album in albums:
-        album.avg_rating = db.get_album_average_rating(album.id)
+        album.avg_rating = averages[album.id]
     
     return render_template('artist.html', artist=artist, albums=albums, tags=tags)
 
@@ -413,7 +577,8 @@ def add_artist_tag(artist_id):
         flash('Le tag ne peut pas être vide', 'danger')
         return redirect(url_for('artist_detail', artist_id=artist_id))
     
-    db.create_tag(artist_id, tag_name, session['user_id'])
+    if db.create_tag(artist_id, tag_name, session['user_id']) is None:
+        abort(404)  # L'artiste n'existe pas
     flash('Tag ajouté avec succès!', 'success')
     
     return redirect(url_for('artist_detail', artist_id=artist_id))
@@ -439,41 +604,19 @@ def add_album_from_spotify(spotify_id):
         flash('L\'API Spotify n\'est pas configurée', 'danger')
         return redirect(url_for('search'))
     
-    existing_album = db.get_album_by_spotify_id(spotify_id)
-    if existing_album:
-        flash('Cet album existe déjà dans la base de données', 'info')
-        return redirect(url_for('album_detail', album_id=existing_album.id))
-    
-    album_data = spotify.get_album_details(spotify_id)
+    album_id, artist_id, spotify_artist_id, created = get_or_create_album_from_spotify(spotify_id)
     
-    if not album_data:
+    if not album_id:
         flash('Impossible de récupérer les informations de l\'album', 'danger')
         return redirect(url_for('search'))
     
-    artist = db.get_artist_by_spotify_id(album_data['artist_id'])
-    if not artist:
-        artist_data = spotify.get_artist_details(album_data['artist_id'])
-        artist_id = db.create_artist(
-            artist_data['name'],
-            artist_data['id'],
-            artist_data['image_url'],
-            artist_data['genres']
-        )
-    else:
-        artist_id = artist.id
-    
-    album_id = db.create_album(
-        album_data['name'],
-        artist_id,
-        album_data['release_date'],
-        album_data['id'],
-        album_data['image_url'],
-        album_data['genres']
-    )
-    
-    albums_added = import_artist_albums(artist_id, album_data['artist_id'])
+    if not created:
+        flash('Cet album existe déjà dans la base de données', 'info')
+        return redirect(url_for('album_detail', album_id=album_id))
     
-
+    # Le reste de la discographie est importé en arrière-plan
+    enqueue_artist_albums_import(artist_id, spotify_artist_id)
+    flash('Album ajouté ! Les autres albums de l\'artiste arrivent dans quelques instants.', 'success')
     
     return redirect(url_for('album_detail', album_id=album_id))
 
@@ -488,61 +631,42 @@ def user_profile(user_id):
         flash('Utilisateur introuvable', 'danger')
         return redirect(url_for('index'))
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) as count FROM ratings WHERE user_id = ?', (user_id,))
-    ratings_count = cursor.fetchone()['count']
+    # Compteurs tenus à jour par des triggers : une seule ligne à lire
+    stats = db.get_user_stats(user_id)
     
-    cursor.execute('SELECT COUNT(*) as count FROM follows WHERE following_id = ?', (user_id,))
-    followers_count = cursor.fetchone()['count']
+    # Première page de l'historique ; la suite se charge via /profile/<id>/ratings?cursor=...
+    ratings, next_cursor = db.get_user_ratings_page(user_id, limit=HISTORY_PAGE_SIZE)
     
-    cursor.execute('SELECT COUNT(*) as count FROM follows WHERE follower_id = ?', (user_id,))
-    following_count = cursor.fetchone()['count']
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT * FROM ratings 
+            WHERE user_id = ? AND score >= 7
+            ORDER BY score DESC, created_at DESC
+            LIMIT 5
+        ''', (user_id,))
+        favorite_rows = cursor.fetchall()
+    finally:
+        conn.close()
     
-    stats = {
-        'ratings_count': ratings_count,
-        'followers_count': followers_count,
-        'following_count': following_count
-    }
+    # Albums puis artistes des deux listes : deux requêtes en tout, quel que soit le nombre de notes
+    loader = get_loader()
+    albums = loader.albums([rating.album_id for rating in ratings] + [row['album_id'] for row in favorite_rows])
+    artists = loader.artists(album.artist_id for album in albums.values())
     
-    cursor.execute('''
-        SELECT * FROM ratings 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
-        LIMIT 20
-    ''', (user_id,))
-    rating_rows = cursor.fetchall()
-    
-    user_ratings = []
-    for row in rating_rows:
-        album = db.get_album_by_id(row['album_id'])
-        artist = db.get_artist_by_id(album.artist_id)
-        user_ratings.append({
-            'rating': row,
-            'album': album,
-            'artist': artist
-        })
-    
-    cursor.execute('''
-        SELECT * FROM ratings 
-        WHERE user_id = ? AND score >= 7
-        ORDER BY score DESC, created_at DESC
-        LIMIT 5
-    ''', (user_id,))
-    favorite_rows = cursor.fetchall()
+    user_ratings = rating_history_items(ratings)
     
     favorite_albums = []
     for row in favorite_rows:
-        album = db.get_album_by_id(row['album_id'])
-        artist = db.get_artist_by_id(album.artist_id)
-        favorite_albums.append({
-            'album': album,
-            'artist': artist,
-            'score': row['score']
-        })
-    
-    conn.close()
+        album = albums.get(row['album_id'])
+        if album:
+            favorite_albums.append({
+                'album': album,
+                'artist': artists.get(album.artist_id),
+                'score': row['score']
+            })
     
     is_following = False
     if 'user_id' in session and session['user_id'] != user_id:
@@ -551,10 +675,43 @@ def user_profile(user_id):
     return render_template('profile.html', 
                           profile_user=user, 
                           user_ratings=user_ratings,
+                          next_cursor=next_cursor,
                           favorite_albums=favorite_albums,
                           stats=stats,
                           is_following=is_following)
 
+
+def rating_history_items(ratings):
+    """Associe à chaque note son album et son artiste (chargés en lot) : [{'rating', 'album', 'artist'}]"""
+    loader = get_loader()
+    albums = loader.albums(rating.album_id for rating in ratings)
+    artists = loader.artists(album.artist_id for album in albums.values())
+    
+    items = []
+    for rating in ratings:
+        album = albums.get(rating.album_id)
+        if album:
+            items.append({'rating': rating, 'album': album, 'artist': artists.get(album.artist_id)})
+    return items
+
+
+@app.route('/profile/<int:user_id>/ratings')
+def user_ratings_history(user_id):
+    """Historique des notes d'un utilisateur au format JSON, page par page (défilement infini)"""
+    if not db.get_user_by_id(user_id):
+        return jsonify({'error': 'Utilisateur introuvable'}), 404
+    
+    ratings, next_cursor = db.get_user_ratings_page(user_id, limit=HISTORY_PAGE_SIZE,
+                                                    cursor=request.args.get('cursor') or None)
+    return jsonify({
+        'items': [{
+            'rating': item['rating'].to_dict(),
+            'album': item['album'].to_dict(),
+            'artist': item['artist'].to_dict() if item['artist'] else None,
+        } for item in rating_history_items(ratings)],
+        'next_cursor': next_cursor,
+    })
+
 @app.route('/artist/add_from_spotify/<spotify_id>')
 @login_required
 def add_artist_from_spotify(spotify_id):
@@ -563,29 +720,17 @@ def add_artist_from_spotify(spotify_id):
         flash('L\'API Spotify n\'est pas configurée', 'danger')
         return redirect(url_for('search'))
     
-    existing_artist = db.get_artist_by_spotify_id(spotify_id)
-    if existing_artist:
-        return redirect(url_for('artist_detail', artist_id=existing_artist.id))
-    
-    artist_data = spotify.get_artist_details(spotify_id)
-    
-    if not artist_data:
-        flash('Impossible de récupérer les informations de l\'artiste', 'danger')
-        return redirect(url_for('search'))
-    
-    artist_id = db.create_artist(
-        artist_data['name'],
-        artist_data['id'],
-        artist_data['image_url'],
-        artist_data['genres']
-    )
+    artist_id, created = get_or_create_artist_from_spotify(spotify_id)
     
     if not artist_id:
-        flash('Erreur lors de la création de l\'artiste', 'danger')
+        flash('Impossible de récupérer les informations de l\'artiste', 'danger')
         return redirect(url_for('search'))
     
-    albums_added = import_artist_albums(artist_id, spotify_id)
+    if not created:
+        return redirect(url_for('artist_detail', artist_id=artist_id))
     
+    enqueue_artist_albums_import(artist_id, spotify_id)
+    flash('Artiste ajouté ! Ses albums arrivent dans quelques instants.', 'success')
     
     return redirect(url_for('artist_detail', artist_id=artist_id))
     
@@ -600,11 +745,7 @@ def update_bio():
         flash('La bio ne peut pas dépasser 200 caractères', 'danger')
         return redirect(url_for('user_profile', user_id=session['user_id']))
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET bio = ? WHERE id = ?', (bio, session['user_id']))
-    conn.commit()
-    conn.close()
+    db.update_user_bio(session['user_id'], bio)
     
     flash('Bio mise à jour avec succès !', 'success')
     return redirect(url_for('user_profile', user_id=session['user_id']))
@@ -623,13 +764,10 @@ def update_profile_image():
                 flash('Format de fichier non autorisé. Utilisez PNG, JPG, JPEG, GIF ou WEBP.', 'danger')
                 return redirect(url_for('user_profile', user_id=session['user_id']))
             
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT profile_image FROM users WHERE id = ?', (session['user_id'],))
-            old_image = cursor.fetchone()
+            old_image = db.get_user_by_id(session['user_id'])
             
-            if old_image and old_image['profile_image']:
-                old_image_path = old_image['profile_image']
+            if old_image and old_image.profile_image:
+                old_image_path = old_image.profile_image
                 if old_image_path.startswith('/static/'):
                     old_image_path = old_image_path[8:]  
                     full_path = os.path.join('static', old_image_path)
@@ -648,10 +786,7 @@ def update_profile_image():
             
             db_path = f"/static/uploads/profiles/{unique_filename}"
             
-            cursor.execute('UPDATE users SET profile_image = ? WHERE id = ?', 
-                         (db_path, session['user_id']))
-            conn.commit()
-            conn.close()
+            db.update_user_profile_image(session['user_id'], db_path)
             
             flash('Photo de profil mise à jour avec succès !', 'success')
             return redirect(url_for('user_profile', user_id=session['user_id']))
@@ -663,12 +798,7 @@ def update_profile_image():
             flash('URL d\'image invalide', 'danger')
             return redirect(url_for('user_profile', user_id=session['user_id']))
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET profile_image = ? WHERE id = ?', 
-                     (profile_image_url, session['user_id']))
-        conn.commit()
-        conn.close()
+        db.update_user_profile_image(session['user_id'], profile_image_url)
         
         flash('Photo de profil mise à jour avec succès !', 'success')
         return redirect(url_for('user_profile', user_id=session['user_id']))
@@ -681,14 +811,10 @@ def update_profile_image():
 @login_required
 def delete_profile_image():
     """Supprimer la photo de profil"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
+    result = db.get_user_by_id(session['user_id'])
     
-    cursor.execute('SELECT profile_image FROM users WHERE id = ?', (session['user_id'],))
-    result = cursor.fetchone()
-    
-    if result and result['profile_image']:
-        image_path = result['profile_image']
+    if result and result.profile_image:
+        image_path = result.profile_image
         
         if image_path.startswith('/static/'):
             image_path = image_path[8:]  
@@ -699,11 +825,9 @@ def delete_profile_image():
                 except:
                     pass
         
-        cursor.execute('UPDATE users SET profile_image = NULL WHERE id = ?', (session['user_id'],))
-        conn.commit()
+        db.update_user_profile_image(session['user_id'], None)
         flash('Photo de profil supprimée', 'info')
     
-    conn.close()
     return redirect(url_for('user_profile', user_id=session['user_id']))
 
 
@@ -713,11 +837,17 @@ def friends():
     """Page des amis de l'utilisateur"""
     friends_list = db.get_user_friends(session['user_id'])
     
-    friends_recent_ratings = db.get_friends_recent_ratings(session['user_id'], limit=20)
+    # Pagination "plus anciennes que la note X" (?before=<id de la dernière note affichée>)
+    before_id = request.args.get('before', type=int)
+    friends_recent_ratings, next_before_id = db.get_friends_timeline(
+        session['user_id'], limit=20, before_id=before_id if before_id and before_id > 0 else None,
+        loader=get_loader()
+    )
     
     return render_template('friends.html', 
                           friends=friends_list,
-                          friends_recent_ratings=friends_recent_ratings)
+                          friends_recent_ratings=friends_recent_ratings,
+                          next_before_id=next_before_id)
 
 @app.route('/follow/<int:user_id>', methods=['POST'])
 @login_required
@@ -728,6 +858,7 @@ def follow_user(user_id):
         return redirect(url_for('user_profile', user_id=user_id))
     
     db.follow_user(session['user_id'], user_id)
+    recommender.on_follow_changed(session['user_id'])
     flash('Vous suivez maintenant cet utilisateur', 'success')
     
     return redirect(url_for('user_profile', user_id=user_id))
@@ -738,6 +869,7 @@ def follow_user(user_id):
 def unfollow_user(user_id):
     """Ne plus suivre un utilisateur"""
     db.unfollow_user(session['user_id'], user_id)
+    recommender.on_follow_changed(session['user_id'])
     flash('Vous ne suivez plus cet utilisateur', 'info')
     
     return redirect(url_for('user_profile', user_id=user_id))
@@ -755,10 +887,12 @@ def forgot_password():
             return render_template('forgot_password.html')
         
         conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        user = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
+            user = cursor.fetchone()
+        finally:
+            conn.close()
         
         if user:
             token = secrets.token_urlsafe(32)
@@ -818,14 +952,7 @@ def reset_password(token):
         from models import User
         new_password_hash = User.hash_password(password)
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'UPDATE users SET password_hash = ? WHERE id = ?',
-            (new_password_hash, token_data['user_id'])
-        )
-        conn.commit()
-        conn.close()
+        db.update_user_password(token_data['user_id'], new_password_hash)
         
         del reset_tokens[token]
         
@@ -871,11 +998,7 @@ def update_username():
         return redirect(url_for('settings'))
     
     # Mettre à jour le nom d'utilisateur
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET username = ? WHERE id = ?', (new_username, session['user_id']))
-    conn.commit()
-    conn.close()
+    db.update_username(session['user_id'], new_username)
     
     # Mettre à jour la session
     session['username'] = new_username
@@ -908,19 +1031,19 @@ def update_email():
     
     # Vérifier si l'email existe déjà
     conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ? AND id != ?', (new_email, session['user_id']))
-    existing_email = cursor.fetchone()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE email = ? AND id != ?', (new_email, session['user_id']))
+        existing_email = cursor.fetchone()
+    finally:
+        conn.close()
     
     if existing_email:
-        conn.close()
         flash('Cette adresse email est déjà utilisée', 'danger')
         return redirect(url_for('settings'))
     
     # Mettre à jour l'email
-    cursor.execute('UPDATE users SET email = ? WHERE id = ?', (new_email, session['user_id']))
-    conn.commit()
-    conn.close()
+    db.update_user_email(session['user_id'], new_email)
     
     flash('Adresse email mise à jour avec succès !', 'success')
     return redirect(url_for('settings'))
@@ -957,11 +1080,7 @@ def update_password():
     from models import User
     new_password_hash = User.hash_password(new_password)
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_password_hash, session['user_id']))
-    conn.commit()
-    conn.close()
+    db.update_user_password(session['user_id'], new_password_hash)
     
     flash('Mot de passe mis à jour avec succès !', 'success')
     return redirect(url_for('settings'))
@@ -985,29 +1104,39 @@ def delete_account():
         flash('Mot de passe incorrect', 'danger')
         return redirect(url_for('settings'))
     
-    # Supprimer toutes les données de l'utilisateur
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
     user_id = session['user_id']
+    follower_ids = db.get_follower_ids(user_id)  # À lire avant de supprimer les follows
     
-    # Supprimer les réponses
-    cursor.execute('DELETE FROM replies WHERE user_id = ?', (user_id,))
-    
-    # Supprimer les notes
-    cursor.execute('DELETE FROM ratings WHERE user_id = ?', (user_id,))
-    
-    # Supprimer les follows (en tant que follower et following)
-    cursor.execute('DELETE FROM follows WHERE follower_id = ? OR following_id = ?', (user_id, user_id))
-    
-    # Supprimer les tags
-    cursor.execute('DELETE FROM tags WHERE user_id = ?', (user_id,))
-    
-    # Supprimer l'utilisateur
-    cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+    # Supprimer toutes les données de l'utilisateur
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        
+        # Supprimer les réponses
+        cursor.execute('DELETE FROM replies WHERE user_id = ?', (user_id,))
+        
+        # Supprimer les notes
+        cursor.execute('DELETE FROM ratings WHERE user_id = ?', (user_id,))
+        
+        # Supprimer les follows (en tant que follower et following)
+        cursor.execute('DELETE FROM follows WHERE follower_id = ? OR following_id = ?', (user_id, user_id))
+        
+        # Supprimer les tags
+        cursor.execute('DELETE FROM tags WHERE user_id = ?', (user_id,))
+        
+        # Supprimer les albums favoris (les clés étrangères sont vérifiées par SQLite)
+        cursor.execute('DELETE FROM favorite_albums WHERE user_id = ?', (user_id,))
+        
+        # Supprimer l'utilisateur
+        cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        
+        conn.commit()
+    finally:
+        conn.close()  # En cas d'erreur, la transaction est annulée et la connexion rendue au pool
     
-    conn.commit()
-    conn.close()
+    # Ses recommandations et celles de ses abonnés ("adoré par vos amis") ne sont plus valables
+    recommender.forget_user(user_id)
+    recommender.cache.invalidate_many(follower_ids)
     
     # Déconnecter l'utilisateur
     session.clear()
@@ -1016,6 +1145,130 @@ def delete_account():
     return redirect(url_for('index'))
 
 
+# ========== SUPERVISION ==========
+
+@app.route('/metrics')
+def metrics():
+    """Statistiques internes (pool de connexions...) au format JSON"""
+    return jsonify({
+        'db_pool': db.get_pool_stats(),
+        'recommender': recommender.stats(),
+        'spotify_cache': spotify.cache_stats() if spotify else None,
+        'spotify_client': spotify.client_stats() if spotify else None,
+        'import_single_flight': import_flight.stats(),
+        'search_fan_out': fan_out.stats(),
+        'view_counter': view_counter.stats(),
+        'entity_cache': db.get_entity_cache_stats(),
+        'jobs': job_queue.stats()
+    })
+
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """État d'une tâche en arrière-plan (pending, running, done ou failed) au format JSON"""
+    job = job_queue.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Tâche introuvable'}), 404
+    return jsonify(job)
+
+
+# ========== COMMANDES D'ADMINISTRATION (flask <commande>) ==========
+
+@app.cli.command('rebuild-album-stats')
+def rebuild_album_stats_command():
+    """Recalcule les statistiques des albums (moyennes, histogrammes) depuis la table ratings"""
+    db.rebuild_album_stats()
+    print("✅ Statistiques des albums recalculées")
+
+
+@app.cli.command('reconcile-user-stats')
+def reconcile_user_stats_command():
+    """Vérifie les compteurs des profils (notes, abonnés, abonnements, réponses) et corrige les faux"""
+    fixed = db.reconcile_user_stats()
+    print(f"✅ Compteurs des utilisateurs vérifiés : {fixed} lignes corrigées")
+
+
+@app.cli.command('build-album-similarity')
+@click.option('--full', is_flag=True, help='Tout recalculer au lieu des seuls albums modifiés')
+def build_album_similarity_command(full):
+    """Met à jour les albums similaires ("les fans ont aussi aimé") à partir des notes"""
+    # Import ici : NumPy / SciPy ne servent qu'à ce calcul hors-ligne, pas au site
+    from similarity import build_album_neighbors
+    summary = build_album_neighbors(db, full=full)
+    print(f"✅ {summary['albums_refreshed']} albums recalculés, "
+          f"{summary['neighbors_written']} voisins écrits en {summary['seconds']} s")
+
+
+@app.cli.command('train-recommender')
+@click.option('--factors', default=64, show_default=True, help='Taille des vecteurs appris')
+@click.option('--iterations', default=15, show_default=True, help="Nombre d'itérations ALS")
+def train_recommender_command(factors, iterations):
+    """Entraîne le modèle de recommandations (ALS) à partir des notes et le publie"""
+    from recommender import train_als
+    summary = train_als(db, factors=factors, iterations=iterations)
+    print(f"✅ Modèle {summary['version']} : {summary['users']} utilisateurs, "
+          f"{summary['albums']} albums en {summary['seconds']} s")
+
+
+@app.cli.command('trim-timelines')
+@click.option('--keep', default=TIMELINE_KEEP, show_default=True, help='Nombre de notes gardées dans chaque fil')
+def trim_timelines_command(keep):
+    """Raccourcit les fils d'actualité des amis (les plus vieilles notes restent visibles sur les profils)"""
+    deleted = db.trim_timelines(keep)
+    print(f"✅ {deleted} lignes supprimées des fils d'actualité")
+
+
+@app.cli.command('backfill-tracks')
+@click.option('--limit', default=0, help="Nombre maximum d'albums à traiter (0 = tous)")
+def backfill_tracks_command(limit):
+    """Importe depuis Spotify les pistes des albums qui n'en ont pas encore"""
+    if not spotify:
+        print("⚠️  Spotify API non configurée.")
+        return
+    
+    filled = 0
+    for album_id, spotify_id in db.get_albums_without_tracks(limit or None):
+        album_data = spotify.get_album_details(spotify_id)
+        if album_data and album_data['tracks']:
+            db.save_album_tracks(album_id, album_data['tracks'])
+            filled += 1
+    print(f"✅ Pistes importées pour {filled} albums")
+
+
+@app.cli.command('ingest-new-releases')
+def ingest_new_releases_command():
+    """Importe tout de suite les nouvelles sorties Spotify (sans attendre la tâche planifiée)"""
+    if not spotify:
+        print("⚠️  Spotify API non configurée.")
+        return
+    
+    report = NewReleasesIngester(db, spotify).run()
+    print(f"✅ {report['added']} albums et {report['artists_added']} artistes ajoutés "
+          f"({report['already_known']} déjà connus), durées par étape: {report['timings']}")
+
+
+@app.cli.command('refresh-metadata')
+@click.option('--budget', default=REFRESH_BUDGET, show_default=True, help="Nombre maximum d'appels groupés à Spotify")
+def refresh_metadata_command(budget):
+    """Remet à jour depuis Spotify les artistes et albums périmés les plus vus"""
+    if not spotify:
+        print("⚠️  Spotify API non configurée.")
+        return
+    
+    report = MetadataRefresher(db, spotify).run(budget)
+    print(f"✅ Artistes : {report['artists']['changed']} modifiés sur {report['artists']['checked']} vérifiés, "
+          f"albums : {report['albums']['changed']} modifiés sur {report['albums']['checked']} vérifiés")
+
+
+@app.cli.command('run-jobs')
+@click.option('--workers', default=2, show_default=True, help='Nombre de workers')
+def run_jobs_command(workers):
+    """Exécute les tâches en arrière-plan (imports Spotify...) jusqu'à Ctrl+C"""
+    job_queue.workers = workers
+    print(f"✅ {workers} workers démarrés, Ctrl+C pour arrêter")
+    job_queue.run_forever()
+
+
 # ========== ERREURS ==========
 
 @app.errorhandler(404)
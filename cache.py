@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+"""
+Petit cache en mémoire partagé par les threads du serveur.
+- LRU : quand il est plein, on oublie l'entrée utilisée il y a le plus longtemps.
+- TTL : une entrée plus vieille que `ttl` secondes est considérée comme absente.
+Les compteurs (hits, misses...) sont exposés par /metrics.
+
+ResponseCache ajoute derrière ce cache mémoire un fichier SQLite partagé entre les workers,
+pour les réponses d'API externes (Spotify).
+"""
+
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from concurrency import SingleFlight
+
+
+class LRUCache:
+    """Dictionnaire borné en taille (LRU) et en âge (TTL), protégé par un verrou"""
+
+    def __init__(self, max_size=1000, ttl=600):
+        assert isinstance(max_size, int) and max_size > 0, "max_size doit être un entier positif"
+        assert ttl > 0, "ttl doit être positif"
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # clé -> (date d'expiration, valeur), du plus ancien au plus récent
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """Retourne la valeur si elle est présente et pas expirée, sinon `default`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)  # Utilisée à l'instant : elle passe en dernier
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Ajoute ou remplace une entrée (ttl permet de changer la durée pour cette entrée)"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def update(self, key, function):
+        """
+        Remplace la valeur par function(valeur) sans changer sa date d'expiration.
+        Si function retourne None, l'entrée est supprimée. Ne fait rien si la clé est absente.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            value = function(entry[1])
+            if value is None:
+                del self._entries[key]
+                self.invalidations += 1
+            else:
+                self._entries[key] = (entry[0], value)
+
+    def invalidate(self, key):
+        """Supprime une entrée (si elle existe)"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_many(self, keys):
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Compteurs pour /metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+class SQLiteStore:
+    """
+    Stockage clé -> JSON dans un fichier SQLite, partagé par tous les workers du serveur.
+    Chaque thread (et chaque processus après un fork) ouvre sa propre connexion.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS http_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,  -- La réponse, en JSON
+                fetched_at REAL NOT NULL  -- Quand on l'a récupérée (secondes depuis 1970)
+            )
+        ''')
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Retourne (fetched_at, valeur) ou None"""
+        row = self._connection().execute(
+            'SELECT fetched_at, value FROM http_cache WHERE key = ?', (key,)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def set(self, key, fetched_at, value):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO http_cache (key, value, fetched_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), fetched_at)
+        )
+        conn.commit()
+
+    def purge(self, older_than):
+        """Supprime les entrées récupérées avant la date `older_than`"""
+        conn = self._connection()
+        deleted = conn.execute('DELETE FROM http_cache WHERE fetched_at < ?', (older_than,)).rowcount
+        conn.commit()
+        return deleted
+
+
+class ResponseCache:
+    """
+    Cache à deux niveaux pour les réponses d'une API externe :
+    un LRUCache en mémoire (par processus) devant un SQLiteStore (partagé entre workers).
+
+    Chaque "endpoint" a deux durées (ttl, stale) :
+    - âge < ttl : la réponse est fraîche, on la sert ;
+    - ttl <= âge < ttl + stale : on sert quand même l'ancienne réponse tout de suite
+      et on la rafraîchit en arrière-plan ("stale-while-revalidate") ;
+    - au-delà : on attend la nouvelle réponse ; si l'API est en panne, on sert quand même
+      l'ancienne réponse si le fichier l'a encore ("stale-if-error").
+    """
+
+    def __init__(self, endpoints, store_path=None, memory_size=2000):
+        self.endpoints = endpoints  # {endpoint: (ttl, stale)}
+        self.memory = LRUCache(memory_size, ttl=max(ttl + stale for ttl, stale in endpoints.values()))
+        self.store = SQLiteStore(store_path) if store_path else None
+        self._refreshing = set()  # Clés en cours de rafraîchissement (un seul à la fois par clé)
+        self.flight = SingleFlight()  # Un seul appel à l'API à la fois pour une même clé
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'store_hits': 0, 'stale_hits': 0,
+                         'misses': 0, 'refreshes': 0, 'refresh_errors': 0, 'error_fallbacks': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, endpoint, params, fetch):
+        """
+        Retourne la réponse en cache pour (endpoint, params), sinon appelle fetch() et la garde.
+        Les exceptions de fetch() remontent à l'appelant (rien n'est mis en cache dans ce cas).
+        """
+        ttl, stale = self.endpoints[endpoint]
+        key = self._key(endpoint, params)
+
+        entry, level = self._lookup(key, ttl + stale)
+        if entry is not None:
+            fetched_at, value = entry
+            age = time.time() - fetched_at
+            if age < ttl:
+                self._count(level)
+                return copy.deepcopy(value)  # L'appelant peut modifier sa copie sans abîmer le cache
+            if age < ttl + stale:
+                self._count('stale_hits')
+                self._refresh_in_background(key, fetch, ttl + stale)
+                return copy.deepcopy(value)
+
+        self._count('misses')
+        try:
+            # Plusieurs threads ratent le cache en même temps pour la même clé :
+            # un seul appelle l'API, les autres attendent son résultat
+            value = self.flight.do(key, lambda: self._fetch_and_save(key, fetch, ttl + stale))
+        except Exception:
+            # API en panne : une vieille réponse (même expirée) vaut mieux qu'une page vide
+            if entry is not None:
+                self._count('error_fallbacks')
+                return copy.deepcopy(entry[1])
+            raise
+        return copy.deepcopy(value)  # Chaque thread reçoit sa propre copie du résultat partagé
+
+    def _fetch_and_save(self, key, fetch, lifetime):
+        value = fetch()
+        self._save(key, value, lifetime)  # Personne ne reçoit cet objet-là : uniquement des copies
+        return value
+
+    def peek(self, endpoint, params):
+        """
+        Retourne la réponse en cache (fraîche ou "stale") pour (endpoint, params), sinon None,
+        sans rien appeler : utile pour les appels groupés (plusieurs ids d'un coup).
+        """
+        ttl, stale = self.endpoints[endpoint]
+        key = self._key(endpoint, params)
+        entry, level = self._lookup(key, ttl + stale)
+        if entry is None or time.time() - entry[0] >= ttl + stale:
+            self._count('misses')
+            return None
+        self._count(level)
+        return copy.deepcopy(entry[1])
+
+    def put(self, endpoint, params, value):
+        """Enregistre une réponse obtenue autrement (ex : par un appel groupé)"""
+        ttl, stale = self.endpoints[endpoint]
+        self._save(self._key(endpoint, params), copy.deepcopy(value), ttl + stale)
+
+    def _lookup(self, key, lifetime):
+        """Cherche d'abord en mémoire, puis dans le fichier. Retourne (entrée ou None, niveau trouvé)"""
+        entry = self.memory.get(key)
+        if entry is not None or not self.store:
+            return entry, 'memory_hits'
+        try:
+            entry = self.store.get(key)
+        except sqlite3.Error as e:
+            print(f"⚠️  Cache disque indisponible: {e}")
+        if entry is not None:
+            self._remember(key, entry, lifetime)
+        return entry, 'store_hits'
+
+    @staticmethod
+    def _key(endpoint, params):
+        return endpoint + ':' + json.dumps(params, sort_keys=True)
+
+    def _remember(self, key, entry, lifetime):
+        """Met l'entrée en mémoire jusqu'à la fin de sa période "stale" """
+        remaining = entry[0] + lifetime - time.time()
+        if remaining > 0:
+            self.memory.set(key, entry, ttl=remaining)
+
+    def _save(self, key, value, lifetime):
+        entry = (time.time(), value)
+        self.memory.set(key, entry, ttl=lifetime)
+        if self.store:
+            try:
+                self.store.set(key, entry[0], value)
+            except sqlite3.Error as e:
+                # Le cache disque n'est qu'une optimisation : on continue sans lui
+                print(f"⚠️  Cache disque indisponible: {e}")
+
+    def purge(self):
+        """
+        Supprime du fichier les réponses plus vieilles que la plus longue période ttl + stale :
+        plus aucun endpoint ne peut les servir. Retourne le nombre de lignes supprimées.
+        """
+        if not self.store:
+            return 0
+        lifetime = max(ttl + stale for ttl, stale in self.endpoints.values())
+        return self.store.purge(time.time() - lifetime)
+
+    def _refresh_in_background(self, key, fetch, lifetime):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._save(key, fetch(), lifetime)
+                self._count('refreshes')
+            except Exception as e:
+                self._count('refresh_errors')
+                print(f"Erreur lors du rafraîchissement du cache ({key}): {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        """Compteurs pour /metrics"""
+        with self._lock:
+            counters = dict(self.counters)
+        hits = counters['memory_hits'] + counters['store_hits'] + counters['stale_hits']
+        lookups = hits + counters['misses']
+        counters['hit_ratio'] = round(hits / lookups, 3) if lookups else 0.0
+        counters['memory'] = self.memory.stats()
+        counters['single_flight'] = self.flight.stats()
+        return counters
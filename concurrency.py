@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+Regroupement des appels identiques simultanés ("single flight").
+
+Si dix requêtes demandent en même temps le même album à Spotify, une seule fait l'appel :
+les neuf autres attendent et reçoivent le même résultat (ou la même exception).
+Ça ne fonctionne qu'entre les threads d'un même processus.
+
+FanOut lance les appels à une API externe en arrière-plan (pool borné, date limite)
+pendant que la requête fait son travail local.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class _Call:
+    """Un appel en cours : ceux qui attendent le même résultat se mettent sur l'événement"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Exécute function() une seule fois à la fois par clé"""
+
+    def __init__(self):
+        self._calls = {}  # clé -> _Call en cours
+        self._lock = threading.Lock()
+        self.executed = 0  # Appels réellement faits
+        self.shared = 0  # Appels évités (résultat partagé avec un appel déjà en cours)
+
+    def do(self, key, function):
+        """
+        Appelle function() ou, si un appel avec la même clé est déjà en cours,
+        attend sa fin et retourne son résultat (ou relève son exception).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # On retire l'appel avant de réveiller les autres : le prochain appel repartira à neuf
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {'executed': self.executed, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+class FanOut:
+    """
+    Lance des appels à une API externe en arrière-plan pendant que la requête fait son travail local :
+    la durée totale devient celle de l'appel le plus lent, au lieu de la somme.
+    - les appels "required" (ex : requêtes SQLite locales) tournent dans le thread de la requête :
+      ils ne font jamais la queue derrière un appel externe lent ;
+    - les appels "optional" (API externes) tournent dans un pool borné de `max_workers` threads.
+      Ils ont une date limite : s'ils sont en retard, on continue sans leur résultat (ils finissent
+      en arrière-plan, le résultat est perdu). Si le pool est déjà plein d'appels lents,
+      les nouveaux ne sont même pas lancés (ils ne s'empileraient que pour arriver en retard).
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._in_flight = 0  # Appels optionnels lancés et pas encore terminés
+        self.runs = 0
+        self.late = 0  # Appels optionnels abandonnés car en retard
+        self.skipped = 0  # Appels optionnels pas lancés car le pool était plein
+        self.errors = 0
+
+    def _get_executor(self):
+        # Les threads du pool ne survivent pas à un fork : un pool par processus
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='fan-out')
+                self._pid = os.getpid()
+                self._in_flight = 0
+            return self._executor
+
+    def _submit(self, executor, function):
+        """Lance un appel optionnel, ou retourne None si tous les threads sont déjà occupés"""
+        with self._lock:
+            if self._in_flight >= self.max_workers:
+                self.skipped += 1
+                return None
+            self._in_flight += 1
+        future = executor.submit(function)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def run(self, required=None, optional=None, timeout=1.0, defaults=None):
+        """
+        required / optional : {nom: fonction sans argument}
+        - les appels `optional` sont lancés d'abord, en arrière-plan ;
+        - les appels `required` s'exécutent ensuite dans le thread appelant, l'un après l'autre ;
+        - la date limite (`timeout` secondes après le lancement) vaut pour l'ensemble : un appel
+          optionnel pas terminé à ce moment-là reçoit defaults[nom] (None par défaut).
+        Une exception dans un appel optionnel est affichée et remplacée par sa valeur par défaut ;
+        dans un appel required, elle remonte.
+        Retourne {nom: résultat}.
+        """
+        required = required or {}
+        optional = optional or {}
+        defaults = defaults or {}
+        deadline = time.monotonic() + timeout
+
+        with self._lock:
+            self.runs += 1
+        executor = self._get_executor() if optional else None
+        futures = {name: self._submit(executor, function) for name, function in optional.items()}
+
+        results = {}
+        for name, function in required.items():
+            results[name] = function()
+
+        pending = [future for future in futures.values() if future is not None]
+        wait(pending, timeout=max(0, deadline - time.monotonic()))
+        for name, future in futures.items():
+            if future is None:
+                results[name] = defaults.get(name)
+            elif not future.done():
+                with self._lock:
+                    self.late += 1
+                results[name] = defaults.get(name)
+            elif future.exception() is not None:
+                with self._lock:
+                    self.errors += 1
+                print(f"⚠️  Appel '{name}' en erreur: {future.exception()}")
+                results[name] = defaults.get(name)
+            else:
+                results[name] = future.result()
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {'runs': self.runs, 'late': self.late, 'skipped': self.skipped, 'errors': self.errors,
+                    'in_flight': self._in_flight}
@@ -6,11 +6,321 @@ C'est comme un bibliothécaire qui range et retrouve toutes nos infos (utilisate
 """
 
 # On importe les modules nécessaires
+import copy  # Pour rendre des copies des objets gardés en cache
+import os  # Pour connaître le numéro du processus (utile après un fork)
+import re  # Pour découper les recherches en mots
 import sqlite3  # Pour créer et gérer notre base de données
+import sys  # sys.maxsize : le plus grand id possible (curseur de départ)
+import threading  # Pour protéger le pool quand plusieurs threads l'utilisent en même temps
+import time  # Pour mesurer les temps d'attente du pool
+import weakref  # Pour suivre les pools sans les garder en vie artificiellement
 from datetime import datetime  # Pour gérer les dates et heures
 from models import User, Artist, Album, Rating, Reply, Follow, Tag  # Nos "moules" pour créer des objets
+from cache import LRUCache  # Cache des artistes, albums et utilisateurs déjà lus
+from migrations import (  # Les évolutions successives du schéma
+    USER_STATS_COLUMNS, migrate, rebuild_album_stats, reconcile_user_stats, save_genres, save_tracks, trim_timelines
+)
 
 
+# Réglages appliqués à chaque connexion du pool (exécutés une seule fois, à la création)
+# - WAL : les lectures ne bloquent plus les écritures (et inversement)
+# - synchronous=NORMAL : sûr en mode WAL, et beaucoup moins de fsync
+# - mmap_size / cache_size : on garde plus de pages en mémoire (cache_size négatif = en Kio)
+# - foreign_keys : SQLite ne vérifie les clés étrangères que si on le lui demande
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 268435456),  # 256 Mo
+    ('cache_size', -65536),  # 64 Mo
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'ON'),
+)
+
+# Tous les pools vivants, pour pouvoir les réinitialiser dans un processus enfant après un fork
+_POOLS = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    """Appelée dans le processus enfant juste après un fork (gunicorn, uwsgi...)"""
+    for pool in list(_POOLS):
+        pool._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+class PooledConnection:
+    """
+    Une connexion SQLite "empruntée" au pool.
+    Elle s'utilise exactement comme une connexion sqlite3 normale (cursor, execute, commit...),
+    sauf que close() la rend au pool au lieu de vraiment la fermer.
+    Comme ça, on garde la connexion ouverte et son cache de requêtes préparées.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        # Tout ce qu'on ne définit pas ici est délégué à la vraie connexion
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        # Même comportement que sqlite3 : "with conn:" gère la transaction (commit/rollback)
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """Rend la connexion au pool (on peut appeler close() plusieurs fois sans risque)"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+class ConnectionPool:
+    """
+    Un pool de connexions SQLite réutilisables.
+    Au lieu d'ouvrir et fermer une connexion à chaque requête, on garde quelques connexions
+    ouvertes et on les prête à qui en a besoin. C'est thread-safe, et après un fork
+    (serveurs WSGI multi-processus) l'enfant repart avec un pool vide : il ne réutilise
+    jamais les connexions de son parent.
+    """
+
+    def __init__(self, db_path, max_size=10, timeout=30.0, pragmas=DEFAULT_PRAGMAS):
+        assert isinstance(max_size, int) and max_size > 0, "max_size doit être positif"
+
+        self.db_path = db_path
+        # Une base ':memory:' est différente pour chaque connexion : on n'en garde qu'une
+        self.max_size = 1 if db_path == ':memory:' else max_size
+        self.timeout = timeout  # Temps max d'attente d'une connexion libre (en secondes)
+        self.pragmas = pragmas
+        self._reset()
+        _POOLS.add(self)
+
+    def _reset(self):
+        """(Ré)initialise l'état du pool, sans fermer les connexions héritées d'un autre processus"""
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._idle = []  # Connexions libres (on reprend la dernière rendue : elle est "chaude")
+        self._size = 0  # Nombre de connexions ouvertes (libres + prêtées)
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+
+    def _connect(self):
+        """Ouvre une nouvelle connexion et lui applique les réglages"""
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False,
+                               cached_statements=256)
+        conn.row_factory = sqlite3.Row  # Permet d'accéder aux colonnes par leur nom (plus pratique!)
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        """Emprunte une connexion (en attendant si toutes sont déjà prêtées)"""
+        if self._pid != os.getpid():
+            self._reset()
+
+        with self._cond:
+            self._checkouts += 1
+            if not self._idle and self._size >= self.max_size:
+                # Toutes les connexions sont occupées : on attend qu'une soit rendue
+                self._waits += 1
+                start = time.monotonic()
+                got_one = self._cond.wait_for(
+                    lambda: self._idle or self._size < self.max_size, self.timeout)
+                self._wait_time += time.monotonic() - start
+                if not got_one:
+                    self._timeouts += 1
+                    raise sqlite3.OperationalError("Pool de connexions épuisé")
+
+            if self._idle:
+                return PooledConnection(self, self._idle.pop())
+
+            # On réserve la place avant d'ouvrir la connexion (hors du verrou)
+            self._size += 1
+            self._created += 1
+
+        try:
+            return PooledConnection(self, self._connect())
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        """Récupère une connexion rendue par close()"""
+        if self._pid != os.getpid():
+            return  # Connexion d'un autre processus : on l'oublie
+
+        try:
+            if conn.in_transaction:
+                # Quelqu'un a oublié de faire commit : comme avant, on annule
+                conn.rollback()
+        except sqlite3.Error:
+            # Connexion inutilisable : on la jette et on libère sa place
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def stats(self):
+        """Quelques chiffres pour surveiller le pool"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time_ms': round(self._wait_time * 1000, 2),
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'pid': self._pid,
+            }
+
+
+# SQLite limite le nombre de "?" dans une requête : on découpe les grosses listes d'IDs
+MAX_IDS_PER_QUERY = 500
+
+# Note à partir de laquelle un album noté par un ami est recommandé ("Adoré par vos amis")
+FRIENDS_LIKE_SCORE = 8
+
+# Tris possibles des critiques d'un album : colonnes du tri, toutes décroissantes
+# (l'id en dernier départage les égalités ; "newest" = id décroissant = ordre d'écriture)
+RATING_SORTS = {
+    'newest': ('id',),
+    'highest': ('score', 'id'),
+    'discussed': ('reply_count', 'id'),
+}
+
+# Cache des lignes albums / artists (objets du modèle), propre à chaque processus.
+# Les modifications faites par ce processus l'invalident tout de suite ; celles faites par un autre
+# processus du serveur sont visibles au plus tard après ENTITY_CACHE_TTL secondes.
+# Les utilisateurs ne sont pas mis en cache : ils portent le mot de passe (crypté) vérifié à chaque
+# modification du compte, et un changement de mot de passe ou une suppression doit compter tout de suite
+# dans tous les processus.
+ENTITY_CACHE_SIZE = 5000
+ENTITY_CACHE_TTL = 5 * 60
+
+
+class EntityLoader:
+    """
+    Chargeur "par lots" avec une carte d'identité (identity map), prévu pour durer une requête HTTP.
+    Au lieu de demander les albums un par un (N requêtes SQL), on les demande tous d'un coup
+    avec un seul "WHERE id IN (...)". Et un objet déjà chargé n'est jamais redemandé.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        # Une carte d'identité par type d'entité : {id: objet} (None = n'existe pas)
+        self._albums = {}
+        self._artists = {}
+        self._users = {}
+
+    def _load(self, known, fetch, ids):
+        """Charge en un seul lot les IDs pas encore connus, puis retourne {id: objet}"""
+        wanted = [i for i in dict.fromkeys(ids) if i is not None]  # Sans doublons, ordre conservé
+        missing = [i for i in wanted if i not in known]
+        if missing:
+            found = fetch(missing)
+            for entity_id in missing:
+                known[entity_id] = found.get(entity_id)
+        return {i: known[i] for i in wanted if known[i] is not None}
+
+    def albums(self, album_ids):
+        """Retourne {album_id: Album} pour tous les IDs demandés"""
+        return self._load(self._albums, self.db.get_albums_by_ids, album_ids)
+
+    def artists(self, artist_ids):
+        """Retourne {artist_id: Artist} pour tous les IDs demandés"""
+        return self._load(self._artists, self.db.get_artists_by_ids, artist_ids)
+
+    def users(self, user_ids):
+        """Retourne {user_id: User} pour tous les IDs demandés"""
+        return self._load(self._users, self.db.get_users_by_ids, user_ids)
+
+    def album(self, album_id):
+        return self.albums([album_id]).get(album_id)
+
+    def artist(self, artist_id):
+        return self.artists([artist_id]).get(artist_id)
+
+    def user(self, user_id):
+        return self.users([user_id]).get(user_id)
+
+    def prime(self, entity):
+        """Ajoute un objet déjà chargé à la carte d'identité (pour ne pas le recharger)"""
+        if isinstance(entity, Album):
+            self._albums[entity.id] = entity
+        elif isinstance(entity, Artist):
+            self._artists[entity.id] = entity
+        elif isinstance(entity, User):
+            self._users[entity.id] = entity
+        return entity
+
+
+class ViewCounter:
+    """
+    Compte les vues des pages d'albums et d'artistes en mémoire, et les écrit en base par paquets
+    (une requête groupée toutes les `flush_interval` secondes) au lieu d'un UPDATE à chaque page vue.
+    Les vues pas encore écrites sont perdues si le processus s'arrête brutalement : ce n'est qu'un indicateur.
+    """
+
+    def __init__(self, db, flush_interval=30, max_pending=1000):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}  # (table, id) -> nombre de vues pas encore écrites
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.flushes = 0
+
+    def record(self, table, row_id):
+        """Compte une vue de la ligne row_id de `table` ('albums' ou 'artists')"""
+        assert table in ('albums', 'artists'), "Table invalide"
+        with self._lock:
+            key = (table, row_id)
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self.recorded += 1
+            due = (len(self._pending) >= self.max_pending
+                   or time.monotonic() - self._flushed_at >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Écrit en base les vues en attente (une requête groupée par table)"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        for table in ('albums', 'artists'):
+            counts = {row_id: views for (name, row_id), views in pending.items() if name == table}
+            if counts:
+                self.db.add_view_counts(table, counts)
+        with self._lock:
+            self.flushes += 1
+
+    def stats(self):
+        with self._lock:
+            return {'recorded': self.recorded, 'pending': len(self._pending), 'flushes': self.flushes}
+
 
 class Database:
     """
@@ -18,24 +328,134 @@ class Database:
     Elle contient toutes les fonctions pour créer, lire, modifier et supprimer des données.
     """
     
-    def __init__(self, db_path='music_rating.db'):
+    def __init__(self, db_path='music_rating.db', pool_size=10):
         """
         Cette fonction s'exécute automatiquement quand on crée un objet Database.
         db_path : le chemin vers notre fichier de base de données (par défaut: music_rating.db)
+        pool_size : nombre maximum de connexions ouvertes en même temps
         """
         # On vérifie que le chemin est bien une chaîne de caractères non vide
         assert isinstance(db_path, str) and len(db_path) > 0, "DB path doit être une chaîne non vide"
         self.db_path = db_path  # On sauvegarde le chemin
+        self.pool = ConnectionPool(db_path, max_size=pool_size)  # Nos connexions réutilisables
+        # Clés : (table, id). On n'y met que des lignes trouvées (un id absent n'est pas mémorisé)
+        self.entity_cache = LRUCache(ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL)
         self.init_database()  # On crée les tables si elles n'existent pas encore
     
     def get_connection(self):
         """
-        Crée une connexion à la base de données.
+        Emprunte une connexion à la base de données.
         C'est comme ouvrir le livre avant de le lire ou d'écrire dedans.
+        conn.close() rend la connexion au pool : elle reste ouverte pour la prochaine fois.
         """
-        conn = sqlite3.connect(self.db_path)  # On se connecte au fichier SQLite
-        conn.row_factory = sqlite3.Row  # Permet d'accéder aux colonnes par leur nom (plus pratique!)
-        return conn
+        return self.pool.acquire()
+    
+    def get_pool_stats(self):
+        """Retourne les statistiques du pool de connexions (emprunts, attentes, taille...)"""
+        return self.pool.stats()
+    
+    def loader(self):
+        """Crée un chargeur par lots (à garder le temps d'une requête HTTP)"""
+        return EntityLoader(self)
+    
+    # ========== CONVERSION LIGNE SQL → OBJET ==========
+    
+    @staticmethod
+    def _user_from_row(row):
+        """Transforme une ligne de la table users en objet User"""
+        keys = row.keys()
+        # Les vieilles bases n'ont pas forcément ces colonnes
+        profile_image = row['profile_image'] if 'profile_image' in keys else None
+        bio = row['bio'] if 'bio' in keys else None
+        return User(row['id'], row['username'], row['email'],
+                    row['password_hash'], row['created_at'],
+                    profile_image, bio)
+    
+    @staticmethod
+    def _artist_from_row(row):
+        """Transforme une ligne de la table artists en objet Artist"""
+        genres = row['genres'].split(',') if row['genres'] else []
+        return Artist(row['id'], row['name'], row['spotify_id'],
+                      row['image_url'], genres)
+    
+    @staticmethod
+    def _album_from_row(row):
+        """Transforme une ligne de la table albums en objet Album"""
+        genres = row['genres'].split(',') if row['genres'] else []
+        return Album(row['id'], row['title'], row['artist_id'],
+                     row['release_date'], row['spotify_id'],
+                     row['image_url'], genres)
+    
+    def _fetch_rows_by_ids(self, table, ids):
+        """
+        Récupère les lignes d'une table pour une liste d'IDs, avec UNE requête par paquet
+        de MAX_IDS_PER_QUERY IDs (au lieu d'une requête par ID).
+        """
+        ids = list(dict.fromkeys(ids))  # On enlève les doublons
+        rows = []
+        if not ids:
+            return rows
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), MAX_IDS_PER_QUERY):
+                chunk = ids[start:start + MAX_IDS_PER_QUERY]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'SELECT * FROM {table} WHERE id IN ({placeholders})', chunk)
+                rows.extend(cursor.fetchall())
+        finally:
+            conn.close()
+        return rows
+    
+    def _get_cached_by_ids(self, table, ids, from_row):
+        """
+        Lecture "read-through" : les objets déjà en cache sont rendus sans requête,
+        les autres sont lus en base en un seul lot puis gardés en cache. Retourne {id: objet}
+        """
+        found = {}
+        missing = []
+        for entity_id in dict.fromkeys(ids):
+            entity = self.entity_cache.get((table, entity_id))
+            if entity is not None:
+                found[entity_id] = self._copy_entity(entity)
+            else:
+                missing.append(entity_id)
+        
+        for row in self._fetch_rows_by_ids(table, missing):
+            entity = from_row(row)
+            self.entity_cache.set((table, row['id']), entity)
+            found[row['id']] = self._copy_entity(entity)
+        return found
+    
+    @staticmethod
+    def _copy_entity(entity):
+        """L'appelant reçoit une copie : il peut la modifier (ex : album.artist = ...) sans toucher au cache"""
+        clone = copy.copy(entity)
+        if isinstance(getattr(entity, 'genres', None), list):
+            clone.genres = list(entity.genres)
+        return clone
+    
+    def invalidate_entities(self, table, ids):
+        """À appeler après avoir modifié ou supprimé des lignes de albums ou artists"""
+        assert table in ('albums', 'artists'), "Table invalide"
+        self.entity_cache.invalidate_many((table, entity_id) for entity_id in ids)
+    
+    def get_entity_cache_stats(self):
+        """Statistiques du cache des entités (pour /metrics)"""
+        return self.entity_cache.stats()
+    
+    def get_users_by_ids(self, user_ids):
+        """Récupère plusieurs utilisateurs d'un coup (toujours lus en base). Retourne {user_id: User}"""
+        return {row['id']: self._user_from_row(row) for row in self._fetch_rows_by_ids('users', user_ids)}
+    
+    def get_artists_by_ids(self, artist_ids):
+        """Récupère plusieurs artistes d'un coup. Retourne {artist_id: Artist}"""
+        return self._get_cached_by_ids('artists', artist_ids, self._artist_from_row)
+    
+    def get_albums_by_ids(self, album_ids):
+        """Récupère plusieurs albums d'un coup. Retourne {album_id: Album}"""
+        return self._get_cached_by_ids('albums', album_ids, self._album_from_row)
     
     def delete_rating(self, rating_id, user_id):
         """
@@ -45,20 +465,21 @@ class Database:
         Retourne True si la suppression a réussi, False sinon
         """
         conn = self.get_connection()  # On ouvre la connexion
-        cursor = conn.cursor()  # Le curseur permet d'exécuter des commandes SQL
-        
-        # On cherche la note avec cet ID ET cet utilisateur
-        cursor.execute('SELECT * FROM ratings WHERE id = ? AND user_id = ?', (rating_id, user_id))
-        rating = cursor.fetchone()  # On récupère le résultat
-        
-        if rating:  # Si on a trouvé la note (= l'utilisateur est bien l'auteur)
-            cursor.execute('DELETE FROM ratings WHERE id = ?', (rating_id,))
-            conn.commit()  # On valide les changements
-            conn.close()  # On ferme la connexion
-            return True
-        
-        conn.close()
-        return False  # La note n'existe pas ou l'utilisateur n'est pas l'auteur
+        try:
+            cursor = conn.cursor()  # Le curseur permet d'exécuter des commandes SQL
+            
+            # On cherche la note avec cet ID ET cet utilisateur
+            cursor.execute('SELECT * FROM ratings WHERE id = ? AND user_id = ?', (rating_id, user_id))
+            rating = cursor.fetchone()  # On récupère le résultat
+            
+            if rating:  # Si on a trouvé la note (= l'utilisateur est bien l'auteur)
+                cursor.execute('DELETE FROM ratings WHERE id = ?', (rating_id,))
+                conn.commit()  # On valide les changements
+                return True
+            
+            return False  # La note n'existe pas ou l'utilisateur n'est pas l'auteur
+        finally:
+            conn.close()  # On ferme la connexion (même en cas d'erreur)
 
     def delete_tag(self, tag_id, user_id):
         """
@@ -66,155 +487,34 @@ class Database:
         Fonctionne exactement comme delete_rating mais pour les tags.
         """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # On vérifie que le tag appartient bien à l'utilisateur
-        cursor.execute('SELECT * FROM tags WHERE id = ? AND user_id = ?', (tag_id, user_id))
-        tag = cursor.fetchone()
-        
-        if tag:
-            cursor.execute('DELETE FROM tags WHERE id = ?', (tag_id,))
-            conn.commit()
+        try:
+            cursor = conn.cursor()
+            
+            # On vérifie que le tag appartient bien à l'utilisateur
+            cursor.execute('SELECT * FROM tags WHERE id = ? AND user_id = ?', (tag_id, user_id))
+            tag = cursor.fetchone()
+            
+            if tag:
+                cursor.execute('DELETE FROM tags WHERE id = ?', (tag_id,))
+                conn.commit()
+                return True
+            
+            return False
+        finally:
             conn.close()
-            return True
-        
-        conn.close()
-        return False
     
     
     
     def init_database(self):
         """
-        Cette fonction crée toutes les tables de notre base de données si elles n'existent pas.
-        C'est comme créer les différentes sections d'un classeur.
+        Met le schéma de la base à jour (voir migrations.py).
+        Si la base est déjà à la dernière version, ça se résume à lire PRAGMA user_version.
         """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # ===== TABLE DES UTILISATEURS =====
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,  -- ID unique qui s'incrémente automatiquement
-                username TEXT UNIQUE NOT NULL,  -- Nom d'utilisateur (doit être unique)
-                email TEXT UNIQUE NOT NULL,  -- Email (doit être unique)
-                password_hash TEXT NOT NULL,  -- Mot de passe crypté (jamais en clair!)
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Date de création du compte
-                profile_image TEXT,  -- URL de l'image de profil (peut être vide)
-                bio TEXT,  -- Biographie de l'utilisateur
-                casino_tokens INTEGER DEFAULT 1000  -- Jetons de casino (système de points)
-            )
-        ''')
-        
-        # On vérifie si la colonne casino_tokens existe déjà, sinon on l'ajoute
-        # (utile pour les anciennes bases de données)
-        cursor.execute("PRAGMA table_info(users)")  # PRAGMA = commande spéciale SQLite
-        columns = [column[1] for column in cursor.fetchall()]  # On récupère les noms de colonnes
-        if 'casino_tokens' not in columns:  # Si la colonne n'existe pas
-            cursor.execute('ALTER TABLE users ADD COLUMN casino_tokens INTEGER DEFAULT 1000')
-        
-        # ===== TABLE DES ARTISTES =====
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS artists (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,  -- Nom de l'artiste
-                spotify_id TEXT UNIQUE,  -- ID Spotify (pour synchroniser avec Spotify)
-                image_url TEXT,  -- Photo de l'artiste
-                genres TEXT  -- Les genres musicaux (stockés comme texte séparé par des virgules)
-            )
-        ''')
-        
-        # ===== TABLE DES ALBUMS =====
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS albums (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,  -- Titre de l'album
-                artist_id INTEGER NOT NULL,  -- Lien vers l'artiste (clé étrangère)
-                release_date TEXT,  -- Date de sortie
-                spotify_id TEXT UNIQUE,
-                image_url TEXT,  -- Pochette de l'album
-                genres TEXT,
-                FOREIGN KEY (artist_id) REFERENCES artists (id)  -- Lie cet album à un artiste
-            )
-        ''')
-        
-        # ===== TABLE DES NOTES =====
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ratings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,  -- Qui a mis cette note?
-                album_id INTEGER NOT NULL,  -- Sur quel album?
-                score REAL NOT NULL,  -- La note (nombre décimal entre 0 et 10)
-                review TEXT,  -- La critique écrite (optionnelle)
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (album_id) REFERENCES albums (id),
-                UNIQUE(user_id, album_id)  -- Un utilisateur ne peut noter qu'une fois le même album
-            )
-        ''')
-        
-        # ===== TABLE DES RÉPONSES AUX CRITIQUES =====
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS replies (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                rating_id INTEGER NOT NULL,  -- À quelle critique cette réponse répond?
-                user_id INTEGER NOT NULL,  -- Qui a écrit cette réponse?
-                content TEXT NOT NULL,  -- Le contenu de la réponse
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (rating_id) REFERENCES ratings (id) ON DELETE CASCADE,  -- Si on supprime la critique, on supprime aussi les réponses
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # ===== TABLE DES SUIVIS (qui suit qui?) =====
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS follows (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                follower_id INTEGER NOT NULL,  -- Qui suit?
-                following_id INTEGER NOT NULL,  -- Qui est suivi?
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (follower_id) REFERENCES users (id),
-                FOREIGN KEY (following_id) REFERENCES users (id),
-                UNIQUE(follower_id, following_id)  -- On ne peut pas suivre 2 fois la même personne
-            )
-        ''')
-        
-        # ===== TABLE DES TAGS =====
-        # Les tags sont des mots-clés qu'on peut ajouter aux artistes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tags (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                artist_id INTEGER NOT NULL,  -- Sur quel artiste?
-                tag_name TEXT NOT NULL,  -- Le nom du tag (ex: "rock", "années 80")
-                user_id INTEGER NOT NULL,  -- Qui a ajouté ce tag?
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (artist_id) REFERENCES artists (id),
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # ===== TABLE DES ALBUMS FAVORIS =====
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS favorite_albums (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                album_id INTEGER NOT NULL,
-                position INTEGER NOT NULL,  -- Position dans le top (1er, 2ème, etc.)
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (album_id) REFERENCES albums (id),
-                UNIQUE(user_id, album_id)
-            )
-        ''')
-        
-        # ===== INDEX POUR AMÉLIORER LES PERFORMANCES =====
-        # Un index, c'est comme un sommaire : ça permet de trouver plus vite les infos
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_replies_rating_id 
-            ON replies(rating_id)
-        ''')
-        
-        conn.commit()  # On valide toutes les créations de tables
-        conn.close()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
     
     # ========== FONCTIONS POUR LES UTILISATEURS ==========
     
@@ -240,12 +540,12 @@ class Database:
             )
             conn.commit()
             user_id = cursor.lastrowid  # lastrowid = dernier ID créé
-            conn.close()
             return user_id
         except sqlite3.IntegrityError:
             # Erreur = le nom ou l'email existe déjà (UNIQUE constraint)
-            conn.close()
             return None
+        finally:
+            conn.close()
     
     def get_user_by_username(self, username):
         """
@@ -255,10 +555,12 @@ class Database:
         assert isinstance(username, str), "Username doit être une chaîne"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        row = cursor.fetchone()  # fetchone() = récupère UNE ligne
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
+            row = cursor.fetchone()  # fetchone() = récupère UNE ligne
+        finally:
+            conn.close()
         
         if row:  # Si on a trouvé quelque chose
             # On essaie de récupérer les nouvelles colonnes (peuvent ne pas exister dans vieilles BDD)
@@ -282,24 +584,86 @@ class Database:
         """
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
+        # Toujours lu en base (pas de cache) : le mot de passe vérifié est celui d'aujourd'hui
+        return self.get_users_by_ids([user_id]).get(user_id)
+    
+    def update_user_bio(self, user_id, bio):
+        """Change la bio d'un utilisateur"""
+        self._update_user(user_id, 'bio', bio)
+    
+    def update_user_profile_image(self, user_id, profile_image):
+        """Change la photo de profil (chemin ou URL ; None pour la supprimer)"""
+        self._update_user(user_id, 'profile_image', profile_image)
+    
+    def update_username(self, user_id, username):
+        """Change le nom d'utilisateur"""
+        assert isinstance(username, str) and len(username) > 0, "Username invalide"
+        self._update_user(user_id, 'username', username)
+    
+    def update_user_email(self, user_id, email):
+        """Change l'adresse email"""
+        assert isinstance(email, str) and '@' in email, "Email invalide"
+        self._update_user(user_id, 'email', email)
+    
+    def update_user_password(self, user_id, password_hash):
+        """Change le mot de passe (password_hash : déjà crypté avec User.hash_password)"""
+        self._update_user(user_id, 'password_hash', password_hash)
+    
+    def get_user_stats(self, user_id):
+        """
+        Les compteurs d'un utilisateur (tenus à jour par des triggers) : une seule ligne lue.
+        Retourne {'ratings_count', 'followers_count', 'following_count', 'replies_count'}
+        """
+        assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
+        
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+        try:
+            row = conn.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,)).fetchone()
+        finally:
+            conn.close()
+        # Pas de ligne = aucune activité pour l'instant
+        return {column: row[column] if row else 0 for column in USER_STATS_COLUMNS}
+    
+    def get_recommendations_version(self, user_id):
+        """
+        Numéro qui change à chaque fois que les recommandations de l'utilisateur peuvent changer
+        (tenu à jour par des triggers, voir migration 014) ; 0 s'il n'a encore rien fait.
+        """
+        assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
-        if row:
-            try:
-                profile_image = row['profile_image']
-                bio = row['bio']
-            except (KeyError, IndexError):
-                profile_image = None
-                bio = None
-            
-            return User(row['id'], row['username'], row['email'], 
-                    row['password_hash'], row['created_at'],
-                    profile_image, bio)
-        return None
+        conn = self.get_connection()
+        try:
+            row = conn.execute('SELECT recommendations_version FROM user_stats WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        finally:
+            conn.close()
+        return row['recommendations_version'] if row else 0
+    
+    def reconcile_user_stats(self):
+        """
+        Vérifie les compteurs de tous les utilisateurs (en une transaction) et corrige les faux.
+        Retourne le nombre de lignes corrigées (normalement 0).
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            fixed = reconcile_user_stats(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+        return fixed
+    
+    def _update_user(self, user_id, column, value):
+        """Modifie une colonne d'un utilisateur"""
+        assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
+        assert column in ('bio', 'profile_image', 'username', 'email', 'password_hash'), "Colonne invalide"
+        
+        conn = self.get_connection()
+        try:
+            conn.execute(f'UPDATE users SET {column} = ? WHERE id = ?', (value, user_id))
+            conn.commit()
+        finally:
+            conn.close()
     
     # ========== FONCTIONS POUR LES ARTISTES ==========
     
@@ -320,40 +684,33 @@ class Database:
                 'INSERT INTO artists (name, spotify_id, image_url, genres) VALUES (?, ?, ?, ?)',
                 (name, spotify_id, image_url, genres_str)
             )
-            conn.commit()
             artist_id = cursor.lastrowid
-            conn.close()
+            # Les genres vont aussi dans les tables de liaison (même transaction)
+            save_genres(cursor, 'artist_genres', 'artist_id', artist_id, genres)
+            conn.commit()
             return artist_id
         except sqlite3.IntegrityError:
-            conn.close()
             return None
+        finally:
+            conn.close()
     
     def get_artist_by_id(self, artist_id):
         """Récupère un artiste par son ID"""
         assert isinstance(artist_id, int) and artist_id > 0, "Artist ID invalide"
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM artists WHERE id = ?', (artist_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            # On retransforme le texte en liste: "rock,pop" → ["rock", "pop"]
-            genres = row['genres'].split(',') if row['genres'] else []
-            return Artist(row['id'], row['name'], row['spotify_id'], 
-                         row['image_url'], genres)
-        return None
+        return self.get_artists_by_ids([artist_id]).get(artist_id)
     
     def get_artist_by_spotify_id(self, spotify_id):
         """Récupère un artiste par son ID Spotify (utile pour synchroniser avec l'API Spotify)"""
         assert isinstance(spotify_id, str), "Spotify ID doit être une chaîne"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM artists WHERE spotify_id = ?', (spotify_id,))
-        row = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM artists WHERE spotify_id = ?', (spotify_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
         
         if row:
             genres = row['genres'].split(',') if row['genres'] else []
@@ -361,34 +718,98 @@ class Database:
                          row['image_url'], genres)
         return None
     
-    def search_artists(self, query):
+    def search_artists(self, query, limit=20):
         """
-        Cherche des artistes dont le nom contient 'query'.
+        Cherche des artistes par nom, genre ou tag (première page de résultats).
         Exemple: query="Beat" va trouver "The Beatles"
-        LIKE '%query%' = contient 'query' n'importe où dans le nom
+        """
+        artists, _ = self.search_artists_page(query, limit)
+        return artists
+    
+    def search_artists_page(self, query, limit=20, cursor=None):
+        """
+        Comme search_artists, mais page par page.
+        Retourne (artistes, curseur de la page suivante ou None s'il n'y en a plus)
+        """
+        # Poids BM25 des colonnes : le nom compte beaucoup plus que les genres ou les tags
+        rows, next_cursor = self._search_page('artists_fts', '10.0, 1.0, 2.0', 'artists',
+                                              query, limit, cursor)
+        return [self._artist_from_row(row) for row in rows], next_cursor
+    
+    # ========== RECHERCHE PLEIN TEXTE ==========
+    
+    @staticmethod
+    def _fts_match_query(query):
+        """
+        Transforme ce que tape l'utilisateur en requête FTS5 sans danger.
+        Chaque mot devient un préfixe entre guillemets : "daft pun" → "daft"* "pun"*
+        (les guillemets empêchent d'utiliser la syntaxe FTS5 : AND, OR, NEAR, colonnes...)
+        """
+        words = re.findall(r'\w+', query)
+        return ' '.join(f'"{word}"*' for word in words)
+    
+    def _search_page(self, fts_table, weights, table, query, limit, cursor):
+        """
+        Cherche `query` dans l'index FTS5 `fts_table` et retourne les lignes de `table`,
+        classées par pertinence (BM25 : plus le score est petit, plus c'est pertinent).
+        La pagination se fait par curseur "score:id" (on reprend juste après le dernier
+        résultat affiché) plutôt qu'avec OFFSET.
         """
         assert isinstance(query, str), "Query doit être une chaîne"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
+        
+        match = self._fts_match_query(query)
+        if not match:
+            return [], None
+        
+        params = [match]
+        after = ''
+        position = self._decode_search_cursor(cursor)
+        if position:
+            after = 'WHERE hits.rank > ? OR (hits.rank = ? AND hits.id > ?)'
+            params += [position[0], position[0], position[1]]
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM artists WHERE name LIKE ? LIMIT 20', 
-                      (f'%{query}%',))  # % = joker (n'importe quels caractères)
-        rows = cursor.fetchall()  # fetchall() = récupère TOUTES les lignes
-        conn.close()
+        try:
+            db_cursor = conn.cursor()
+            db_cursor.execute(f'''
+                SELECT {table}.*, hits.rank AS search_rank
+                FROM (
+                    SELECT rowid AS id, bm25({fts_table}, {weights}) AS rank
+                    FROM {fts_table}
+                    WHERE {fts_table} MATCH ?
+                ) AS hits
+                JOIN {table} ON {table}.id = hits.id
+                {after}
+                ORDER BY hits.rank, hits.id
+                LIMIT ?
+            ''', (*params, limit + 1))  # Une ligne de plus pour savoir s'il reste une page
+            rows = db_cursor.fetchall()
+        finally:
+            conn.close()
         
-        # On transforme chaque ligne en objet Artist
-        artists = []
-        for row in rows:
-            genres = row['genres'].split(',') if row['genres'] else []
-            artists.append(Artist(row['id'], row['name'], row['spotify_id'], 
-                                 row['image_url'], genres))
-        return artists
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['search_rank']!r}:{rows[-1]['id']}"
+        return rows, next_cursor
+    
+    @staticmethod
+    def _decode_search_cursor(cursor):
+        """Décode un curseur "score:id" ; retourne None s'il est absent ou invalide"""
+        if not cursor:
+            return None
+        try:
+            rank, last_id = cursor.rsplit(':', 1)
+            return float(rank), int(last_id)
+        except ValueError:
+            return None
     
     # ========== FONCTIONS POUR LES ALBUMS ==========
     
     def create_album(self, title, artist_id, release_date=None, 
-                    spotify_id=None, image_url=None, genres=None):
-        """Crée un nouvel album"""
+                    spotify_id=None, image_url=None, genres=None, tracks=None):
+        """Crée un nouvel album (tracks : liste des pistes venant de Spotify, optionnelle)"""
         assert isinstance(title, str) and len(title) > 0, "Title invalide"
         assert isinstance(artist_id, int) and artist_id > 0, "Artist ID invalide"
         
@@ -402,40 +823,240 @@ class Database:
                    VALUES (?, ?, ?, ?, ?, ?)''',
                 (title, artist_id, release_date, spotify_id, image_url, genres_str)
             )
-            conn.commit()
             album_id = cursor.lastrowid
-            conn.close()
+            save_genres(cursor, 'album_genres', 'album_id', album_id, genres)
+            if tracks:
+                save_tracks(cursor, album_id, tracks)
+            conn.commit()
             return album_id
         except sqlite3.IntegrityError:
-            conn.close()
             return None
+        finally:
+            conn.close()
     
-    def get_album_by_id(self, album_id):
-        """Récupère un album par son ID"""
-        assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
+    def get_existing_album_spotify_ids(self, spotify_ids):
+        """Parmi ces IDs Spotify, lesquels sont déjà dans la base (une requête par paquet de 500)"""
+        return set(self._ids_by_spotify_ids('albums', spotify_ids))
+    
+    def get_artist_ids_by_spotify_ids(self, spotify_ids):
+        """Les artistes déjà dans la base parmi ces IDs Spotify. Retourne {spotify_id: artist_id}"""
+        return self._ids_by_spotify_ids('artists', spotify_ids)
+    
+    def _ids_by_spotify_ids(self, table, spotify_ids):
+        """{spotify_id: id} des lignes de `table` qui ont ces IDs Spotify (une requête par paquet de 500)"""
+        assert table in ('albums', 'artists'), "Table invalide"
+        spotify_ids = list(dict.fromkeys(spotify_ids))
+        ids = {}
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(spotify_ids), MAX_IDS_PER_QUERY):
+                chunk = spotify_ids[start:start + MAX_IDS_PER_QUERY]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'SELECT id, spotify_id FROM {table} WHERE spotify_id IN ({placeholders})', chunk)
+                ids.update((row['spotify_id'], row['id']) for row in cursor.fetchall())
+        finally:
+            conn.close()
+        return ids
+    
+    def bulk_create_artists(self, artists):
+        """
+        Crée plusieurs artistes en une seule transaction, avec leurs genres.
+        Les artistes dont le spotify_id existe déjà sont ignorés.
+        artists : liste de dictionnaires au format de SpotifyAPI.get_artist_details
+        Retourne {spotify_id: artist_id} des artistes réellement créés.
+        """
+        if not artists:
+            return {}
         
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM albums WHERE id = ?', (album_id,))
-        row = cursor.fetchone()
-        conn.close()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Même principe que bulk_create_albums : les artistes créés maintenant auront un id > last_id
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM artists')
+            last_id = cursor.fetchone()[0]
+            cursor.executemany(
+                'INSERT OR IGNORE INTO artists (name, spotify_id, image_url, genres) VALUES (?, ?, ?, ?)',
+                [(artist['name'], artist['id'], artist.get('image_url'),
+                  ','.join(artist['genres']) if artist.get('genres') else None) for artist in artists]
+            )
+            
+            by_spotify_id = {artist['id']: artist for artist in artists}
+            spotify_ids = list(by_spotify_id)
+            created = {}
+            for start in range(0, len(spotify_ids), MAX_IDS_PER_QUERY):
+                chunk = spotify_ids[start:start + MAX_IDS_PER_QUERY]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT id, spotify_id FROM artists
+                    WHERE spotify_id IN ({placeholders}) AND id > ?
+                ''', (*chunk, last_id))
+                created.update((row['spotify_id'], row['id']) for row in cursor.fetchall())
+            
+            for spotify_id, artist_id in created.items():
+                save_genres(cursor, 'artist_genres', 'artist_id', artist_id, by_spotify_id[spotify_id].get('genres'))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return created
+    
+    def bulk_create_albums(self, artist_id, albums):
+        """
+        Crée plusieurs albums en une seule transaction (executemany),
+        avec leurs genres et leurs pistes. Les albums dont le spotify_id existe déjà sont ignorés.
+        artist_id : l'ID de l'artiste de tous les albums, ou, pour des albums de plusieurs artistes,
+                    un dictionnaire {spotify_id de l'artiste: artist_id} (on regarde album['artist_id'])
+        albums : liste de dictionnaires au format de SpotifyAPI.get_album_details
+        Retourne {spotify_id: album_id} des albums réellement créés.
+        """
+        if isinstance(artist_id, dict):
+            artist_ids = artist_id
+            assert all(album['artist_id'] in artist_ids for album in albums), "Artiste inconnu"
+        else:
+            assert isinstance(artist_id, int) and artist_id > 0, "Artist ID invalide"
+            artist_ids = {album['artist_id']: artist_id for album in albums}
+        if not albums:
+            return {}
         
-        if row:
-            genres = row['genres'].split(',') if row['genres'] else []
-            return Album(row['id'], row['title'], row['artist_id'], 
-                        row['release_date'], row['spotify_id'], 
-                        row['image_url'], genres)
-        return None
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Le verrou d'écriture est pris : les albums créés maintenant auront un id > last_id
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM albums')
+            last_id = cursor.fetchone()[0]
+            cursor.executemany(
+                '''INSERT OR IGNORE INTO albums (title, artist_id, release_date, spotify_id, image_url, genres)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                [(album['name'], artist_ids[album['artist_id']], album['release_date'], album['id'], album['image_url'],
+                  ','.join(album['genres']) if album.get('genres') else None) for album in albums]
+            )
+            
+            # On relit les ids attribués (dans la même transaction)
+            created = {}
+            by_spotify_id = {album['id']: album for album in albums}
+            spotify_ids = list(by_spotify_id)
+            for start in range(0, len(spotify_ids), MAX_IDS_PER_QUERY):
+                chunk = spotify_ids[start:start + MAX_IDS_PER_QUERY]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT id, spotify_id FROM albums
+                    WHERE spotify_id IN ({placeholders}) AND id > ?
+                ''', (*chunk, last_id))
+                created.update((row['spotify_id'], row['id']) for row in cursor.fetchall())
+            
+            for spotify_id, album_id in created.items():
+                album = by_spotify_id[spotify_id]
+                save_genres(cursor, 'album_genres', 'album_id', album_id, album.get('genres'))
+            cursor.executemany(
+                '''INSERT OR IGNORE INTO tracks (album_id, disc_number, track_number, name, duration_ms, spotify_id)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                [(album_id, track.get('disc_number', 1), track['track_number'], track['name'],
+                  track['duration_ms'], track.get('spotify_id'))
+                 for spotify_id, album_id in created.items()
+                 for track in by_spotify_id[spotify_id].get('tracks', [])]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return created
+    
+    def save_album_tracks(self, album_id, tracks):
+        """Remplace les pistes d'un album (la durée totale est recalculée par les triggers)"""
+        assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
+        
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            save_tracks(conn.cursor(), album_id, tracks)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_album_tracks(self, album_id):
+        """Pistes d'un album, dans l'ordre (CD puis numéro), avec la durée formatée"""
+        assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT name, duration_ms, track_number, disc_number FROM tracks
+                WHERE album_id = ?
+                ORDER BY disc_number, track_number
+            ''', (album_id,))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        
+        return [{
+            'name': row['name'],
+            'duration_ms': row['duration_ms'],
+            'track_number': row['track_number'],
+            'disc_number': row['disc_number'],
+            'duration_formatted': self._format_duration(row['duration_ms'])
+        } for row in rows]
+    
+    def get_album_duration(self, album_id):
+        """Durée totale (ms) et nombre de pistes d'un album, précalculés ; (0, 0) si pistes inconnues"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT total_duration_ms, track_count FROM albums WHERE id = ?', (album_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return 0, 0
+        return row['total_duration_ms'] or 0, row['track_count'] or 0
+    
+    def get_albums_without_tracks(self, limit=None):
+        """Albums Spotify dont les pistes n'ont jamais été importées : [(album_id, spotify_id)]"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, spotify_id FROM albums
+                WHERE track_count IS NULL AND spotify_id IS NOT NULL
+                ORDER BY id
+                LIMIT ?
+            ''', (limit if limit else -1,))
+            albums = [(row['id'], row['spotify_id']) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        return albums
+    
+    @staticmethod
+    def _format_duration(duration_ms):
+        """Formate la durée en minutes:secondes"""
+        seconds = duration_ms // 1000
+        return f"{seconds // 60}:{seconds % 60:02d}"
+    
+    def get_album_by_id(self, album_id):
+        """Récupère un album par son ID"""
+        assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
+        
+        return self.get_albums_by_ids([album_id]).get(album_id)
     
     def get_album_by_spotify_id(self, spotify_id):
         """Récupère un album par son ID Spotify"""
         assert isinstance(spotify_id, str), "Spotify ID doit être une chaîne"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM albums WHERE spotify_id = ?', (spotify_id,))
-        row = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM albums WHERE spotify_id = ?', (spotify_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
         
         if row:
             genres = row['genres'].split(',') if row['genres'] else []
@@ -449,10 +1070,12 @@ class Database:
         assert isinstance(artist_id, int) and artist_id > 0, "Artist ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM albums WHERE artist_id = ?', (artist_id,))
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM albums WHERE artist_id = ?', (artist_id,))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
         albums = []
         for row in rows:
@@ -462,31 +1085,29 @@ class Database:
                                row['image_url'], genres))
         return albums
     
-    def search_albums(self, query):
-        """Cherche des albums dont le titre contient 'query'"""
-        assert isinstance(query, str), "Query doit être une chaîne"
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM albums WHERE title LIKE ? LIMIT 20', 
-                      (f'%{query}%',))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        albums = []
-        for row in rows:
-            genres = row['genres'].split(',') if row['genres'] else []
-            albums.append(Album(row['id'], row['title'], row['artist_id'], 
-                               row['release_date'], row['spotify_id'], 
-                               row['image_url'], genres))
+    def search_albums(self, query, limit=20):
+        """Cherche des albums par titre, artiste, genre ou tag (première page de résultats)"""
+        albums, _ = self.search_albums_page(query, limit)
         return albums
     
+    def search_albums_page(self, query, limit=20, cursor=None):
+        """
+        Comme search_albums, mais page par page.
+        Retourne (albums, curseur de la page suivante ou None s'il n'y en a plus)
+        """
+        # Poids BM25 : titre, nom de l'artiste, genres, tags
+        rows, next_cursor = self._search_page('albums_fts', '10.0, 4.0, 1.0, 2.0', 'albums',
+                                              query, limit, cursor)
+        return [self._album_from_row(row) for row in rows], next_cursor
+    
     # ========== FONCTIONS POUR LES NOTES ==========
     
     def create_rating(self, user_id, album_id, score, review=None):
         """
         Crée une nouvelle note pour un album.
         Si l'utilisateur a déjà noté cet album, la note sera mise à jour.
+        Retourne l'ID de la nouvelle note, True pour une mise à jour,
+        ou None si l'album (ou l'utilisateur) n'existe pas.
         """
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
@@ -504,9 +1125,11 @@ class Database:
             )
             conn.commit()
             rating_id = cursor.lastrowid
-            conn.close()
             return rating_id
-        except sqlite3.IntegrityError:
+        except sqlite3.IntegrityError as e:
+            if 'UNIQUE' not in str(e):
+                # Clé étrangère : l'album (ou l'utilisateur) n'existe pas
+                return None
             # Si la note existe déjà (UNIQUE constraint), on la met à jour
             cursor.execute(
                 '''UPDATE ratings SET score = ?, review = ? 
@@ -514,18 +1137,21 @@ class Database:
                 (score, review, user_id, album_id)
             )
             conn.commit()
-            conn.close()
             return True
+        finally:
+            conn.close()
     
     def get_album_ratings(self, album_id):
         """Récupère toutes les notes d'un album donné"""
         assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM ratings WHERE album_id = ?', (album_id,))
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM ratings WHERE album_id = ?', (album_id,))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
         ratings = []
         for row in rows:
@@ -533,17 +1159,131 @@ class Database:
                                  row['score'], row['review'], row['created_at']))
         return ratings
     
+    def get_album_ratings_page(self, album_id, sort='newest', limit=20, cursor=None):
+        """
+        Une page de critiques d'un album, triée selon RATING_SORTS[sort], avec le nom et la photo
+        de leurs auteurs (une seule requête, jointure sur users).
+        La pagination se fait par curseur (valeurs du tri de la dernière critique affichée,
+        ex : "8.5:1234") plutôt qu'avec OFFSET : chaque page coûte le même prix.
+        Retourne (ratings, next_cursor) ; next_cursor vaut None s'il n'y a pas d'autre page.
+        Chaque Rating a en plus .user ({'id', 'username', 'profile_image'}) et .replies_count.
+        """
+        assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
+        assert sort in RATING_SORTS, "Tri invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
+        
+        columns = [f'ratings.{column}' for column in RATING_SORTS[sort]]
+        params = [album_id]
+        after = ''
+        position = self._decode_ratings_cursor(cursor, len(columns))
+        if position:
+            # Comparaison de "row values" : (score, id) < (8.5, 1234), servie par l'index du tri
+            after = f"AND ({', '.join(columns)}) < ({', '.join('?' * len(columns))})"
+            params += position
+        
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(f'''
+                SELECT ratings.*, users.username, users.profile_image
+                FROM ratings
+                JOIN users ON users.id = ratings.user_id
+                WHERE ratings.album_id = ? {after}
+                ORDER BY {', '.join(column + ' DESC' for column in columns)}
+                LIMIT ?
+            ''', (*params, limit + 1)).fetchall()  # Une ligne de plus pour savoir s'il reste une page
+        finally:
+            conn.close()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = ':'.join(repr(rows[-1][column]) for column in RATING_SORTS[sort])
+        
+        ratings = []
+        for row in rows:
+            rating = Rating(row['id'], row['user_id'], row['album_id'],
+                            row['score'], row['review'], row['created_at'])
+            rating.user = {'id': row['user_id'], 'username': row['username'], 'profile_image': row['profile_image']}
+            rating.replies_count = row['reply_count']
+            ratings.append(rating)
+        return ratings, next_cursor
+    
+    @staticmethod
+    def _decode_ratings_cursor(cursor, size):
+        """Décode un curseur "valeur:...:id" de `size` valeurs ; retourne None s'il est absent ou invalide"""
+        if not cursor:
+            return None
+        values = cursor.split(':')
+        if len(values) != size:
+            return None
+        try:
+            # Le dernier élément est l'id (entier) ; la note peut être décimale
+            return [float(value) for value in values[:-1]] + [int(values[-1])]
+        except ValueError:
+            return None
+    
+    def get_user_ratings_page(self, user_id, limit=20, cursor=None):
+        """
+        Historique des notes d'un utilisateur, des plus récentes aux plus anciennes, page par page.
+        Curseur "created_at:id" de la dernière note affichée : la page suivante est lue directement
+        dans l'index idx_ratings_user_created (user_id, created_at, puis l'id ajouté par SQLite),
+        donc une page coûte le même prix qu'on soit au début ou des années en arrière.
+        Retourne (ratings, next_cursor) ; next_cursor vaut None s'il n'y a pas d'autre page.
+        """
+        assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
+        
+        params = [user_id]
+        after = ''
+        position = self._decode_history_cursor(cursor)
+        if position:
+            after = 'AND (created_at, id) < (?, ?)'
+            params += position
+        
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(f'''
+                SELECT * FROM ratings
+                WHERE user_id = ? {after}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', (*params, limit + 1)).fetchall()  # Une ligne de plus pour savoir s'il reste une page
+        finally:
+            conn.close()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['created_at']}:{rows[-1]['id']}"
+        
+        ratings = [Rating(row['id'], row['user_id'], row['album_id'],
+                          row['score'], row['review'], row['created_at']) for row in rows]
+        return ratings, next_cursor
+    
+    @staticmethod
+    def _decode_history_cursor(cursor):
+        """Décode un curseur "created_at:id" ; retourne None s'il est absent ou invalide"""
+        if not cursor:
+            return None
+        try:
+            created_at, last_id = cursor.rsplit(':', 1)
+            return [created_at, int(last_id)]
+        except ValueError:
+            return None
+    
     def get_user_rating(self, user_id, album_id):
         """Récupère la note d'un utilisateur spécifique pour un album spécifique"""
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM ratings WHERE user_id = ? AND album_id = ?', 
-                      (user_id, album_id))
-        row = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM ratings WHERE user_id = ? AND album_id = ?', 
+                          (user_id, album_id))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
         
         if row:
             return Rating(row['id'], row['user_id'], row['album_id'], 
@@ -552,20 +1292,88 @@ class Database:
     
     def get_album_average_rating(self, album_id):
         """
-        Calcule la note moyenne d'un album.
-        AVG() = fonction SQL qui calcule la moyenne
+        Retourne la note moyenne d'un album.
+        Elle est déjà calculée dans album_stats (tenue à jour par des triggers) : une simple lecture.
         """
         assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT AVG(score) as avg FROM ratings WHERE album_id = ?', 
-                      (album_id,))
-        row = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT avg_score as avg FROM album_stats WHERE album_id = ?', 
+                          (album_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
         
         # round() arrondit à 2 décimales (ex: 7.666667 → 7.67)
-        return round(row['avg'], 2) if row['avg'] else 0
+        return round(row['avg'], 2) if row and row['avg'] else 0
+    
+    def get_album_stats(self, album_id):
+        """
+        Retourne les statistiques d'un album : moyenne, nombre de notes, date de la dernière note
+        et l'histogramme des notes (histogram[n] = nombre de notes entre n et n+1, 10 compris dans 10).
+        """
+        assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM album_stats WHERE album_id = ?', (album_id,))
+            row = cursor.fetchone()
+            cursor.execute('SELECT bucket, count FROM album_score_histogram WHERE album_id = ?',
+                          (album_id,))
+            histogram = [0] * 11
+            for bucket_row in cursor.fetchall():
+                histogram[bucket_row['bucket']] = bucket_row['count']
+        finally:
+            conn.close()
+        
+        return {
+            'avg_score': round(row['avg_score'], 2) if row and row['avg_score'] else 0,
+            'num_ratings': row['rating_count'] if row else 0,
+            'last_rated_at': row['last_rated_at'] if row else None,
+            'histogram': histogram
+        }
+    
+    def rebuild_album_stats(self):
+        """
+        Recalcule album_stats depuis zéro (en une transaction).
+        Normalement inutile grâce aux triggers, mais pratique après une manipulation à la main.
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_album_stats(conn.cursor())
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_albums_average_ratings(self, album_ids):
+        """
+        Calcule la note moyenne de plusieurs albums d'un coup.
+        Retourne {album_id: moyenne} (0 pour les albums sans note, comme get_album_average_rating)
+        """
+        album_ids = list(dict.fromkeys(album_ids))
+        averages = {album_id: 0 for album_id in album_ids}
+        if not album_ids:
+            return averages
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(album_ids), MAX_IDS_PER_QUERY):
+                chunk = album_ids[start:start + MAX_IDS_PER_QUERY]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT album_id, avg_score as avg FROM album_stats
+                    WHERE album_id IN ({placeholders})
+                ''', chunk)
+                for row in cursor.fetchall():
+                    averages[row['album_id']] = round(row['avg'], 2) if row['avg'] else 0
+        finally:
+            conn.close()
+        return averages
     
     def get_top_rated_albums(self, limit=10):
         """
@@ -574,102 +1382,235 @@ class Database:
         """
         assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
         
+        return self._get_ranked_albums('DESC', limit)
+    
+    def _get_ranked_albums(self, direction, limit):
+        """
+        Lit le classement dans album_stats, en suivant l'index partiel idx_album_stats_ranking :
+        on parcourt juste les `limit` premières entrées de l'index, sans rien recalculer.
+        À moyenne égale, l'id de l'album départage : l'ordre est toujours le même.
+        direction : 'DESC' pour les meilleurs, 'ASC' pour les pires
+        """
+        assert direction in ('ASC', 'DESC'), "Direction invalide"
+        
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT album_id, AVG(score) as avg_score, COUNT(*) as num_ratings
-            FROM ratings
-            GROUP BY album_id
-            HAVING num_ratings >= 3
-            ORDER BY avg_score DESC
-            LIMIT ?
-        ''', (limit,))
-        # GROUP BY = regroupe par album
-        # HAVING = filtre après le regroupement (comme WHERE mais pour les groupes)
-        # ORDER BY DESC = trie du plus grand au plus petit
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT albums.*, album_stats.avg_score, album_stats.rating_count as num_ratings
+                FROM album_stats
+                JOIN albums ON albums.id = album_stats.album_id
+                WHERE album_stats.rating_count >= 3
+                ORDER BY album_stats.avg_score {direction}, album_stats.album_id {direction}
+                LIMIT ?
+            ''', (limit,))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
         results = []
         for row in rows:
-            album = self.get_album_by_id(row['album_id'])
-            if album:
-                results.append({
-                    'album': album,
-                    'avg_score': round(row['avg_score'], 2),
-                    'num_ratings': row['num_ratings']
-                })
+            results.append({
+                'album': self._album_from_row(row),
+                'avg_score': round(row['avg_score'], 2),
+                'num_ratings': row['num_ratings']
+            })
         return results
     
+    def get_album_neighbors(self, album_id, limit=8):
+        """
+        Récupère les albums les plus souvent aimés par les fans de cet album
+        (précalculés par similarity.py dans album_neighbors : une simple lecture par clé primaire).
+        Retourne une liste de dictionnaires {'album', 'score'}, du plus au moins similaire.
+        """
+        assert isinstance(album_id, int) and album_id > 0, "Album ID invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT albums.*, album_neighbors.score as similarity
+                FROM album_neighbors
+                JOIN albums ON albums.id = album_neighbors.neighbor_id
+                WHERE album_neighbors.album_id = ?
+                ORDER BY album_neighbors.rank
+                LIMIT ?
+            ''', (album_id, limit))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        
+        return [{'album': self._album_from_row(row), 'score': row['similarity']} for row in rows]
+    
     # ========== FONCTIONS POUR LES RÉPONSES AUX CRITIQUES ==========
     
     def create_reply(self, rating_id, user_id, content):
-        """Crée une nouvelle réponse à une critique"""
+        """Crée une nouvelle réponse à une critique. Retourne son ID, ou None si la critique n'existe pas"""
         assert isinstance(rating_id, int) and rating_id > 0, "Rating ID invalide"
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         assert isinstance(content, str) and len(content) > 0, "Content invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO replies (rating_id, user_id, content) VALUES (?, ?, ?)',
-            (rating_id, user_id, content)
-        )
-        conn.commit()
-        reply_id = cursor.lastrowid
-        conn.close()
-        return reply_id
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO replies (rating_id, user_id, content) VALUES (?, ?, ?)',
+                (rating_id, user_id, content)
+            )
+            conn.commit()
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            # Clé étrangère : la critique (ou l'utilisateur) n'existe pas
+            return None
+        finally:
+            conn.close()
+    
+    def get_rating_replies(self, rating_id):
+        """
+        Récupère toutes les réponses d'une critique donnée.
+        ORDER BY created_at ASC = trie par date croissante (les plus anciennes d'abord)
+        """
+        assert isinstance(rating_id, int) and rating_id > 0, "Rating ID invalide"
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT * FROM replies WHERE rating_id = ? ORDER BY created_at ASC', 
+                (rating_id,)
+            )
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        
+        replies = []
+        for row in rows:
+            replies.append(Reply(row['id'], row['rating_id'], row['user_id'], 
+                               row['content'], row['created_at']))
+        return replies
     
-    def get_rating_replies(self, rating_id):
+    def get_rating_thread(self, rating_id, after_reply_id=None, limit=50):
         """
-        Récupère toutes les réponses d'une critique donnée.
-        ORDER BY created_at ASC = trie par date croissante (les plus anciennes d'abord)
+        Tout ce qu'il faut pour afficher la conversation d'une critique, en quelques requêtes
+        quel que soit le nombre de réponses :
+        - la critique et son auteur (une requête, jointure sur users) ;
+        - l'album et l'artiste (cache des entités) ;
+        - une page de `limit` réponses, des plus anciennes aux plus récentes, avec leurs auteurs
+          (une requête). after_reply_id : on reprend juste après cette réponse ("charger la suite").
+        Retourne None si la critique n'existe pas, sinon un dictionnaire
+        {'rating', 'album', 'artist', 'replies', 'next_after'} ; next_after vaut None s'il n'y a plus de réponses.
+        Comme pour get_album_ratings_page, les auteurs sont des dictionnaires {'id', 'username', 'profile_image'}.
         """
         assert isinstance(rating_id, int) and rating_id > 0, "Rating ID invalide"
+        assert after_reply_id is None or isinstance(after_reply_id, int), "after_reply_id invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM replies WHERE rating_id = ? ORDER BY created_at ASC', 
-            (rating_id,)
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            row = conn.execute('''
+                SELECT ratings.*, users.username, users.profile_image
+                FROM ratings
+                JOIN users ON users.id = ratings.user_id
+                WHERE ratings.id = ?
+            ''', (rating_id,)).fetchone()
+            if row is None:
+                return None
+            
+            # Réponses dans l'ordre d'écriture (id croissant) : l'index idx_replies_rating_id sert au tri et au curseur
+            reply_rows = conn.execute('''
+                SELECT replies.*, users.username, users.profile_image
+                FROM replies
+                JOIN users ON users.id = replies.user_id
+                WHERE replies.rating_id = ? AND replies.id > ?
+                ORDER BY replies.id
+                LIMIT ?
+            ''', (rating_id, after_reply_id or 0, limit + 1)).fetchall()  # Une de plus pour savoir s'il en reste
+        finally:
+            conn.close()
+        
+        rating = Rating(row['id'], row['user_id'], row['album_id'],
+                        row['score'], row['review'], row['created_at'])
+        rating.user = {'id': row['user_id'], 'username': row['username'], 'profile_image': row['profile_image']}
+        rating.replies_count = row['reply_count']
+        
+        next_after = None
+        if len(reply_rows) > limit:
+            reply_rows = reply_rows[:limit]
+            next_after = reply_rows[-1]['id']
         
         replies = []
-        for row in rows:
-            replies.append(Reply(row['id'], row['rating_id'], row['user_id'], 
-                               row['content'], row['created_at']))
-        return replies
+        for reply_row in reply_rows:
+            reply = Reply(reply_row['id'], reply_row['rating_id'], reply_row['user_id'],
+                          reply_row['content'], reply_row['created_at'])
+            reply.user = {'id': reply_row['user_id'], 'username': reply_row['username'],
+                          'profile_image': reply_row['profile_image']}
+            replies.append(reply)
+        
+        album = self.get_album_by_id(row['album_id'])
+        return {
+            'rating': rating,
+            'album': album,
+            'artist': self.get_artist_by_id(album.artist_id) if album else None,
+            'replies': replies,
+            'next_after': next_after,
+        }
     
     def get_replies_count(self, rating_id):
         """Compte le nombre de réponses pour une critique"""
         assert isinstance(rating_id, int) and rating_id > 0, "Rating ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM replies WHERE rating_id = ?', (rating_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return row['count'] if row else 0
+        try:
+            cursor = conn.cursor()
+            # ratings.reply_count est tenu à jour par des triggers
+            cursor.execute('SELECT reply_count FROM ratings WHERE id = ?', (rating_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return row['reply_count'] if row else 0
+    
+    def get_replies_counts(self, rating_ids):
+        """
+        Compte les réponses de plusieurs critiques d'un coup.
+        Retourne {rating_id: nombre} (0 pour les critiques sans réponse)
+        """
+        rating_ids = list(dict.fromkeys(rating_ids))
+        counts = {rating_id: 0 for rating_id in rating_ids}
+        if not rating_ids:
+            return counts
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(rating_ids), MAX_IDS_PER_QUERY):
+                chunk = rating_ids[start:start + MAX_IDS_PER_QUERY]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'SELECT id, reply_count FROM ratings WHERE id IN ({placeholders})', chunk)
+                for row in cursor.fetchall():
+                    counts[row['id']] = row['reply_count']
+        finally:
+            conn.close()
+        return counts
     
     def delete_reply(self, reply_id, user_id):
         """Supprime une réponse (seulement si c'est l'auteur)"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # On vérifie que la réponse appartient bien à l'utilisateur
-        cursor.execute('SELECT * FROM replies WHERE id = ? AND user_id = ?', (reply_id, user_id))
-        reply = cursor.fetchone()
-        
-        if reply:
-            cursor.execute('DELETE FROM replies WHERE id = ?', (reply_id,))
-            conn.commit()
+        try:
+            cursor = conn.cursor()
+            
+            # On vérifie que la réponse appartient bien à l'utilisateur
+            cursor.execute('SELECT * FROM replies WHERE id = ? AND user_id = ?', (reply_id, user_id))
+            reply = cursor.fetchone()
+            
+            if reply:
+                cursor.execute('DELETE FROM replies WHERE id = ?', (reply_id,))
+                conn.commit()
+                return True
+            
+            return False
+        finally:
             conn.close()
-            return True
-        
-        conn.close()
-        return False
     
     # ========== FONCTIONS POUR LES SUIVIS (système d'amis) ==========
     
@@ -692,12 +1633,12 @@ class Database:
                 (follower_id, following_id)
             )
             conn.commit()
-            conn.close()
             return True
         except sqlite3.IntegrityError:
             # Erreur = on suit déjà cette personne
-            conn.close()
             return False
+        finally:
+            conn.close()
     
     def unfollow_user(self, follower_id, following_id):
         """Permet à un utilisateur d'arrêter de suivre un autre"""
@@ -705,13 +1646,15 @@ class Database:
         assert isinstance(following_id, int) and following_id > 0, "Following ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'DELETE FROM follows WHERE follower_id = ? AND following_id = ?',
-            (follower_id, following_id)
-        )
-        conn.commit()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'DELETE FROM follows WHERE follower_id = ? AND following_id = ?',
+                (follower_id, following_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
         return True
     
     def is_following(self, follower_id, following_id):
@@ -723,13 +1666,15 @@ class Database:
         assert isinstance(following_id, int) and following_id > 0, "Following ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM follows WHERE follower_id = ? AND following_id = ?',
-            (follower_id, following_id)
-        )
-        result = cursor.fetchone()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT * FROM follows WHERE follower_id = ? AND following_id = ?',
+                (follower_id, following_id)
+            )
+            result = cursor.fetchone()
+        finally:
+            conn.close()
         return result is not None  # Si result existe = True, sinon = False
     
     # ========== FONCTIONS POUR LES TAGS ==========
@@ -738,21 +1683,26 @@ class Database:
         """
         Ajoute un tag à un artiste (comme des hashtags).
         Exemple: ajouter "indie" à l'artiste Arctic Monkeys
+        Retourne l'ID du tag, ou None si l'artiste n'existe pas
         """
         assert isinstance(artist_id, int) and artist_id > 0, "Artist ID invalide"
         assert isinstance(tag_name, str) and len(tag_name) > 0, "Tag name invalide"
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO tags (artist_id, tag_name, user_id) VALUES (?, ?, ?)',
-            (artist_id, tag_name.lower(), user_id)  # .lower() = tout en minuscules pour cohérence
-        )
-        conn.commit()
-        tag_id = cursor.lastrowid
-        conn.close()
-        return tag_id
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO tags (artist_id, tag_name, user_id) VALUES (?, ?, ?)',
+                (artist_id, tag_name.lower(), user_id)  # .lower() = tout en minuscules pour cohérence
+            )
+            conn.commit()
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            # Clé étrangère : l'artiste (ou l'utilisateur) n'existe pas
+            return None
+        finally:
+            conn.close()
     
     def get_artist_tags(self, artist_id):
         """
@@ -760,17 +1710,19 @@ class Database:
         Exemple: "indie" x5, "rock" x3
         """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, tag_name, user_id, COUNT(*) as count 
-            FROM tags 
-            WHERE artist_id = ? 
-            GROUP BY tag_name
-            ORDER BY count DESC
-        ''', (artist_id,))
-        # COUNT(*) compte combien de fois chaque tag apparaît
-        tags = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, tag_name, user_id, COUNT(*) as count 
+                FROM tags 
+                WHERE artist_id = ? 
+                GROUP BY tag_name
+                ORDER BY count DESC
+            ''', (artist_id,))
+            # COUNT(*) compte combien de fois chaque tag apparaît
+            tags = cursor.fetchall()
+        finally:
+            conn.close()
         return tags
     
     def get_worst_rated_albums(self, limit=10):
@@ -780,68 +1732,88 @@ class Database:
         """
         assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT album_id, AVG(score) as avg_score, COUNT(*) as num_ratings
-            FROM ratings
-            GROUP BY album_id
-            HAVING num_ratings >= 3
-            ORDER BY avg_score ASC
-            LIMIT ?
-        ''', (limit,))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        results = []
-        for row in rows:
-            album = self.get_album_by_id(row['album_id'])
-            if album:
-                results.append({
-                    'album': album,
-                    'avg_score': round(row['avg_score'], 2),
-                    'num_ratings': row['num_ratings']
-                })
-        return results
+        return self._get_ranked_albums('ASC', limit)
 
-    def get_user_favorite_genres(self, user_id):
+    def get_user_favorite_genres(self, user_id, limit=5):
         """
         Trouve les genres préférés d'un utilisateur en analysant ses bonnes notes.
-        On regarde les albums qu'il a notés > 6.5/10
+        On regarde les albums qu'il a notés > 6.5/10, et on compte leurs genres directement en SQL
         """
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT genres.name, COUNT(*) as count
+                FROM ratings
+                JOIN album_genres ON album_genres.album_id = ratings.album_id
+                JOIN genres ON genres.id = album_genres.genre_id
+                WHERE ratings.user_id = ? AND ratings.score > 6.5
+                GROUP BY genres.id
+                ORDER BY count DESC
+                LIMIT ?
+            ''', (user_id, limit))
+            # On relie chaque note à ses genres, puis on compte combien de fois chaque genre apparaît
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
-        # On récupère les genres des albums bien notés par l'utilisateur
-        cursor.execute('''
-            SELECT albums.genres
-            FROM ratings
-            JOIN albums ON ratings.album_id = albums.id
-            WHERE ratings.user_id = ? AND ratings.score > 6.5
-        ''', (user_id,))
-        # JOIN = on relie la table ratings avec la table albums pour avoir les infos des deux
+        return [row['name'] for row in rows]  # Du plus fréquent au moins fréquent
+
+    def get_albums_by_genre(self, genre, limit=20):
+        """
+        Récupère les albums d'un genre, les mieux notés d'abord (les albums sans note à la fin).
+        Retourne une liste de dictionnaires {'album', 'avg_score', 'num_ratings'}
+        """
+        assert isinstance(genre, str) and len(genre) > 0, "Genre invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
         
-        rows = cursor.fetchall()
-        conn.close()
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT albums.*, album_stats.avg_score, album_stats.rating_count as num_ratings
+                FROM genres
+                JOIN album_genres ON album_genres.genre_id = genres.id
+                JOIN albums ON albums.id = album_genres.album_id
+                LEFT JOIN album_stats ON album_stats.album_id = albums.id
+                WHERE genres.name = ?
+                ORDER BY album_stats.avg_score IS NULL, album_stats.avg_score DESC
+                LIMIT ?
+            ''', (genre.strip().lower(), limit))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
-        # On compte combien de fois chaque genre apparaît
-        genre_counts = {}  # Dictionnaire pour compter: {"rock": 5, "pop": 3, ...}
-        for row in rows:
-            if row['genres']:  # Si l'album a des genres
-                genres = row['genres'].split(',')  # On sépare: "rock,pop" → ["rock", "pop"]
-                for genre in genres:
-                    genre = genre.strip()  # .strip() enlève les espaces inutiles
-                    if genre:
-                        # On incrémente le compteur pour ce genre
-                        genre_counts[genre] = genre_counts.get(genre, 0) + 1
+        return [{
+            'album': self._album_from_row(row),
+            'avg_score': round(row['avg_score'], 2) if row['avg_score'] else 0,
+            'num_ratings': row['num_ratings'] or 0
+        } for row in rows]
+
+    def get_artists_by_genre(self, genre, limit=20):
+        """Récupère les artistes d'un genre (par ordre alphabétique)"""
+        assert isinstance(genre, str) and len(genre) > 0, "Genre invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
         
-        # On trie les genres par nombre d'occurrences (du plus au moins fréquent)
-        sorted_genres = sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)
-        # lambda x: x[1] = on trie par la valeur (le nombre), pas par la clé (le nom du genre)
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT artists.*
+                FROM genres
+                JOIN artist_genres ON artist_genres.genre_id = genres.id
+                JOIN artists ON artists.id = artist_genres.artist_id
+                WHERE genres.name = ?
+                ORDER BY artists.name
+                LIMIT ?
+            ''', (genre.strip().lower(), limit))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
-        return [genre for genre, count in sorted_genres[:5]]  # On retourne les 5 premiers
+        return [self._artist_from_row(row) for row in rows]
 
     def get_user_favorite_artists(self, user_id):
         """
@@ -851,21 +1823,23 @@ class Database:
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT albums.artist_id, COUNT(*) as count, AVG(ratings.score) as avg_score
-            FROM ratings
-            JOIN albums ON ratings.album_id = albums.id
-            WHERE ratings.user_id = ? AND ratings.score > 6.5
-            GROUP BY albums.artist_id
-            ORDER BY avg_score DESC, count DESC
-            LIMIT 5
-        ''', (user_id,))
-        # On regroupe par artiste, on compte combien d'albums bien notés, et on calcule la moyenne
-        
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT albums.artist_id, COUNT(*) as count, AVG(ratings.score) as avg_score
+                FROM ratings
+                JOIN albums ON ratings.album_id = albums.id
+                WHERE ratings.user_id = ? AND ratings.score > 6.5
+                GROUP BY albums.artist_id
+                ORDER BY avg_score DESC, count DESC
+                LIMIT 5
+            ''', (user_id,))
+            # On regroupe par artiste, on compte combien d'albums bien notés, et on calcule la moyenne
+            
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
         return [row['artist_id'] for row in rows]
 
@@ -878,147 +1852,164 @@ class Database:
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
         # === ÉTAPE 1: On analyse les goûts de l'utilisateur ===
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # On compte combien d'albums l'utilisateur a bien notés
-        cursor.execute('SELECT COUNT(*) as count FROM ratings WHERE user_id = ? AND score > 6.5', (user_id,))
-        high_ratings_count = cursor.fetchone()['count']
-        
-        print(f"[DEBUG] User {user_id} a {high_ratings_count} notes > 6.5")
-        
-        # On récupère ses genres et artistes préférés
         favorite_genres = self.get_user_favorite_genres(user_id)
         favorite_artists = self.get_user_favorite_artists(user_id)
         
-        print(f"[DEBUG] Genres favoris: {favorite_genres}")
-        print(f"[DEBUG] Artistes favoris: {favorite_artists}")
-        
         # Si l'utilisateur n'a pas assez noté d'albums, on lui propose juste des albums populaires
         if not favorite_genres and not favorite_artists:
-            print("[DEBUG] Pas de préférences, retour albums populaires")
-            conn.close()
             return self.get_popular_unrated_albums(user_id, limit)
         
-        # === ÉTAPE 2: On récupère les albums déjà notés pour ne pas les recommander ===
-        cursor.execute('SELECT album_id FROM ratings WHERE user_id = ?', (user_id,))
-        rated_album_ids = [row['album_id'] for row in cursor.fetchall()]
-        
-        print(f"[DEBUG] Albums déjà notés: {rated_album_ids}")
-        
-        recommendations = []
-        
-        # === ÉTAPE 3: On cherche des albums d'artistes similaires ===
-        if favorite_artists:
-            # On crée une requête SQL dynamique avec le bon nombre de "?"
-            placeholders = ','.join('?' * len(favorite_artists))
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            recommendations = []
             
-            # Si l'utilisateur a déjà noté des albums, on les exclut
-            if rated_album_ids:
-                rated_placeholders = ','.join('?' * len(rated_album_ids))
-                query = f'''
-                    SELECT albums.*, AVG(ratings.score) as avg_score, COUNT(ratings.id) as num_ratings
+            # === ÉTAPE 2: On cherche des albums d'artistes similaires ===
+            # Les albums déjà notés sont exclus avec NOT EXISTS (index UNIQUE(user_id, album_id))
+            # plutôt qu'avec une liste NOT IN (...) qui grandit avec chaque note
+            if favorite_artists:
+                # On crée une requête SQL dynamique avec le bon nombre de "?"
+                placeholders = ','.join('?' * len(favorite_artists))
+                cursor.execute(f'''
+                    SELECT albums.*, album_stats.avg_score, album_stats.rating_count as num_ratings
                     FROM albums
-                    LEFT JOIN ratings ON albums.id = ratings.album_id
+                    JOIN album_stats ON album_stats.album_id = albums.id
                     WHERE albums.artist_id IN ({placeholders})
-                    AND albums.id NOT IN ({rated_placeholders})
-                    GROUP BY albums.id
-                    HAVING num_ratings >= 1
-                    ORDER BY avg_score DESC
+                    AND NOT EXISTS (
+                        SELECT 1 FROM ratings
+                        WHERE ratings.user_id = ? AND ratings.album_id = albums.id
+                    )
+                    ORDER BY album_stats.avg_score DESC
                     LIMIT ?
-                '''
-                cursor.execute(query, (*favorite_artists, *rated_album_ids, limit // 2))
-                # *favorite_artists décompresse la liste: [1,2,3] → 1,2,3
+                ''', (*favorite_artists, user_id, limit // 2))
+                # JOIN album_stats = seulement les albums qui ont déjà au moins une note
                 # limit // 2 = on prend la moitié du nombre demandé
-            else:
-                query = f'''
-                    SELECT albums.*, AVG(ratings.score) as avg_score, COUNT(ratings.id) as num_ratings
-                    FROM albums
-                    LEFT JOIN ratings ON albums.id = ratings.album_id
-                    WHERE albums.artist_id IN ({placeholders})
-                    GROUP BY albums.id
-                    HAVING num_ratings >= 1
-                    ORDER BY avg_score DESC
-                    LIMIT ?
-                '''
-                cursor.execute(query, (*favorite_artists, limit // 2))
-            
-            rows = cursor.fetchall()
-            print(f"[DEBUG] Trouvé {len(rows)} albums d'artistes similaires")
-            
-            # On transforme chaque résultat en objet Album et on l'ajoute aux recommandations
-            for row in rows:
-                genres = row['genres'].split(',') if row['genres'] else []
-                album = Album(row['id'], row['title'], row['artist_id'],
-                            row['release_date'], row['spotify_id'],
-                            row['image_url'], genres)
-                recommendations.append({
-                    'album': album,
-                    'avg_score': round(row['avg_score'], 2) if row['avg_score'] else 0,
-                    'num_ratings': row['num_ratings'],
-                    'reason': 'Artiste similaire'  # Pourquoi on recommande cet album
-                })
-        
-        # === ÉTAPE 4: On complète avec des albums de genres similaires ===
-        if favorite_genres and len(recommendations) < limit:
-            # On exclut les albums déjà recommandés et déjà notés
-            already_recommended_ids = [item['album'].id for item in recommendations]
-            all_excluded = rated_album_ids + already_recommended_ids
+                
+                for row in cursor.fetchall():
+                    recommendations.append({
+                        'album': self._album_from_row(row),
+                        'avg_score': round(row['avg_score'], 2) if row['avg_score'] else 0,
+                        'num_ratings': row['num_ratings'],
+                        'reason': 'Artiste similaire'  # Pourquoi on recommande cet album
+                    })
             
-            if all_excluded:
-                excluded_placeholders = ','.join('?' * len(all_excluded))
-                query = f'''
-                    SELECT albums.*, AVG(ratings.score) as avg_score, COUNT(ratings.id) as num_ratings
-                    FROM albums
-                    LEFT JOIN ratings ON albums.id = ratings.album_id
-                    WHERE albums.genres IS NOT NULL 
-                    AND albums.id NOT IN ({excluded_placeholders})
+            # === ÉTAPE 3: On ajoute les albums que les amis ont adorés ===
+            if len(recommendations) < limit:
+                already_recommended_ids = [item['album'].id for item in recommendations]
+                exclude_recommended = ''
+                if already_recommended_ids:
+                    exclude_recommended = f"AND albums.id NOT IN ({','.join('?' * len(already_recommended_ids))})"
+                
+                cursor.execute(f'''
+                    SELECT albums.*, album_stats.avg_score, album_stats.rating_count as num_ratings
+                    FROM follows
+                    JOIN ratings ON ratings.user_id = follows.following_id
+                    JOIN albums ON albums.id = ratings.album_id
+                    JOIN album_stats ON album_stats.album_id = albums.id
+                    WHERE follows.follower_id = ?
+                    AND ratings.score >= ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM ratings AS mine
+                        WHERE mine.user_id = ? AND mine.album_id = albums.id
+                    )
+                    {exclude_recommended}
                     GROUP BY albums.id
-                    HAVING num_ratings >= 1
-                    ORDER BY avg_score DESC
+                    ORDER BY COUNT(*) DESC, album_stats.avg_score DESC
                     LIMIT ?
-                '''
-                cursor.execute(query, (*all_excluded, limit * 2))
-            else:
-                cursor.execute('''
-                    SELECT albums.*, AVG(ratings.score) as avg_score, COUNT(ratings.id) as num_ratings
-                    FROM albums
-                    LEFT JOIN ratings ON albums.id = ratings.album_id
-                    WHERE albums.genres IS NOT NULL
+                ''', (user_id, FRIENDS_LIKE_SCORE, user_id, *already_recommended_ids, max(1, limit // 4)))
+                # COUNT(*) = nombre d'amis qui ont adoré l'album
+                
+                for row in cursor.fetchall():
+                    recommendations.append({
+                        'album': self._album_from_row(row),
+                        'avg_score': round(row['avg_score'], 2) if row['avg_score'] else 0,
+                        'num_ratings': row['num_ratings'],
+                        'reason': 'Adoré par vos amis'
+                    })
+            
+            # === ÉTAPE 4: On complète avec des albums de genres similaires ===
+            if favorite_genres and len(recommendations) < limit:
+                # Le filtrage par genre se fait en SQL, via les tables de liaison :
+                # plus besoin de récupérer trop d'albums et de trier en Python
+                already_recommended_ids = [item['album'].id for item in recommendations]
+                genre_placeholders = ','.join('?' * len(favorite_genres))
+                exclude_recommended = ''
+                if already_recommended_ids:
+                    exclude_recommended = f"AND albums.id NOT IN ({','.join('?' * len(already_recommended_ids))})"
+                
+                cursor.execute(f'''
+                    SELECT albums.*, album_stats.avg_score, album_stats.rating_count as num_ratings
+                    FROM genres
+                    JOIN album_genres ON album_genres.genre_id = genres.id
+                    JOIN album_stats ON album_stats.album_id = album_genres.album_id
+                    JOIN albums ON albums.id = album_genres.album_id
+                    WHERE genres.name IN ({genre_placeholders})
+                    AND NOT EXISTS (
+                        SELECT 1 FROM ratings
+                        WHERE ratings.user_id = ? AND ratings.album_id = albums.id
+                    )
+                    {exclude_recommended}
                     GROUP BY albums.id
-                    HAVING num_ratings >= 1
-                    ORDER BY avg_score DESC
+                    ORDER BY album_stats.avg_score DESC
                     LIMIT ?
-                ''', (limit * 2,))
-            
-            rows = cursor.fetchall()
-            print(f"[DEBUG] Trouvé {len(rows)} albums potentiels pour genres similaires")
-            
-            # On vérifie que l'album a au moins un genre en commun avec les préférences
-            for row in rows:
-                if len(recommendations) >= limit:  # On s'arrête quand on a assez de recommandations
-                    break
+                ''', (*favorite_genres, user_id, *already_recommended_ids, limit - len(recommendations)))
+                # JOIN album_stats = seulement les albums qui ont déjà au moins une note
                 
-                album_genres = row['genres'].split(',') if row['genres'] else []
-                # On vérifie si au moins un genre correspond
-                # any() retourne True si AU MOINS un élément de la liste est True
-                if any(genre.strip() in favorite_genres for genre in album_genres):
-                    genres = row['genres'].split(',') if row['genres'] else []
-                    album = Album(row['id'], row['title'], row['artist_id'],
-                                row['release_date'], row['spotify_id'],
-                                row['image_url'], genres)
+                for row in cursor.fetchall():
                     recommendations.append({
-                        'album': album,
+                        'album': self._album_from_row(row),
                         'avg_score': round(row['avg_score'], 2) if row['avg_score'] else 0,
                         'num_ratings': row['num_ratings'],
                         'reason': 'Genre similaire'
                     })
+            
+        finally:
+            conn.close()
         
-        conn.close()
-        
-        print(f"[DEBUG] Total recommandations: {len(recommendations)}")
         return recommendations[:limit]  # On retourne au maximum 'limit' recommandations
 
+    def get_user_rated_album_ids(self, user_id):
+        """Retourne les IDs des albums déjà notés par un utilisateur (lecture de l'index UNIQUE)"""
+        assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT album_id FROM ratings WHERE user_id = ?', (user_id,))
+            album_ids = [row['album_id'] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        return album_ids
+    
+    def get_albums_stats(self, album_ids):
+        """
+        Moyenne et nombre de notes de plusieurs albums d'un coup (lus dans album_stats).
+        Retourne {album_id: {'avg_score', 'num_ratings'}}
+        """
+        album_ids = list(dict.fromkeys(album_ids))
+        stats = {album_id: {'avg_score': 0, 'num_ratings': 0} for album_id in album_ids}
+        if not album_ids:
+            return stats
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(album_ids), MAX_IDS_PER_QUERY):
+                chunk = album_ids[start:start + MAX_IDS_PER_QUERY]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT album_id, avg_score, rating_count FROM album_stats
+                    WHERE album_id IN ({placeholders})
+                ''', chunk)
+                for row in cursor.fetchall():
+                    stats[row['album_id']] = {
+                        'avg_score': round(row['avg_score'], 2) if row['avg_score'] else 0,
+                        'num_ratings': row['rating_count']
+                    }
+        finally:
+            conn.close()
+        return stats
+    
     def get_popular_unrated_albums(self, user_id, limit=12):
         """
         Récupère des albums populaires que l'utilisateur n'a pas encore notés.
@@ -1027,40 +2018,28 @@ class Database:
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # On récupère les albums déjà notés par l'utilisateur
-        cursor.execute('SELECT album_id FROM ratings WHERE user_id = ?', (user_id,))
-        rated_album_ids = [row['album_id'] for row in cursor.fetchall()]
-        
-        # On récupère les albums populaires qui n'ont pas été notés par l'utilisateur
-        if rated_album_ids:
-            placeholders = ','.join('?' * len(rated_album_ids))
-            query = f'''
-                SELECT albums.*, AVG(ratings.score) as avg_score, COUNT(ratings.id) as num_ratings
-                FROM albums
-                LEFT JOIN ratings ON albums.id = ratings.album_id
-                WHERE albums.id NOT IN ({placeholders})
-                GROUP BY albums.id
-                HAVING num_ratings >= 3
-                ORDER BY avg_score DESC, num_ratings DESC
-                LIMIT ?
-            '''
-            cursor.execute(query, (*rated_album_ids, limit))
-        else:
-            # Si l'utilisateur n'a encore rien noté, on prend juste les plus populaires
+        try:
+            cursor = conn.cursor()
+            
+            # On parcourt le classement (index partiel sur album_stats) en sautant les albums
+            # que l'utilisateur a déjà notés : NOT EXISTS utilise l'index UNIQUE(user_id, album_id),
+            # au lieu d'une liste NOT IN (...) qui grandit avec chaque note
             cursor.execute('''
-                SELECT albums.*, AVG(ratings.score) as avg_score, COUNT(ratings.id) as num_ratings
-                FROM albums
-                LEFT JOIN ratings ON albums.id = ratings.album_id
-                GROUP BY albums.id
-                HAVING num_ratings >= 3
-                ORDER BY avg_score DESC, num_ratings DESC
+                SELECT albums.*, album_stats.avg_score, album_stats.rating_count as num_ratings
+                FROM album_stats
+                JOIN albums ON albums.id = album_stats.album_id
+                WHERE album_stats.rating_count >= 3
+                AND NOT EXISTS (
+                    SELECT 1 FROM ratings
+                    WHERE ratings.user_id = ? AND ratings.album_id = album_stats.album_id
+                )
+                ORDER BY album_stats.avg_score DESC, album_stats.rating_count DESC
                 LIMIT ?
-            ''', (limit,))
-        
-        rows = cursor.fetchall()
-        conn.close()
+            ''', (user_id, limit))
+            
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
         results = []
         for row in rows:
@@ -1087,18 +2066,20 @@ class Database:
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
         
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT users.* 
-            FROM users
-            JOIN follows ON users.id = follows.following_id
-            WHERE follows.follower_id = ?
-            ORDER BY users.username
-        ''', (user_id,))
-        # On joint la table users avec follows pour récupérer les infos des personnes suivies
-        
-        rows = cursor.fetchall()
-        conn.close()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT users.* 
+                FROM users
+                JOIN follows ON users.id = follows.following_id
+                WHERE follows.follower_id = ?
+                ORDER BY users.username
+            ''', (user_id,))
+            # On joint la table users avec follows pour récupérer les infos des personnes suivies
+            
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
         
         friends = []
         for row in rows:
@@ -1106,37 +2087,90 @@ class Database:
                             row['password_hash'], row['created_at']))
         return friends
 
-    def get_friends_recent_ratings(self, user_id, limit=20):
+    def get_follower_ids(self, user_id):
+        """IDs des utilisateurs qui suivent user_id (index idx_follows_following_id)"""
+        assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
+        
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT follower_id FROM follows WHERE following_id = ?', (user_id,))
+            follower_ids = [row['follower_id'] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        return follower_ids
+
+    def get_friends_timeline(self, user_id, limit=20, before_id=None, loader=None):
         """
-        Récupère les notes récentes des amis d'un utilisateur.
-        C'est comme le fil d'actualité d'Instagram/TikTok mais pour les critiques musicales !
+        Fil d'actualité des amis : les notes des personnes suivies, de la plus récente à la plus ancienne.
+        Les notes sont lues dans la table timeline (remplie par des triggers à chaque nouvelle note),
+        plus celles des comptes très suivis (mode "pull") lues directement dans ratings.
+        before_id : pour la page suivante, on ne prend que les notes d'id < before_id.
+        Retourne (liste de {'rating', 'album', 'artist', 'user'}, before_id de la page suivante ou None)
         """
         assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
+        assert isinstance(limit, int) and 1 <= limit <= 100, "Limit doit être entre 1 et 100"
+        assert before_id is None or (isinstance(before_id, int) and before_id > 0), "before_id invalide"
+        
+        # Sans curseur on part "d'après la dernière note possible"
+        before_id = before_id or sys.maxsize
         
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            cursor = conn.cursor()
+            
+            # 1) Notes recopiées dans le fil (clé primaire (owner_id, rating_id) : lecture directe)
+            cursor.execute('''
+                SELECT rating_id FROM timeline
+                WHERE owner_id = ? AND rating_id < ?
+                ORDER BY rating_id DESC
+                LIMIT ?
+            ''', (user_id, before_id, limit + 1))
+            rating_ids = [row['rating_id'] for row in cursor.fetchall()]
+            
+            # 2) Comptes en mode "pull" suivis : leurs dernières notes, en une seule requête quel que soit
+            # leur nombre (l'index idx_ratings_user_id contient aussi l'id : recherche (user_id, id < ?) par compte)
+            cursor.execute('''
+                SELECT id FROM ratings
+                WHERE user_id IN (
+                    SELECT follows.following_id FROM follows
+                    JOIN users ON users.id = follows.following_id
+                    WHERE follows.follower_id = ? AND users.timeline_pull = 1
+                ) AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (user_id, before_id, limit + 1))
+            rating_ids.extend(row['id'] for row in cursor.fetchall())
+            
+            # On fusionne les deux sources : les ids sont croissants dans le temps
+            rating_ids = sorted(set(rating_ids), reverse=True)
+            has_more = len(rating_ids) > limit
+            rating_ids = rating_ids[:limit]
+            
+            rows = []
+            if rating_ids:
+                placeholders = ','.join('?' * len(rating_ids))
+                cursor.execute(f'''
+                    SELECT ratings.*, users.username, users.email
+                    FROM ratings
+                    JOIN users ON ratings.user_id = users.id
+                    WHERE ratings.id IN ({placeholders})
+                    ORDER BY ratings.id DESC
+                ''', rating_ids)
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
         
-        # On récupère les notes des personnes que l'utilisateur suit
-        cursor.execute('''
-            SELECT ratings.*, users.username, users.email
-            FROM ratings
-            JOIN follows ON ratings.user_id = follows.following_id
-            JOIN users ON ratings.user_id = users.id
-            WHERE follows.follower_id = ?
-            ORDER BY ratings.created_at DESC
-            LIMIT ?
-        ''', (user_id, limit))
-        # ORDER BY created_at DESC = les plus récentes en premier
-        
-        rows = cursor.fetchall()
-        conn.close()
+        # On récupère tous les albums, puis tous les artistes, en deux requêtes au total
+        loader = loader or self.loader()
+        albums = loader.albums([row['album_id'] for row in rows])
+        artists = loader.artists([album.artist_id for album in albums.values()])
         
         results = []
         for row in rows:
-            # Pour chaque note, on récupère aussi l'album et l'artiste correspondants
-            album = self.get_album_by_id(row['album_id'])
+            album = albums.get(row['album_id'])
             if album:
-                artist = self.get_artist_by_id(album.artist_id)
+                artist = artists.get(album.artist_id)
                 user = User(row['user_id'], row['username'], row['email'], '', '')
                 
                 rating = Rating(
@@ -1156,4 +2190,118 @@ class Database:
                     'user': user
                 })
         
-        return results
\ No newline at end of file
+        next_before_id = rating_ids[-1] if has_more else None
+        return results, next_before_id
+
+    def get_friends_recent_ratings(self, user_id, limit=20, loader=None):
+        """
+        Récupère les notes récentes des amis d'un utilisateur.
+        C'est comme le fil d'actualité d'Instagram/TikTok mais pour les critiques musicales !
+        loader : chargeur par lots de la requête en cours (optionnel)
+        """
+        results, _ = self.get_friends_timeline(user_id, limit, loader=loader)
+        return results
+
+    def trim_timelines(self, keep=500):
+        """Raccourcit les fils d'actualité trop longs (garde les `keep` notes les plus récentes de chacun)"""
+        assert isinstance(keep, int) and keep > 0, "keep doit être un entier positif"
+        
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = trim_timelines(conn.cursor(), keep)
+            conn.commit()
+        finally:
+            conn.close()
+        return deleted
+    
+    # ========== ÉTAT DES TÂCHES PÉRIODIQUES ==========
+    
+    def get_job_state(self, name, default=None):
+        """Lit une valeur de la table job_state (état des tâches périodiques)"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute('SELECT value FROM job_state WHERE name = ?', (name,)).fetchone()
+        finally:
+            conn.close()
+        return row['value'] if row else default
+    
+    def set_job_state(self, name, value):
+        """Enregistre une valeur dans la table job_state"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                INSERT INTO job_state (name, value) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+            ''', (name, value))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    # ========== RAFRAÎCHISSEMENT DES DONNÉES SPOTIFY ==========
+    
+    def add_view_counts(self, table, counts):
+        """Ajoute des vues aux compteurs. counts : {id: nombre de vues}"""
+        assert table in ('albums', 'artists'), "Table invalide"
+        conn = self.get_connection()
+        try:
+            conn.executemany(f'UPDATE {table} SET view_count = view_count + ? WHERE id = ?',
+                             [(views, row_id) for row_id, views in counts.items()])
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_refresh_candidates(self, table, limit, synced_before):
+        """
+        Les lignes de `table` à rafraîchir depuis Spotify : jamais synchronisées ou synchronisées
+        avant synced_before (secondes depuis 1970), les plus vues d'abord, puis les plus anciennes.
+        Retourne une liste d'objets Album ou Artist.
+        """
+        assert table in ('albums', 'artists'), "Table invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
+        
+        conn = self.get_connection()
+        try:
+            rows = conn.execute(f'''
+                SELECT * FROM {table}
+                WHERE spotify_id IS NOT NULL
+                  AND (last_synced_at IS NULL OR last_synced_at < ?)
+                ORDER BY view_count DESC, last_synced_at
+                LIMIT ?
+            ''', (synced_before, limit)).fetchall()
+        finally:
+            conn.close()
+        from_row = self._album_from_row if table == 'albums' else self._artist_from_row
+        return [from_row(row) for row in rows]
+    
+    def save_refreshed_metadata(self, table, changed, synced_ids):
+        """
+        Enregistre le résultat d'un rafraîchissement, en une transaction :
+        - changed : {id: {'name', 'image_url', 'genres'}} des lignes qui ont changé chez Spotify
+          (seules ces lignes sont réécrites, avec leurs genres) ;
+        - synced_ids : toutes les lignes vérifiées, dont on met à jour last_synced_at.
+        """
+        assert table in ('albums', 'artists'), "Table invalide"
+        name_column = 'title' if table == 'albums' else 'name'
+        link_table, owner_column = ('album_genres', 'album_id') if table == 'albums' else ('artist_genres', 'artist_id')
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor.executemany(
+                f'UPDATE {table} SET {name_column} = ?, image_url = ?, genres = ? WHERE id = ?',
+                [(data['name'], data['image_url'], ','.join(data['genres']) if data['genres'] else None, row_id)
+                 for row_id, data in changed.items()]
+            )
+            for row_id, data in changed.items():
+                save_genres(cursor, link_table, owner_column, row_id, data['genres'])
+            cursor.executemany(f'UPDATE {table} SET last_synced_at = ? WHERE id = ?',
+                               [(time.time(), row_id) for row_id in synced_ids])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.invalidate_entities(table, changed)
\ No newline at end of file
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Import de la discographie complète d'un artiste depuis Spotify, en quelques gros appels :
+1. liste : toutes les pages de albums + singles de l'artiste ;
+2. dédoublonnage : une seule requête pour savoir quels spotify_id sont déjà dans la base ;
+3. détails : les albums manquants par paquets de 20 (appel groupé /albums de Spotify) ;
+4. insertion : une seule transaction (executemany) pour les albums, leurs genres et leurs pistes.
+Chaque étape est chronométrée, pour savoir où part le temps.
+
+NewReleasesIngester fait la même chose pour les nouveautés de Spotify (tâche planifiée) :
+les albums et leurs artistes sont dans la base avant que quelqu'un les cherche.
+
+MetadataRefresher remet à jour petit à petit les noms, images et genres déjà en base.
+"""
+
+import time
+
+from spotify_api import ALBUMS_PER_REQUEST, ARTISTS_PER_REQUEST, full_release_date
+
+
+class DiscographyImporter:
+    """Importe les albums d'un artiste Spotify dans la base"""
+
+    def __init__(self, db, spotify):
+        self.db = db
+        self.spotify = spotify
+
+    def run(self, artist_id, spotify_artist_id):
+        """
+        artist_id : l'ID de l'artiste dans notre base
+        spotify_artist_id : son ID Spotify
+        Retourne un rapport : {'found', 'already_known', 'fetched', 'added', 'timings': {étape: secondes}}
+        """
+        assert isinstance(artist_id, int) and artist_id > 0, "Artist ID invalide"
+        assert isinstance(spotify_artist_id, str) and spotify_artist_id, "Spotify artist ID invalide"
+
+        timings = {}
+
+        started = time.perf_counter()
+        listing = self.spotify.get_artist_discography(spotify_artist_id)
+        timings['list'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        known = self.db.get_existing_album_spotify_ids(album['id'] for album in listing)
+        new_ids = [album['id'] for album in listing if album['id'] not in known]
+        timings['dedupe'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        details = self.spotify.get_albums_details(new_ids) if new_ids else {}
+        timings['details'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        # Même ordre que la discographie de Spotify (les albums introuvables sont ignorés)
+        created = self.db.bulk_create_albums(
+            artist_id, [details[spotify_id] for spotify_id in new_ids if spotify_id in details]
+        )
+        timings['insert'] = time.perf_counter() - started
+
+        return {
+            'found': len(listing),
+            'already_known': len(known),
+            'fetched': len(details),
+            'added': len(created),
+            'timings': {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        }
+
+
+HIGH_WATER_MARK = 'new_releases:high_water_mark'  # Nom de l'état dans la table job_state
+
+
+class NewReleasesIngester:
+    """
+    Ajoute à la base les nouvelles sorties Spotify (albums + artistes manquants).
+    On garde la date de sortie la plus récente déjà vue (high-water mark, toujours au format AAAA-MM-JJ) :
+    la fois suivante, on arrête de parcourir les pages dès qu'une page entière est plus ancienne.
+    Les réponses de Spotify passent par son cache : les pages d'albums et d'artistes sont déjà chaudes.
+    """
+
+    def __init__(self, db, spotify):
+        self.db = db
+        self.spotify = spotify
+
+    def run(self):
+        """Retourne un rapport : {'pages', 'found', 'already_known', 'artists_added', 'added', 'high_water_mark', 'timings'}"""
+        timings = {}
+        # (une ancienne valeur a pu être enregistrée sans être complétée)
+        high_water_mark = full_release_date(self.db.get_job_state(HIGH_WATER_MARK, ''))
+
+        started = time.perf_counter()
+        listing = {}
+        pages = 0
+        for page in self.spotify.iter_new_releases():
+            pages += 1
+            listing.update((album['id'], album) for album in page)
+            # Spotify trie à peu près par date : une page entièrement plus ancienne = déjà vue
+            if high_water_mark and all(album['release_day'] < high_water_mark for album in page):
+                break
+        timings['list'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        known = self.db.get_existing_album_spotify_ids(listing)
+        new_ids = [spotify_id for spotify_id in listing if spotify_id not in known]
+        timings['dedupe'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        details = self.spotify.get_albums_details(new_ids) if new_ids else {}
+        albums = [details[spotify_id] for spotify_id in new_ids if spotify_id in details]
+        timings['details'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        artist_ids = self.db.get_artist_ids_by_spotify_ids(album['artist_id'] for album in albums)
+        missing = list(dict.fromkeys(album['artist_id'] for album in albums if album['artist_id'] not in artist_ids))
+        artists = self.spotify.get_artists_details(missing) if missing else {}
+        # Artiste introuvable en détail : on le crée quand même avec le nom donné par l'album
+        names = {album['artist_id']: album['artist'] for album in albums}
+        created_artists = self.db.bulk_create_artists(
+            [artists.get(spotify_id, {'id': spotify_id, 'name': names[spotify_id]}) for spotify_id in missing]
+        )
+        # Relecture : un autre processus a pu créer certains de ces artistes entre-temps
+        artist_ids.update(self.db.get_artist_ids_by_spotify_ids(missing))
+        timings['artists'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        created = self.db.bulk_create_albums(artist_ids, albums)
+        timings['insert'] = time.perf_counter() - started
+
+        dates = [album['release_day'] for album in listing.values() if album['release_day']]
+        if dates and max(dates) > high_water_mark:
+            high_water_mark = max(dates)
+            self.db.set_job_state(HIGH_WATER_MARK, high_water_mark)
+
+        return {
+            'pages': pages,
+            'found': len(listing),
+            'already_known': len(known),
+            'artists_added': len(created_artists),
+            'added': len(created),
+            'high_water_mark': high_water_mark,
+            'timings': {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        }
+
+
+REFRESH_AFTER = 30 * 24 * 60 * 60  # Une ligne synchronisée il y a moins de 30 jours n'est pas rafraîchie
+
+
+class MetadataRefresher:
+    """
+    Rafraîchit depuis Spotify les artistes et albums de la base, sans tout re-parcourir :
+    à chaque passage, on prend les lignes périmées les plus vues, dans la limite d'un budget
+    d'appels à Spotify (appels groupés : 50 artistes ou 20 albums par appel, sans les pages
+    de pistes ni nouvelles tentatives : au plus `budget` requêtes HTTP, même quand Spotify
+    répond mal), et on ne réécrit que celles qui ont vraiment changé.
+    """
+
+    def __init__(self, db, spotify):
+        self.db = db
+        self.spotify = spotify
+
+    def run(self, budget=10, refresh_after=REFRESH_AFTER):
+        """
+        budget : nombre maximum de requêtes HTTP à Spotify (partagé entre artistes et albums) ;
+        un paquet en échec n'est pas réessayé : ses lignes restent périmées pour le prochain passage
+        Retourne {'artists': {'checked', 'changed'}, 'albums': {'checked', 'changed'}, 'timings'}
+        """
+        assert isinstance(budget, int) and budget >= 2, "Le budget doit être d'au moins 2 appels"
+        synced_before = time.time() - refresh_after
+        artist_calls = budget // 2
+        report = {'timings': {}}
+
+        started = time.perf_counter()
+        report['artists'] = self._refresh('artists', artist_calls * ARTISTS_PER_REQUEST, synced_before,
+                                          lambda ids: self.spotify.get_artists_details(ids, fresh=True, retry=False),
+                                          lambda artist: artist.name)
+        report['timings']['artists'] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        report['albums'] = self._refresh('albums', (budget - artist_calls) * ALBUMS_PER_REQUEST, synced_before,
+                                         lambda ids: self.spotify.get_albums_metadata(ids, retry=False),
+                                         lambda album: album.title)
+        report['timings']['albums'] = round(time.perf_counter() - started, 3)
+        return report
+
+    def _refresh(self, table, limit, synced_before, fetch, name_of):
+        rows = self.db.get_refresh_candidates(table, limit, synced_before)
+        if not rows:
+            return {'checked': 0, 'changed': 0}
+
+        fetched = fetch([row.spotify_id for row in rows])
+        changed = {}
+        for row in rows:
+            data = fetched.get(row.spotify_id)
+            if data is None:
+                continue  # Introuvable (ou erreur) : on réessaiera au prochain passage
+            current = {'name': name_of(row), 'image_url': row.image_url, 'genres': row.genres}
+            latest = {'name': data['name'], 'image_url': data['image_url'], 'genres': data.get('genres') or []}
+            if latest != current:
+                changed[row.id] = latest
+
+        synced_ids = [row.id for row in rows if row.spotify_id in fetched]
+        self.db.save_refreshed_metadata(table, changed, synced_ids)
+        return {'checked': len(synced_ids), 'changed': len(changed)}
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+"""
+File de tâches en arrière-plan, stockée dans la base SQLite (table jobs) : pas de serveur externe.
+
+Une route web ajoute une tâche (enqueue) et répond tout de suite ; des threads "workers"
+prennent les tâches une par une et les exécutent. Si une tâche plante, elle est retentée
+plus tard (attente de plus en plus longue), jusqu'à max_attempts fois.
+Comme tout est dans la base, une tâche survit à un redémarrage du serveur.
+Des tâches peuvent aussi être planifiées (schedule) : elles sont ajoutées toutes les N secondes.
+
+Pour lancer des workers dans un processus à part : flask run-jobs
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+
+
+BACKOFF_BASE = 5  # Première nouvelle tentative après ~5 s, puis 10, 20, 40...
+BACKOFF_MAX = 15 * 60  # Jamais plus de 15 minutes d'attente
+POLL_INTERVAL = 2  # Toutes les combien de secondes un worker inactif regarde s'il y a du travail
+STALE_AFTER = 30 * 60  # Une tâche "running" depuis plus longtemps : son worker est mort, on la relance
+SCHEDULE_CHECK = 60  # Toutes les combien de secondes on regarde si une tâche planifiée doit être ajoutée
+
+
+class JobQueue:
+    """File de tâches durable + pool de workers"""
+
+    def __init__(self, db, workers=2):
+        self.db = db
+        self.workers = workers
+        self.handlers = {}  # kind -> fonction(payload) qui retourne un résultat JSON
+        self.schedules = {}  # kind -> (intervalle en secondes, payload) des tâches périodiques
+        self._next_schedule_check = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def handler(self, kind):
+        """Décorateur : @queue.handler('import_discography') enregistre la fonction de ce type de tâche"""
+        def register(function):
+            self.handlers[kind] = function
+            return function
+        return register
+
+    def schedule(self, kind, interval, payload=None):
+        """
+        Planifie une tâche périodique : elle est ajoutée toutes les `interval` secondes.
+        La date de la prochaine exécution est dans la base (job_state), partagée par tous
+        les processus du serveur : un seul d'entre eux ajoute la tâche.
+        """
+        assert kind in self.handlers, f"Type de tâche inconnu: {kind}"
+        assert interval > 0, "interval doit être positif"
+        self.schedules[kind] = (interval, payload or {})
+    
+    # ========== AJOUT ET SUIVI DES TÂCHES ==========
+
+    def enqueue(self, kind, payload, dedupe_key=None, max_attempts=5, delay=0):
+        """
+        Ajoute une tâche. Si une tâche avec la même dedupe_key est déjà en attente ou en cours,
+        on n'en crée pas de nouvelle et on retourne l'id de l'existante.
+        """
+        assert kind in self.handlers, f"Type de tâche inconnu: {kind}"
+        assert isinstance(max_attempts, int) and max_attempts > 0, "max_attempts doit être positif"
+
+        conn = self.db.get_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    '''INSERT INTO jobs (kind, payload, max_attempts, run_after, dedupe_key)
+                       VALUES (?, ?, ?, ?, ?)''',
+                    (kind, json.dumps(payload), max_attempts, time.time() + delay, dedupe_key)
+                )
+                conn.commit()
+                job_id = cursor.lastrowid
+            except sqlite3.IntegrityError:
+                # Index unique partiel idx_jobs_dedupe : la même tâche attend déjà
+                conn.rollback()
+                cursor.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('pending', 'running')",
+                    (dedupe_key,)
+                )
+                row = cursor.fetchone()
+                if row is None:  # Elle vient de se terminer entre les deux requêtes : on réessaie
+                    return self.enqueue(kind, payload, dedupe_key, max_attempts, delay)
+                job_id = row['id']
+        finally:
+            conn.close()
+
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def get_job(self, job_id):
+        """Retourne l'état d'une tâche (dictionnaire) ou None si elle n'existe pas"""
+        conn = self.db.get_connection()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'max_attempts': row['max_attempts'],
+            'last_error': row['last_error'],
+            'result': json.loads(row['result']) if row['result'] else None,
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    def stats(self):
+        """Nombre de tâches par état + workers actifs (pour /metrics)"""
+        conn = self.db.get_connection()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) AS count FROM jobs GROUP BY status').fetchall()
+        finally:
+            conn.close()
+        stats = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        stats.update({row['status']: row['count'] for row in rows})
+        stats['workers'] = sum(thread.is_alive() for thread in self._threads)
+        return stats
+
+    # ========== WORKERS ==========
+
+    def start(self):
+        """Démarre les workers s'ils ne tournent pas déjà (dans ce processus)"""
+        with self._lock:
+            if self._pid == os.getpid() and any(thread.is_alive() for thread in self._threads):
+                return
+            # Après un fork, les threads du parent n'existent pas dans l'enfant : on repart de zéro
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._requeue_stale()
+            self._threads = [
+                threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        """Demande aux workers de s'arrêter après leur tâche en cours"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_forever(self):
+        """Lance les workers et attend (utilisé par flask run-jobs)"""
+        self.start()
+        try:
+            while not self._stop.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _work(self):
+        while not self._stop.is_set():
+            self._enqueue_due()
+            job = self._claim()
+            if job is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _enqueue_due(self):
+        """Ajoute les tâches planifiées dont l'heure est venue (au plus une vérification par SCHEDULE_CHECK)"""
+        with self._lock:
+            now = time.monotonic()
+            if not self.schedules or now < self._next_schedule_check:
+                return
+            self._next_schedule_check = now + SCHEDULE_CHECK
+        
+        conn = self.db.get_connection()
+        try:
+            # Lecture de la date prévue et ajout de la tâche dans la même transaction :
+            # deux processus qui vérifient en même temps n'ajoutent pas la tâche deux fois
+            conn.execute('BEGIN IMMEDIATE')
+            for kind, (interval, payload) in self.schedules.items():
+                name = f'schedule:{kind}'
+                row = conn.execute('SELECT value FROM job_state WHERE name = ?', (name,)).fetchone()
+                if row is not None and float(row['value']) > time.time():
+                    continue
+                # OR IGNORE : si la tâche précédente tourne encore (même dedupe_key), on ne l'ajoute pas
+                conn.execute('''
+                    INSERT OR IGNORE INTO jobs (kind, payload, max_attempts, run_after, dedupe_key)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (kind, json.dumps(payload), 3, time.time(), name))
+                conn.execute('''
+                    INSERT INTO job_state (name, value) VALUES (?, ?)
+                    ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+                ''', (name, str(time.time() + interval)))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"⚠️  Erreur de la planification des tâches: {e}")
+        finally:
+            conn.close()
+    
+    def _claim(self):
+        """Prend la prochaine tâche prête et la passe en 'running' (une seule transaction)"""
+        conn = self.db.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT * FROM jobs
+                WHERE status = 'pending' AND run_after <= ?
+                ORDER BY run_after
+                LIMIT 1
+            ''', (time.time(),)).fetchone()
+            if row is not None:
+                conn.execute('''
+                    UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                                    locked_at = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (time.time(), row['id']))
+            conn.commit()
+            return row
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"⚠️  Erreur de la file de tâches: {e}")
+            return None
+        finally:
+            conn.close()
+
+    def _run(self, job):
+        attempts = job['attempts'] + 1
+        try:
+            result = self.handlers[job['kind']](json.loads(job['payload']))
+        except Exception as e:
+            print(f"⚠️  Tâche {job['id']} ({job['kind']}) en échec, tentative {attempts}: {e}")
+            self._fail(job, attempts, ''.join(traceback.format_exception_only(type(e), e)).strip())
+            return
+
+        conn = self.db.get_connection()
+        try:
+            conn.execute('''
+                UPDATE jobs SET status = 'done', result = ?, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (json.dumps(result), job['id']))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _fail(self, job, attempts, error):
+        """Nouvelle tentative plus tard (backoff exponentiel + un peu de hasard), ou abandon"""
+        conn = self.db.get_connection()
+        try:
+            if attempts >= job['max_attempts']:
+                conn.execute('''
+                    UPDATE jobs SET status = 'failed', last_error = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (error, job['id']))
+            else:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+                delay *= random.uniform(0.5, 1.5)  # Le hasard évite que toutes les tâches repartent ensemble
+                conn.execute('''
+                    UPDATE jobs SET status = 'pending', last_error = ?, run_after = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (error, time.time() + delay, job['id']))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _requeue_stale(self):
+        """Les tâches restées 'running' trop longtemps (serveur arrêté en plein travail) repartent"""
+        conn = self.db.get_connection()
+        try:
+            conn.execute('''
+                UPDATE jobs SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND locked_at < ?
+            ''', (time.time() - STALE_AFTER,))
+            conn.commit()
+        finally:
+            conn.close()
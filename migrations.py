@@ -0,0 +1,1047 @@
+# -*- coding: utf-8 -*-
+
+"""
+Les migrations du schéma de la base de données.
+Chaque migration est une petite fonction qui fait évoluer le schéma d'une version à la suivante.
+Le numéro de la version actuelle est rangé dans la base elle-même (PRAGMA user_version) :
+au démarrage, on n'exécute que les migrations qui manquent, et si la base est déjà à jour
+on ne touche à rien (aucun CREATE TABLE, aucun PRAGMA table_info).
+"""
+
+
+def migration_001_initial_schema(cursor):
+    """
+    Crée toutes les tables de base si elles n'existent pas.
+    C'est comme créer les différentes sections d'un classeur.
+    Tout est en "IF NOT EXISTS" : ça marche aussi sur les vieilles bases créées avant les migrations.
+    """
+    # ===== TABLE DES UTILISATEURS =====
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,  -- ID unique qui s'incrémente automatiquement
+            username TEXT UNIQUE NOT NULL,  -- Nom d'utilisateur (doit être unique)
+            email TEXT UNIQUE NOT NULL,  -- Email (doit être unique)
+            password_hash TEXT NOT NULL,  -- Mot de passe crypté (jamais en clair!)
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Date de création du compte
+            profile_image TEXT,  -- URL de l'image de profil (peut être vide)
+            bio TEXT,  -- Biographie de l'utilisateur
+            casino_tokens INTEGER DEFAULT 1000  -- Jetons de casino (système de points)
+        )
+    ''')
+    
+    # On vérifie si la colonne casino_tokens existe déjà, sinon on l'ajoute
+    # (utile pour les anciennes bases de données)
+    cursor.execute("PRAGMA table_info(users)")  # PRAGMA = commande spéciale SQLite
+    columns = [column[1] for column in cursor.fetchall()]  # On récupère les noms de colonnes
+    if 'casino_tokens' not in columns:  # Si la colonne n'existe pas
+        cursor.execute('ALTER TABLE users ADD COLUMN casino_tokens INTEGER DEFAULT 1000')
+    
+    # ===== TABLE DES ARTISTES =====
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,  -- Nom de l'artiste
+            spotify_id TEXT UNIQUE,  -- ID Spotify (pour synchroniser avec Spotify)
+            image_url TEXT,  -- Photo de l'artiste
+            genres TEXT  -- Les genres musicaux (stockés comme texte séparé par des virgules)
+        )
+    ''')
+    
+    # ===== TABLE DES ALBUMS =====
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS albums (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,  -- Titre de l'album
+            artist_id INTEGER NOT NULL,  -- Lien vers l'artiste (clé étrangère)
+            release_date TEXT,  -- Date de sortie
+            spotify_id TEXT UNIQUE,
+            image_url TEXT,  -- Pochette de l'album
+            genres TEXT,
+            FOREIGN KEY (artist_id) REFERENCES artists (id)  -- Lie cet album à un artiste
+        )
+    ''')
+    
+    # ===== TABLE DES NOTES =====
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,  -- Qui a mis cette note?
+            album_id INTEGER NOT NULL,  -- Sur quel album?
+            score REAL NOT NULL,  -- La note (nombre décimal entre 0 et 10)
+            review TEXT,  -- La critique écrite (optionnelle)
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (album_id) REFERENCES albums (id),
+            UNIQUE(user_id, album_id)  -- Un utilisateur ne peut noter qu'une fois le même album
+        )
+    ''')
+    
+    # ===== TABLE DES RÉPONSES AUX CRITIQUES =====
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS replies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rating_id INTEGER NOT NULL,  -- À quelle critique cette réponse répond?
+            user_id INTEGER NOT NULL,  -- Qui a écrit cette réponse?
+            content TEXT NOT NULL,  -- Le contenu de la réponse
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (rating_id) REFERENCES ratings (id) ON DELETE CASCADE,  -- Si on supprime la critique, on supprime aussi les réponses
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # ===== TABLE DES SUIVIS (qui suit qui?) =====
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS follows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            follower_id INTEGER NOT NULL,  -- Qui suit?
+            following_id INTEGER NOT NULL,  -- Qui est suivi?
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (follower_id) REFERENCES users (id),
+            FOREIGN KEY (following_id) REFERENCES users (id),
+            UNIQUE(follower_id, following_id)  -- On ne peut pas suivre 2 fois la même personne
+        )
+    ''')
+    
+    # ===== TABLE DES TAGS =====
+    # Les tags sont des mots-clés qu'on peut ajouter aux artistes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            artist_id INTEGER NOT NULL,  -- Sur quel artiste?
+            tag_name TEXT NOT NULL,  -- Le nom du tag (ex: "rock", "années 80")
+            user_id INTEGER NOT NULL,  -- Qui a ajouté ce tag?
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (artist_id) REFERENCES artists (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # ===== TABLE DES ALBUMS FAVORIS =====
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS favorite_albums (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            album_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,  -- Position dans le top (1er, 2ème, etc.)
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (album_id) REFERENCES albums (id),
+            UNIQUE(user_id, album_id)
+        )
+    ''')
+    
+    # ===== INDEX POUR AMÉLIORER LES PERFORMANCES =====
+    # Un index, c'est comme un sommaire : ça permet de trouver plus vite les infos
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_replies_rating_id 
+        ON replies(rating_id)
+    ''')
+
+
+def migration_002_secondary_indexes(cursor):
+    """
+    Ajoute les index qui manquaient sur les colonnes qu'on filtre ou regroupe tout le temps.
+    Sans eux, chaque GROUP BY ou chaque recherche "par album" parcourt toute la table.
+    """
+    # Les notes d'un album (moyennes, classements, page album)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_album_id ON ratings(album_id)')
+    # L'historique d'un utilisateur, trié par date (profil, fil d'actualité)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_user_created ON ratings(user_id, created_at)')
+    # Les notes les plus récentes, tous utilisateurs confondus
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_created_at ON ratings(created_at)')
+    # "Qui me suit ?" (l'index UNIQUE existant ne sert que pour "qui je suis")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_follows_following_id ON follows(following_id)')
+    # Les tags d'un artiste, déjà regroupés par nom
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tags_artist_tag ON tags(artist_id, tag_name)')
+    # Les albums d'un artiste
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_albums_artist_id ON albums(artist_id)')
+
+
+
+# ===== STATISTIQUES DES ALBUMS (maintenues par des triggers) =====
+
+# La note en dixièmes (7.5 → 75) : des entiers s'additionnent et se soustraient sans erreur d'arrondi
+SCORE_TENTHS_SQL = 'CAST(ROUND({row}.score * 10) AS INTEGER)'
+
+
+def _album_stats_add_sql(row):
+    """SQL qui ajoute la note `row` (NEW) aux statistiques de son album"""
+    tenths = SCORE_TENTHS_SQL.format(row=row)
+    return f'''
+        INSERT INTO album_stats (album_id, score_tenths, rating_count, avg_score, last_rated_at)
+        VALUES ({row}.album_id, {tenths}, 1, {tenths} / 10.0, {row}.created_at)
+        ON CONFLICT(album_id) DO UPDATE SET
+            score_tenths = score_tenths + excluded.score_tenths,
+            rating_count = rating_count + 1,
+            avg_score = (score_tenths + excluded.score_tenths) / (10.0 * (rating_count + 1)),
+            last_rated_at = MAX(COALESCE(last_rated_at, ''), COALESCE(excluded.last_rated_at, ''));
+        INSERT INTO album_score_histogram (album_id, bucket, count)
+        VALUES ({row}.album_id, CAST({row}.score AS INTEGER), 1)
+        ON CONFLICT(album_id, bucket) DO UPDATE SET count = count + 1;
+    '''
+
+
+def _album_stats_remove_sql(row):
+    """SQL qui retire la note `row` (OLD) des statistiques de son album"""
+    tenths = SCORE_TENTHS_SQL.format(row=row)
+    return f'''
+        UPDATE album_stats SET
+            score_tenths = score_tenths - {tenths},
+            rating_count = rating_count - 1,
+            avg_score = CASE WHEN rating_count > 1
+                             THEN (score_tenths - {tenths}) / (10.0 * (rating_count - 1)) END,
+            last_rated_at = (SELECT MAX(created_at) FROM ratings WHERE album_id = {row}.album_id)
+        WHERE album_id = {row}.album_id;
+        DELETE FROM album_stats WHERE album_id = {row}.album_id AND rating_count <= 0;
+        UPDATE album_score_histogram SET count = count - 1
+        WHERE album_id = {row}.album_id AND bucket = CAST({row}.score AS INTEGER);
+        DELETE FROM album_score_histogram
+        WHERE album_id = {row}.album_id AND bucket = CAST({row}.score AS INTEGER) AND count <= 0;
+    '''
+
+
+def rebuild_album_stats(cursor):
+    """
+    Recalcule entièrement album_stats et l'histogramme des notes à partir de la table ratings.
+    Sert à remplir les tables la première fois, et à tout remettre d'aplomb si besoin.
+    La moyenne est calculée exactement comme dans les triggers : on retrouve les mêmes valeurs.
+    """
+    tenths = SCORE_TENTHS_SQL.format(row='ratings')
+    cursor.execute('DELETE FROM album_stats')
+    cursor.execute('DELETE FROM album_score_histogram')
+    cursor.execute(f'''
+        INSERT INTO album_stats (album_id, score_tenths, rating_count, avg_score, last_rated_at)
+        SELECT album_id, SUM({tenths}), COUNT(*), SUM({tenths}) / (10.0 * COUNT(*)), MAX(created_at)
+        FROM ratings
+        GROUP BY album_id
+    ''')
+    cursor.execute('''
+        INSERT INTO album_score_histogram (album_id, bucket, count)
+        SELECT album_id, CAST(score AS INTEGER), COUNT(*)
+        FROM ratings
+        GROUP BY album_id, CAST(score AS INTEGER)
+    ''')
+
+
+# Version d'origine (migration 003, somme en REAL), remplacée par la migration 015.
+# Gardée telle quelle : une base neuve passe toujours par toutes les migrations dans l'ordre.
+
+def _album_stats_add_sql_v3(row):
+    """SQL qui ajoute la note `row` (NEW) aux statistiques de son album"""
+    return f'''
+        INSERT INTO album_stats (album_id, score_sum, rating_count, avg_score, last_rated_at)
+        VALUES ({row}.album_id, {row}.score, 1, {row}.score, {row}.created_at)
+        ON CONFLICT(album_id) DO UPDATE SET
+            score_sum = score_sum + excluded.score_sum,
+            rating_count = rating_count + 1,
+            avg_score = (score_sum + excluded.score_sum) / (rating_count + 1),
+            last_rated_at = MAX(COALESCE(last_rated_at, ''), COALESCE(excluded.last_rated_at, ''));
+        INSERT INTO album_score_histogram (album_id, bucket, count)
+        VALUES ({row}.album_id, CAST({row}.score AS INTEGER), 1)
+        ON CONFLICT(album_id, bucket) DO UPDATE SET count = count + 1;
+    '''
+
+
+def _album_stats_remove_sql_v3(row):
+    """SQL qui retire la note `row` (OLD) des statistiques de son album"""
+    return f'''
+        UPDATE album_stats SET
+            score_sum = score_sum - {row}.score,
+            rating_count = rating_count - 1,
+            avg_score = CASE WHEN rating_count > 1
+                             THEN (score_sum - {row}.score) / (rating_count - 1) END,
+            last_rated_at = (SELECT MAX(created_at) FROM ratings WHERE album_id = {row}.album_id)
+        WHERE album_id = {row}.album_id;
+        DELETE FROM album_stats WHERE album_id = {row}.album_id AND rating_count <= 0;
+        UPDATE album_score_histogram SET count = count - 1
+        WHERE album_id = {row}.album_id AND bucket = CAST({row}.score AS INTEGER);
+        DELETE FROM album_score_histogram
+        WHERE album_id = {row}.album_id AND bucket = CAST({row}.score AS INTEGER) AND count <= 0;
+    '''
+
+
+def _rebuild_album_stats_v3(cursor):
+    """Remplit album_stats avec son schéma d'origine (score_sum REAL)"""
+    cursor.execute('DELETE FROM album_stats')
+    cursor.execute('DELETE FROM album_score_histogram')
+    cursor.execute('''
+        INSERT INTO album_stats (album_id, score_sum, rating_count, avg_score, last_rated_at)
+        SELECT album_id, SUM(score), COUNT(*), AVG(score), MAX(created_at)
+        FROM ratings
+        GROUP BY album_id
+    ''')
+    cursor.execute('''
+        INSERT INTO album_score_histogram (album_id, bucket, count)
+        SELECT album_id, CAST(score AS INTEGER), COUNT(*)
+        FROM ratings
+        GROUP BY album_id, CAST(score AS INTEGER)
+    ''')
+
+
+def migration_003_album_stats(cursor):
+    """
+    Ajoute une table album_stats (somme, nombre, moyenne, date de la dernière note) et
+    l'histogramme des notes par album. Des triggers les tiennent à jour à chaque
+    INSERT / UPDATE / DELETE sur ratings : plus besoin de recalculer AVG() sur toute la table.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS album_stats (
+            album_id INTEGER PRIMARY KEY,
+            score_sum REAL NOT NULL DEFAULT 0,  -- Somme de toutes les notes
+            rating_count INTEGER NOT NULL DEFAULT 0,  -- Nombre de notes
+            avg_score REAL,  -- score_sum / rating_count (gardé pour pouvoir l'indexer)
+            last_rated_at TIMESTAMP  -- Date de la note la plus récente
+        )
+    ''')
+    # Les classements ne gardent que les albums avec au moins 3 notes : index partiel
+    # (les requêtes doivent reprendre exactement "rating_count >= 3" pour qu'il serve)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_album_stats_ranking
+        ON album_stats(avg_score, rating_count)
+        WHERE rating_count >= 3
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS album_score_histogram (
+            album_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,  -- Partie entière de la note (0 à 10)
+            count INTEGER NOT NULL,
+            PRIMARY KEY (album_id, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ratings_album_stats_insert
+        AFTER INSERT ON ratings
+        BEGIN
+            {_album_stats_add_sql_v3('NEW')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ratings_album_stats_update
+        AFTER UPDATE OF score, album_id ON ratings
+        BEGIN
+            {_album_stats_remove_sql_v3('OLD')}
+            {_album_stats_add_sql_v3('NEW')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_ratings_album_stats_delete
+        AFTER DELETE ON ratings
+        BEGIN
+            {_album_stats_remove_sql_v3('OLD')}
+        END
+    ''')
+
+    _rebuild_album_stats_v3(cursor)
+
+
+# ===== RECHERCHE PLEIN TEXTE (FTS5) =====
+
+# unicode61 + remove_diacritics : "Beyonce" trouve "Beyoncé", "electro" trouve "Électro"...
+# prefix : index supplémentaires pour que les recherches "déb*" restent rapides
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+
+def _albums_fts_insert_sql(where):
+    """SQL qui indexe les albums qui vérifient `where`"""
+    return f'''
+        INSERT INTO albums_fts (rowid, title, artist_name, genres, tags)
+        SELECT albums.id, albums.title, artists.name,
+               COALESCE(albums.genres, '') || ',' || COALESCE(artists.genres, ''),
+               (SELECT group_concat(DISTINCT tag_name) FROM tags WHERE tags.artist_id = albums.artist_id)
+        FROM albums
+        LEFT JOIN artists ON artists.id = albums.artist_id
+        WHERE {where}
+    '''
+
+
+def _albums_fts_refresh_sql(where):
+    """SQL (pour un trigger) qui réécrit les documents de recherche des albums qui vérifient `where`"""
+    return f'''
+        DELETE FROM albums_fts WHERE rowid IN (SELECT id FROM albums WHERE {where});
+        {_albums_fts_insert_sql(where)};
+    '''
+
+
+def _artists_fts_insert_sql(where):
+    """SQL qui indexe les artistes qui vérifient `where`"""
+    return f'''
+        INSERT INTO artists_fts (rowid, name, genres, tags)
+        SELECT artists.id, artists.name, artists.genres,
+               (SELECT group_concat(DISTINCT tag_name) FROM tags WHERE tags.artist_id = artists.id)
+        FROM artists
+        WHERE {where}
+    '''
+
+
+def _artists_fts_refresh_sql(where):
+    """SQL (pour un trigger) qui réécrit les documents de recherche des artistes qui vérifient `where`"""
+    return f'''
+        DELETE FROM artists_fts WHERE rowid IN (SELECT id FROM artists WHERE {where});
+        {_artists_fts_insert_sql(where)};
+    '''
+
+
+def rebuild_search_index(cursor):
+    """Reconstruit entièrement les index de recherche à partir des tables"""
+    cursor.execute('DELETE FROM albums_fts')
+    cursor.execute('DELETE FROM artists_fts')
+    cursor.execute(_albums_fts_insert_sql('1'))
+    cursor.execute(_artists_fts_insert_sql('1'))
+
+
+def migration_004_search_index(cursor):
+    """
+    Ajoute deux index plein texte FTS5 (albums et artistes) : titres, noms d'artistes, genres, tags.
+    Le rowid de chaque document est l'id de l'album / de l'artiste.
+    Des triggers les gardent synchronisés avec albums, artists et tags.
+    """
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS albums_fts
+        USING fts5(title, artist_name, genres, tags, {FTS_OPTIONS})
+    ''')
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS artists_fts
+        USING fts5(name, genres, tags, {FTS_OPTIONS})
+    ''')
+
+    triggers = {
+        # Albums : le document de l'album lui-même
+        'trg_albums_fts_insert': ('AFTER INSERT ON albums',
+                                  _albums_fts_refresh_sql('albums.id = NEW.id')),
+        'trg_albums_fts_update': ('AFTER UPDATE OF title, artist_id, genres ON albums',
+                                  _albums_fts_refresh_sql('albums.id = NEW.id')),
+        'trg_albums_fts_delete': ('AFTER DELETE ON albums',
+                                  'DELETE FROM albums_fts WHERE rowid = OLD.id;'),
+        # Artistes : leur document, et ceux de leurs albums (qui contiennent leur nom et leurs genres)
+        'trg_artists_fts_insert': ('AFTER INSERT ON artists',
+                                   _artists_fts_refresh_sql('artists.id = NEW.id')),
+        'trg_artists_fts_update': ('AFTER UPDATE OF name, genres ON artists',
+                                   _artists_fts_refresh_sql('artists.id = NEW.id')
+                                   + _albums_fts_refresh_sql('albums.artist_id = NEW.id')),
+        'trg_artists_fts_delete': ('AFTER DELETE ON artists',
+                                   'DELETE FROM artists_fts WHERE rowid = OLD.id;'),
+        # Tags : ils sont posés sur un artiste, mais on les cherche aussi via ses albums
+        'trg_tags_fts_insert': ('AFTER INSERT ON tags',
+                                _artists_fts_refresh_sql('artists.id = NEW.artist_id')
+                                + _albums_fts_refresh_sql('albums.artist_id = NEW.artist_id')),
+        'trg_tags_fts_delete': ('AFTER DELETE ON tags',
+                                _artists_fts_refresh_sql('artists.id = OLD.artist_id')
+                                + _albums_fts_refresh_sql('albums.artist_id = OLD.artist_id')),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+    rebuild_search_index(cursor)
+
+
+# ===== GENRES NORMALISÉS =====
+
+def normalize_genres(genres):
+    """Nettoie une liste de genres : sans espaces autour, en minuscules, sans vides ni doublons"""
+    names = (genre.strip().lower() for genre in genres or [] if genre)
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def save_genres(cursor, link_table, owner_column, owner_id, genres):
+    """
+    Enregistre les genres d'un album ou d'un artiste dans les tables de liaison.
+    link_table / owner_column : 'album_genres' / 'album_id' ou 'artist_genres' / 'artist_id'
+    Les anciens liens de ce propriétaire sont remplacés par les nouveaux.
+    """
+    assert (link_table, owner_column) in (('album_genres', 'album_id'),
+                                          ('artist_genres', 'artist_id')), "Table de genres invalide"
+    names = normalize_genres(genres)
+    cursor.executemany('INSERT OR IGNORE INTO genres (name) VALUES (?)',
+                       [(name,) for name in names])
+    cursor.execute(f'DELETE FROM {link_table} WHERE {owner_column} = ?', (owner_id,))
+    cursor.executemany(
+        f'INSERT OR IGNORE INTO {link_table} ({owner_column}, genre_id) SELECT ?, id FROM genres WHERE name = ?',
+        [(owner_id, name) for name in names]
+    )
+
+
+def migration_005_normalized_genres(cursor):
+    """
+    Range les genres dans une vraie table (genres) reliée aux albums et aux artistes
+    par deux tables de liaison, au lieu d'un texte "rock,pop" qu'il faut découper en Python.
+    La colonne texte genres reste en place (les objets Album / Artist la lisent toujours).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS genres (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL  -- Nom du genre, en minuscules
+        )
+    ''')
+    for link_table, owner_column, owner_table in (('album_genres', 'album_id', 'albums'),
+                                                  ('artist_genres', 'artist_id', 'artists')):
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {link_table} (
+                {owner_column} INTEGER NOT NULL,
+                genre_id INTEGER NOT NULL,
+                PRIMARY KEY ({owner_column}, genre_id),
+                FOREIGN KEY ({owner_column}) REFERENCES {owner_table} (id),
+                FOREIGN KEY (genre_id) REFERENCES genres (id)
+            ) WITHOUT ROWID
+        ''')
+        # "Tous les albums de ce genre" : l'autre sens de la clé primaire
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{link_table}_genre
+            ON {link_table}(genre_id, {owner_column})
+        ''')
+
+        # On remplit les tables de liaison à partir des textes "rock,pop" existants
+        cursor.execute(f'SELECT id, genres FROM {owner_table} WHERE genres IS NOT NULL')
+        for owner_id, genres_str in cursor.fetchall():
+            save_genres(cursor, link_table, owner_column, owner_id, genres_str.split(','))
+
+
+# ===== ALBUMS SIMILAIRES ("les fans ont aussi aimé") =====
+
+def migration_006_album_neighbors(cursor):
+    """
+    Ajoute la table des voisins de chaque album (calculée hors-ligne par similarity.py)
+    et une table des notes modifiées depuis le dernier calcul, remplie par des triggers :
+    le calcul incrémental ne recalcule que les albums concernés.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS album_neighbors (
+            album_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,  -- 1 = le plus similaire
+            neighbor_id INTEGER NOT NULL,
+            score REAL NOT NULL,  -- Similarité cosinus (entre 0 et 1)
+            PRIMARY KEY (album_id, rank)
+        ) WITHOUT ROWID
+    ''')
+    # (utilisateur, album) dont la note a changé depuis le dernier calcul
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS similarity_dirty (
+            user_id INTEGER NOT NULL,
+            album_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, album_id)
+        ) WITHOUT ROWID
+    ''')
+
+    mark_new = 'INSERT OR IGNORE INTO similarity_dirty (user_id, album_id) VALUES (NEW.user_id, NEW.album_id);'
+    mark_old = 'INSERT OR IGNORE INTO similarity_dirty (user_id, album_id) VALUES (OLD.user_id, OLD.album_id);'
+    triggers = {
+        'trg_ratings_similarity_insert': ('AFTER INSERT ON ratings', mark_new),
+        'trg_ratings_similarity_update': ('AFTER UPDATE OF score, user_id, album_id ON ratings',
+                                          mark_old + mark_new),
+        'trg_ratings_similarity_delete': ('AFTER DELETE ON ratings', mark_old),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+
+# ===== FIL D'ACTUALITÉ DES AMIS ("fan-out à l'écriture") =====
+
+TIMELINE_PULL_FOLLOWERS = 1000  # À partir de ce nombre d'abonnés, un compte passe en mode "pull"
+TIMELINE_BACKFILL = 200  # Nombre de notes recopiées dans le fil quand on suit quelqu'un
+
+
+def migration_007_timeline(cursor):
+    """
+    Fil d'actualité matérialisé : une ligne (propriétaire du fil, note) par note d'une personne suivie.
+    Quand quelqu'un note un album, un trigger ajoute la note au fil de chacun de ses abonnés,
+    et la page /friends n'a plus qu'à lire son propre fil par clé primaire.
+    Les comptes très suivis (users.timeline_pull = 1) ne sont pas recopiés dans des milliers
+    de fils : leurs notes sont lues directement à l'affichage.
+    """
+    cursor.execute('ALTER TABLE users ADD COLUMN timeline_pull INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS timeline (
+            owner_id INTEGER NOT NULL,  -- À qui appartient le fil
+            rating_id INTEGER NOT NULL,  -- L'ordre des ids = l'ordre d'arrivée des notes
+            author_id INTEGER NOT NULL,  -- Qui a écrit la note (pour nettoyer au unfollow)
+            PRIMARY KEY (owner_id, rating_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_timeline_author ON timeline(author_id, rating_id)')
+    # (user_id) suivi implicitement de l'id : les notes d'un utilisateur, déjà triées par id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_user_id ON ratings(user_id)')
+
+    # Les comptes déjà très suivis passent tout de suite en mode "pull"
+    cursor.execute(f'''
+        UPDATE users SET timeline_pull = 1
+        WHERE (SELECT COUNT(*) FROM follows WHERE following_id = users.id) >= {TIMELINE_PULL_FOLLOWERS}
+    ''')
+    # Remplissage initial : les TIMELINE_BACKFILL dernières notes de chaque personne suivie
+    cursor.execute(f'''
+        INSERT OR IGNORE INTO timeline (owner_id, rating_id, author_id)
+        SELECT follower_id, rating_id, author_id FROM (
+            SELECT follows.follower_id, ratings.id AS rating_id, ratings.user_id AS author_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY follows.follower_id, ratings.user_id ORDER BY ratings.id DESC
+                   ) AS position
+            FROM follows
+            JOIN users ON users.id = follows.following_id AND users.timeline_pull = 0
+            JOIN ratings ON ratings.user_id = follows.following_id
+        )
+        WHERE position <= {TIMELINE_BACKFILL}
+    ''')
+
+    triggers = {
+        # Nouvelle note : elle arrive dans le fil de chaque abonné (sauf compte en mode "pull")
+        'trg_ratings_timeline_insert': ('AFTER INSERT ON ratings', '''
+            INSERT OR IGNORE INTO timeline (owner_id, rating_id, author_id)
+            SELECT follows.follower_id, NEW.id, NEW.user_id
+            FROM follows
+            JOIN users ON users.id = NEW.user_id AND users.timeline_pull = 0
+            WHERE follows.following_id = NEW.user_id;
+        '''),
+        'trg_ratings_timeline_delete': ('AFTER DELETE ON ratings', '''
+            DELETE FROM timeline WHERE author_id = OLD.user_id AND rating_id = OLD.id;
+        '''),
+        # Nouvel abonnement : le compte passe peut-être en mode "pull", sinon on recopie
+        # ses dernières notes dans le fil du nouvel abonné
+        'trg_follows_timeline_insert': ('AFTER INSERT ON follows', f'''
+            UPDATE users SET timeline_pull = 1
+            WHERE id = NEW.following_id AND timeline_pull = 0
+            AND (SELECT COUNT(*) FROM follows WHERE following_id = NEW.following_id) >= {TIMELINE_PULL_FOLLOWERS};
+            INSERT OR IGNORE INTO timeline (owner_id, rating_id, author_id)
+            SELECT NEW.follower_id, ratings.id, ratings.user_id
+            FROM ratings
+            JOIN users ON users.id = ratings.user_id AND users.timeline_pull = 0
+            WHERE ratings.user_id = NEW.following_id
+            ORDER BY ratings.id DESC
+            LIMIT {TIMELINE_BACKFILL};
+        '''),
+        'trg_follows_timeline_delete': ('AFTER DELETE ON follows', '''
+            DELETE FROM timeline WHERE owner_id = OLD.follower_id AND author_id = OLD.following_id;
+        '''),
+        # Passage en mode "pull" : ses notes sortent de tous les fils
+        'trg_users_timeline_pull': ('AFTER UPDATE OF timeline_pull ON users '
+                                    'WHEN NEW.timeline_pull = 1 AND OLD.timeline_pull = 0', '''
+            DELETE FROM timeline WHERE author_id = NEW.id;
+        '''),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+
+def trim_timelines(cursor, keep):
+    """Ne garde que les `keep` notes les plus récentes du fil de chaque utilisateur"""
+    cursor.execute('''
+        DELETE FROM timeline WHERE (owner_id, rating_id) IN (
+            SELECT owner_id, rating_id FROM (
+                SELECT owner_id, rating_id,
+                       ROW_NUMBER() OVER (PARTITION BY owner_id ORDER BY rating_id DESC) AS position
+                FROM timeline
+            )
+            WHERE position > ?
+        )
+    ''', (keep,))
+    return cursor.rowcount
+
+
+# ===== PISTES DES ALBUMS =====
+
+def save_tracks(cursor, album_id, tracks):
+    """
+    Enregistre la liste complète des pistes d'un album (remplace les anciennes).
+    Les triggers de la migration 8 tiennent à jour albums.total_duration_ms et albums.track_count.
+    """
+    cursor.execute('DELETE FROM tracks WHERE album_id = ?', (album_id,))
+    cursor.executemany(
+        '''INSERT OR IGNORE INTO tracks (album_id, disc_number, track_number, name, duration_ms, spotify_id)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        [(album_id, track.get('disc_number', 1), track['track_number'], track['name'],
+          track['duration_ms'], track.get('spotify_id')) for track in tracks]
+    )
+
+
+def migration_008_tracks(cursor):
+    """
+    Ajoute la table des pistes, remplie à l'import de l'album (toutes les pages de Spotify),
+    et la durée totale / le nombre de pistes précalculés dans albums.
+    Les pages album et tracklist n'appellent plus Spotify.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            album_id INTEGER NOT NULL,
+            disc_number INTEGER NOT NULL DEFAULT 1,  -- Pour les albums en plusieurs CD
+            track_number INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            duration_ms INTEGER NOT NULL,
+            spotify_id TEXT,
+            FOREIGN KEY (album_id) REFERENCES albums (id),
+            UNIQUE(album_id, disc_number, track_number)  -- Sert aussi d'index pour lire un album dans l'ordre
+        )
+    ''')
+    # NULL = pistes pas encore importées (à remplir avec flask backfill-tracks)
+    cursor.execute('ALTER TABLE albums ADD COLUMN total_duration_ms INTEGER')
+    cursor.execute('ALTER TABLE albums ADD COLUMN track_count INTEGER')
+
+    triggers = {
+        'trg_tracks_album_insert': ('AFTER INSERT ON tracks', '''
+            UPDATE albums SET total_duration_ms = COALESCE(total_duration_ms, 0) + NEW.duration_ms,
+                              track_count = COALESCE(track_count, 0) + 1
+            WHERE id = NEW.album_id;
+        '''),
+        'trg_tracks_album_delete': ('AFTER DELETE ON tracks', '''
+            UPDATE albums SET total_duration_ms = total_duration_ms - OLD.duration_ms,
+                              track_count = track_count - 1
+            WHERE id = OLD.album_id;
+        '''),
+        'trg_tracks_album_update': ('AFTER UPDATE OF duration_ms ON tracks', '''
+            UPDATE albums SET total_duration_ms = total_duration_ms - OLD.duration_ms + NEW.duration_ms
+            WHERE id = NEW.album_id;
+        '''),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+
+# ===== FILE DE TÂCHES EN ARRIÈRE-PLAN (jobs.py) =====
+
+def migration_009_jobs(cursor):
+    """
+    Ajoute la table des tâches en arrière-plan (imports Spotify...).
+    Une tâche en attente ou en cours ne peut exister qu'une fois par dedupe_key (index unique partiel).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,  -- Le type de tâche (ex : 'import_discography')
+            payload TEXT NOT NULL,  -- Les paramètres, en JSON
+            status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done ou failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_after REAL NOT NULL,  -- Pas avant cette date (secondes depuis 1970) : sert aux nouvelles tentatives
+            locked_at REAL,  -- Quand un worker l'a prise
+            dedupe_key TEXT,
+            last_error TEXT,
+            result TEXT,  -- Le résultat, en JSON
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Les workers cherchent la prochaine tâche prête : status = 'pending' trié par run_after
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after)')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key)
+        WHERE dedupe_key IS NOT NULL AND status IN ('pending', 'running')
+    ''')
+
+
+
+def migration_010_job_state(cursor):
+    """
+    Ajoute une petite table clé -> valeur pour l'état des tâches périodiques :
+    prochaine exécution de chaque tâche planifiée, "high-water mark" de l'ingestion
+    des nouveautés Spotify (jusqu'où on est déjà allé)...
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_state (
+            name TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+
+
+# ===== FRAÎCHEUR DES ARTISTES ET ALBUMS =====
+
+def migration_011_metadata_refresh(cursor):
+    """
+    Ajoute aux artistes et aux albums :
+    - last_synced_at : dernière mise à jour depuis Spotify (secondes depuis 1970, NULL = jamais) ;
+    - view_count : nombre de vues de la page, pour rafraîchir d'abord ce qui est le plus regardé.
+    """
+    for table in ('artists', 'albums'):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN last_synced_at REAL')
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN view_count INTEGER NOT NULL DEFAULT 0')
+        # Le rafraîchissement parcourt les lignes des plus vues aux moins vues, en sautant les récentes
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_refresh ON {table}(view_count, last_synced_at)')
+
+# ===== COMPTEURS DES UTILISATEURS (maintenus par des triggers) =====
+
+USER_STATS_COLUMNS = ('ratings_count', 'followers_count', 'following_count', 'replies_count')
+
+
+def _user_stats_add_sql(user_id, column):
+    """SQL qui ajoute 1 au compteur `column` de l'utilisateur `user_id` (crée sa ligne si besoin)"""
+    return f'''
+        INSERT INTO user_stats (user_id, {column}) VALUES ({user_id}, 1)
+        ON CONFLICT(user_id) DO UPDATE SET {column} = {column} + 1;
+    '''
+
+
+def _user_stats_remove_sql(user_id, column):
+    """SQL qui retire 1 au compteur `column` de l'utilisateur `user_id`"""
+    return f'UPDATE user_stats SET {column} = {column} - 1 WHERE user_id = {user_id};'
+
+
+def reconcile_user_stats(cursor):
+    """
+    Recalcule les compteurs de tous les utilisateurs depuis les tables ratings, follows et replies,
+    et ne corrige que les lignes fausses (ou manquantes). Retourne le nombre de lignes corrigées.
+    Sert à remplir la table la première fois, puis à vérifier de temps en temps que tout est juste.
+    """
+    # "WHERE true" : obligatoire pour que SQLite ne confonde pas ON CONFLICT avec une jointure
+    cursor.execute('''
+        INSERT INTO user_stats (user_id, ratings_count, followers_count, following_count, replies_count)
+        SELECT users.id,
+               COALESCE(r.count, 0), COALESCE(followers.count, 0),
+               COALESCE(following.count, 0), COALESCE(replies.count, 0)
+        FROM users
+        LEFT JOIN (SELECT user_id, COUNT(*) AS count FROM ratings GROUP BY user_id) r
+               ON r.user_id = users.id
+        LEFT JOIN (SELECT following_id, COUNT(*) AS count FROM follows GROUP BY following_id) followers
+               ON followers.following_id = users.id
+        LEFT JOIN (SELECT follower_id, COUNT(*) AS count FROM follows GROUP BY follower_id) following
+               ON following.follower_id = users.id
+        LEFT JOIN (SELECT user_id, COUNT(*) AS count FROM replies GROUP BY user_id) replies
+               ON replies.user_id = users.id
+        WHERE true
+        ON CONFLICT(user_id) DO UPDATE SET
+            ratings_count = excluded.ratings_count,
+            followers_count = excluded.followers_count,
+            following_count = excluded.following_count,
+            replies_count = excluded.replies_count
+        WHERE ratings_count != excluded.ratings_count
+           OR followers_count != excluded.followers_count
+           OR following_count != excluded.following_count
+           OR replies_count != excluded.replies_count
+    ''')
+    fixed = cursor.rowcount
+    # Lignes d'utilisateurs qui n'existent plus
+    cursor.execute('DELETE FROM user_stats WHERE user_id NOT IN (SELECT id FROM users)')
+    return fixed + cursor.rowcount
+
+
+def migration_012_user_stats(cursor):
+    """
+    Ajoute une table user_stats : nombre de notes, d'abonnés, d'abonnements et de réponses
+    de chaque utilisateur. Des triggers la tiennent à jour : l'en-tête d'un profil se lit
+    en une seule ligne (clé primaire) au lieu de trois COUNT(*).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            ratings_count INTEGER NOT NULL DEFAULT 0,
+            followers_count INTEGER NOT NULL DEFAULT 0,  -- Combien de personnes le suivent
+            following_count INTEGER NOT NULL DEFAULT 0,  -- Combien de personnes il suit
+            replies_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    triggers = {
+        'trg_ratings_user_stats_insert': ('AFTER INSERT ON ratings',
+                                          _user_stats_add_sql('NEW.user_id', 'ratings_count')),
+        'trg_ratings_user_stats_update': ('AFTER UPDATE OF user_id ON ratings',
+                                          _user_stats_remove_sql('OLD.user_id', 'ratings_count')
+                                          + _user_stats_add_sql('NEW.user_id', 'ratings_count')),
+        'trg_ratings_user_stats_delete': ('AFTER DELETE ON ratings',
+                                          _user_stats_remove_sql('OLD.user_id', 'ratings_count')),
+        'trg_follows_user_stats_insert': ('AFTER INSERT ON follows',
+                                          _user_stats_add_sql('NEW.following_id', 'followers_count')
+                                          + _user_stats_add_sql('NEW.follower_id', 'following_count')),
+        'trg_follows_user_stats_delete': ('AFTER DELETE ON follows',
+                                          _user_stats_remove_sql('OLD.following_id', 'followers_count')
+                                          + _user_stats_remove_sql('OLD.follower_id', 'following_count')),
+        'trg_replies_user_stats_insert': ('AFTER INSERT ON replies',
+                                          _user_stats_add_sql('NEW.user_id', 'replies_count')),
+        'trg_replies_user_stats_delete': ('AFTER DELETE ON replies',
+                                          _user_stats_remove_sql('OLD.user_id', 'replies_count')),
+        'trg_users_user_stats_delete': ('AFTER DELETE ON users',
+                                        'DELETE FROM user_stats WHERE user_id = OLD.id;'),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+    reconcile_user_stats(cursor)
+
+# ===== NOMBRE DE RÉPONSES PAR CRITIQUE =====
+
+def migration_013_reply_count(cursor):
+    """
+    Ajoute ratings.reply_count (nombre de réponses à la critique), tenu à jour par des triggers,
+    et les index des tris de la page d'un album : meilleures notes et critiques les plus discutées.
+    """
+    cursor.execute('ALTER TABLE ratings ADD COLUMN reply_count INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        UPDATE ratings SET reply_count = (SELECT COUNT(*) FROM replies WHERE replies.rating_id = ratings.id)
+        WHERE id IN (SELECT rating_id FROM replies)
+    ''')
+
+    triggers = {
+        'trg_replies_reply_count_insert': ('AFTER INSERT ON replies', '''
+            UPDATE ratings SET reply_count = reply_count + 1 WHERE id = NEW.rating_id;
+        '''),
+        'trg_replies_reply_count_update': ('AFTER UPDATE OF rating_id ON replies', '''
+            UPDATE ratings SET reply_count = reply_count - 1 WHERE id = OLD.rating_id;
+            UPDATE ratings SET reply_count = reply_count + 1 WHERE id = NEW.rating_id;
+        '''),
+        'trg_replies_reply_count_delete': ('AFTER DELETE ON replies', '''
+            UPDATE ratings SET reply_count = reply_count - 1 WHERE id = OLD.rating_id;
+        '''),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+    # L'id est ajouté implicitement à la fin de chaque index : (album_id, score, id) pour départager
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_album_score ON ratings(album_id, score)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ratings_album_reply_count ON ratings(album_id, reply_count)')
+
+# ===== VERSION DES RECOMMANDATIONS (cache partagé entre les processus) =====
+
+def _recommendations_bump_sql(user_id):
+    """SQL qui change la version des recommandations de l'utilisateur `user_id` (crée sa ligne si besoin)"""
+    return f'''
+        INSERT INTO user_stats (user_id, recommendations_version) VALUES ({user_id}, 1)
+        ON CONFLICT(user_id) DO UPDATE SET recommendations_version = recommendations_version + 1;
+    '''
+
+
+def _recommendations_bump_followers_sql(user_id):
+    """
+    Même chose pour les abonnés de `user_id` ("adoré par vos amis" a peut-être changé pour eux).
+    Comme pour le fil d'actualité, on saute les comptes en mode "pull" (des milliers d'abonnés) :
+    leurs abonnés voient le changement quand leur liste expire du cache.
+    """
+    return f'''
+        INSERT INTO user_stats (user_id, recommendations_version)
+        SELECT follows.follower_id, 1 FROM follows
+        JOIN users ON users.id = follows.following_id AND users.timeline_pull = 0
+        WHERE follows.following_id = {user_id}
+        ON CONFLICT(user_id) DO UPDATE SET recommendations_version = recommendations_version + 1;
+    '''
+
+
+def migration_014_recommendations_version(cursor):
+    """
+    Ajoute user_stats.recommendations_version : un numéro qui change (triggers) à chaque fois que
+    les recommandations d'un utilisateur peuvent changer (il note ou suit quelqu'un, un ami note).
+    Chaque processus garde ses listes en cache avec ce numéro et les recalcule s'il a changé :
+    une note enregistrée par un worker est prise en compte tout de suite par les autres.
+    """
+    cursor.execute('ALTER TABLE user_stats ADD COLUMN recommendations_version INTEGER NOT NULL DEFAULT 0')
+
+    triggers = {
+        'trg_ratings_recommendations_insert': ('AFTER INSERT ON ratings',
+                                               _recommendations_bump_sql('NEW.user_id')
+                                               + _recommendations_bump_followers_sql('NEW.user_id')),
+        'trg_ratings_recommendations_update': ('AFTER UPDATE OF score ON ratings',
+                                               _recommendations_bump_sql('NEW.user_id')
+                                               + _recommendations_bump_followers_sql('NEW.user_id')),
+        'trg_ratings_recommendations_delete': ('AFTER DELETE ON ratings',
+                                               _recommendations_bump_sql('OLD.user_id')
+                                               + _recommendations_bump_followers_sql('OLD.user_id')),
+        'trg_follows_recommendations_insert': ('AFTER INSERT ON follows',
+                                               _recommendations_bump_sql('NEW.follower_id')),
+        'trg_follows_recommendations_delete': ('AFTER DELETE ON follows',
+                                               _recommendations_bump_sql('OLD.follower_id')),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END')
+
+
+def migration_015_album_stats_exact_sum(cursor):
+    """
+    Remplace album_stats.score_sum (REAL) par score_tenths (INTEGER) : la somme des notes en dixièmes.
+    Ajouter et retirer des notes décimales à une somme REAL accumulait des erreurs d'arrondi
+    (7.1 + 8.2 + 6.3, puis 7.1 changé en 9.7 : 24.199999999999996 au lieu de 24.2).
+    Avec des entiers, les triggers et rebuild_album_stats donnent exactement la même moyenne.
+    """
+    for event in ('insert', 'update', 'delete'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS trg_ratings_album_stats_{event}')
+    cursor.execute('DROP TABLE album_stats')  # Supprime aussi idx_album_stats_ranking
+    cursor.execute('''
+        CREATE TABLE album_stats (
+            album_id INTEGER PRIMARY KEY,
+            score_tenths INTEGER NOT NULL DEFAULT 0,  -- Somme des notes en dixièmes (7.5 → 75)
+            rating_count INTEGER NOT NULL DEFAULT 0,  -- Nombre de notes
+            avg_score REAL,  -- score_tenths / (10 * rating_count) (gardé pour pouvoir l'indexer)
+            last_rated_at TIMESTAMP  -- Date de la note la plus récente
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX idx_album_stats_ranking
+        ON album_stats(avg_score, rating_count)
+        WHERE rating_count >= 3
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER trg_ratings_album_stats_insert
+        AFTER INSERT ON ratings
+        BEGIN
+            {_album_stats_add_sql('NEW')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_ratings_album_stats_update
+        AFTER UPDATE OF score, album_id ON ratings
+        BEGIN
+            {_album_stats_remove_sql('OLD')}
+            {_album_stats_add_sql('NEW')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_ratings_album_stats_delete
+        AFTER DELETE ON ratings
+        BEGIN
+            {_album_stats_remove_sql('OLD')}
+        END
+    ''')
+
+    rebuild_album_stats(cursor)
+
+# La liste ordonnée des migrations : la migration numéro N est MIGRATIONS[N - 1].
+# On ajoute toujours les nouvelles à la fin, on ne modifie jamais une migration déjà livrée.
+MIGRATIONS = [
+    migration_001_initial_schema,
+    migration_002_secondary_indexes,
+    migration_003_album_stats,
+    migration_004_search_index,
+    migration_005_normalized_genres,
+    migration_006_album_neighbors,
+    migration_007_timeline,
+    migration_008_tracks,
+    migration_009_jobs,
+    migration_010_job_state,
+    migration_011_metadata_refresh,
+    migration_012_user_stats,
+    migration_013_reply_count,
+    migration_014_recommendations_version,
+    migration_015_album_stats_exact_sum,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)  # La version d'une base complètement à jour
+
+
+def get_schema_version(conn):
+    """Lit la version du schéma enregistrée dans la base"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applique, dans l'ordre, toutes les migrations qui manquent à la base.
+    Chaque migration tourne dans sa propre transaction avec la nouvelle version :
+    si elle plante, la base reste à la version précédente.
+    Retourne la liste des numéros de migrations appliquées.
+    """
+    applied = []
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        return applied  # Déjà à jour : rien à faire (c'est le cas normal au démarrage)
+
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        # BEGIN IMMEDIATE prend tout de suite le verrou d'écriture : si plusieurs workers
+        # démarrent en même temps, un seul migre, les autres attendent puis voient la nouvelle version
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= number:
+                conn.rollback()
+                continue
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+            applied.append(number)
+        except Exception:
+            conn.rollback()
+            raise
+
+    return applied
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+Outils pour appeler une API externe (Spotify) sans la surcharger ni attendre une panne :
+- TokenBucket : limite le nombre d'appels par seconde, côté client, à notre quota ;
+- CircuitBreaker : après plusieurs échecs de suite, on arrête d'appeler l'API pendant
+  un moment (le site sert le cache au lieu d'attendre des timeouts), puis on réessaie ;
+- LatencyHistogram : répartition des durées d'appel, pour voir les appels lents (la "queue").
+"""
+
+import threading
+import time
+
+
+class ThrottledError(Exception):
+    """Pas de jeton disponible assez vite : l'appel n'a pas été fait"""
+
+
+class CircuitOpenError(Exception):
+    """Le disjoncteur est ouvert : l'API est considérée en panne, l'appel n'a pas été fait"""
+
+
+class TokenBucket:
+    """
+    Seau de jetons : il se remplit de `rate` jetons par seconde, jusqu'à `capacity`.
+    Chaque appel consomme un jeton ; s'il n'y en a plus, on attend qu'il s'en recrée un.
+    """
+
+    def __init__(self, rate, capacity):
+        assert rate > 0 and capacity >= 1, "rate et capacity doivent être positifs"
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.waits = 0  # Nombre d'appels qui ont dû attendre un jeton
+        self.rejected = 0  # Nombre d'appels abandonnés (attente trop longue)
+
+    def acquire(self, timeout=None):
+        """Prend un jeton (en attendant au plus `timeout` secondes). Retourne False si impossible."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if waited:
+                        self.waits += 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                with self._lock:
+                    self.rejected += 1
+                return False
+            waited = True
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """L'API nous a demandé d'attendre (429 + Retry-After) : on vide le seau pour `seconds` secondes"""
+        with self._lock:
+            self._tokens = min(self._tokens, 0) - seconds * self.rate
+            self._updated_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {'rate': self.rate, 'capacity': self.capacity, 'tokens': round(max(self._tokens, 0), 2),
+                    'waits': self.waits, 'rejected': self.rejected}
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur à trois états :
+    - 'closed' : tout va bien, les appels passent ;
+    - 'open' : trop d'échecs de suite, les appels sont refusés tout de suite pendant `reset_timeout` s ;
+    - 'half_open' : le délai est passé, on laisse passer un appel d'essai.
+      S'il réussit on referme, sinon on rouvre.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.short_circuited = 0  # Nombre d'appels refusés parce que le disjoncteur était ouvert
+
+    def before_call(self):
+        """À appeler avant chaque appel : lève CircuitOpenError si on ne doit pas appeler l'API"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_running = False
+            if self.state == 'closed':
+                return
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True  # Un seul appel d'essai à la fois
+                return
+            self.short_circuited += 1
+        raise CircuitOpenError("API indisponible (disjoncteur ouvert)")
+
+    def release(self):
+        """L'appel autorisé par before_call n'a finalement pas été fait"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self._failures,
+                    'times_opened': self.times_opened, 'short_circuited': self.short_circuited}
+
+
+class LatencyHistogram:
+    """
+    Compte les durées d'appel par tranche ("≤ 50 ms", "≤ 100 ms"...), séparément pour chaque nom d'appel.
+    La moyenne cache les appels lents ; l'histogramme montre combien d'appels dépassent 1 s, 2,5 s...
+    """
+
+    BOUNDS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self._series = {}  # nom -> {'count', 'total_ms', 'max_ms', 'buckets'}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        milliseconds = seconds * 1000
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(self.BOUNDS_MS) + 1)}
+                self._series[name] = series
+            series['count'] += 1
+            series['total_ms'] += milliseconds
+            series['max_ms'] = max(series['max_ms'], milliseconds)
+            index = len(self.BOUNDS_MS)  # Dernière tranche : au-delà de la plus grande borne
+            for i, bound in enumerate(self.BOUNDS_MS):
+                if milliseconds <= bound:
+                    index = i
+                    break
+            series['buckets'][index] += 1
+
+    def stats(self):
+        """{nom: {'count', 'avg_ms', 'max_ms', 'buckets': {'<=50ms': n, ..., '>5000ms': n}}}"""
+        labels = [f'<={bound}ms' for bound in self.BOUNDS_MS] + [f'>{self.BOUNDS_MS[-1]}ms']
+        with self._lock:
+            return {
+                name: {
+                    'count': series['count'],
+                    'avg_ms': round(series['total_ms'] / series['count'], 1),
+                    'max_ms': round(series['max_ms'], 1),
+                    'buckets': dict(zip(labels, series['buckets'])),
+                }
+                for name, series in self._series.items()
+            }
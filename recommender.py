@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recommandations d'albums par factorisation de matrice (ALS implicite).
+
+Hors-ligne (flask train-recommender) : on apprend un vecteur de FACTORS nombres pour chaque
+utilisateur et pour chaque album à partir de la table ratings, de façon à ce que
+    vecteur_utilisateur · vecteur_album ≈ "l'utilisateur aime cet album"
+Les vecteurs sont enregistrés en float32 contigus dans des fichiers .npy.
+
+Sur le site : on ouvre ces fichiers en mémoire partagée (mmap, rien n'est recopié),
+et recommander = un seul produit matrice × vecteur, puis on garde les meilleurs scores
+parmi les albums que l'utilisateur n'a pas encore notés. Aucune grosse requête SQL.
+
+Chaque entraînement écrit une nouvelle version dans son propre dossier, puis le fichier
+CURRENT est remplacé d'un coup (os.replace) : les serveurs passent à la nouvelle version
+sans jamais lire un modèle à moitié écrit.
+"""
+
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy n'est nécessaire que pour les recommandations ALS
+    np = None
+
+from cache import LRUCache
+
+
+FACTORS = 64  # Taille des vecteurs appris
+ITERATIONS = 15  # Nombre d'allers-retours utilisateurs / albums
+REGULARIZATION = 0.1  # Pénalité sur la taille des vecteurs (évite le sur-apprentissage)
+ALPHA = 20.0  # Poids d'une bonne note par rapport à un album jamais noté
+LIKE_SCORE = 6.5  # À partir de quelle note on considère que l'utilisateur a aimé l'album
+MODEL_DIR = 'models/recommender'
+RELOAD_INTERVAL = 60  # Toutes les combien de secondes on regarde s'il y a un nouveau modèle
+REASON = 'Recommandé pour vous'
+CACHE_SIZE = 10000  # Nombre d'utilisateurs gardés en cache
+CACHE_TTL = 15 * 60  # Durée de vie d'une liste en cache (secondes)
+CACHE_DEPTH = 24  # On calcule (et garde) un peu plus que demandé pour survivre aux nouvelles notes
+
+
+class HeuristicRecommender:
+    """Ancien système (artistes et genres préférés), gardé quand NumPy n'est pas installé"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def recommend(self, user_id, limit=12):
+        return self.db.get_recommended_albums(user_id, limit)
+
+    def stats(self):
+        return {'type': 'heuristic'}
+
+
+class ALSRecommender:
+    """Recommandations à partir des vecteurs appris par train_als()"""
+
+    def __init__(self, db, model_dir=MODEL_DIR):
+        self.db = db
+        self.model_dir = model_dir
+        self._model = None  # (version, user_ids, album_ids, user_factors, album_factors)
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Lit le fichier CURRENT et (re)charge le modèle s'il a changé. Retourne None s'il n'y en a pas."""
+        now = time.monotonic()
+        if self._model is not None and now - self._checked_at < RELOAD_INTERVAL:
+            return self._model
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                with open(os.path.join(self.model_dir, 'CURRENT')) as f:
+                    version = f.read().strip()
+            except FileNotFoundError:
+                return self._model
+
+            if self._model is None or self._model[0] != version:
+                path = os.path.join(self.model_dir, version)
+                # mmap_mode='r' : les fichiers sont projetés en mémoire, partagés entre processus
+                self._model = (
+                    version,
+                    np.load(os.path.join(path, 'user_ids.npy')),
+                    np.load(os.path.join(path, 'album_ids.npy')),
+                    np.load(os.path.join(path, 'user_factors.npy'), mmap_mode='r'),
+                    np.load(os.path.join(path, 'album_factors.npy'), mmap_mode='r'),
+                )
+                print(f"✅ Modèle de recommandation chargé (version {version})")
+            return self._model
+
+    def recommend(self, user_id, limit=12):
+        """
+        Les `limit` meilleurs albums pour l'utilisateur, au même format que
+        get_recommended_albums : [{'album', 'avg_score', 'num_ratings', 'reason'}]
+        Utilisateur inconnu du modèle (nouveau compte) ou pas de modèle → albums populaires.
+        """
+        assert isinstance(user_id, int) and user_id > 0, "User ID invalide"
+        assert isinstance(limit, int) and limit > 0, "Limit doit être positif"
+
+        model = self._load()
+        if model is None:
+            return self.db.get_popular_unrated_albums(user_id, limit)
+        _, user_ids, album_ids, user_factors, album_factors = model
+
+        # user_ids est trié : recherche dichotomique de la ligne de l'utilisateur
+        row = np.searchsorted(user_ids, user_id)
+        if row >= len(user_ids) or user_ids[row] != user_id:
+            return self.db.get_popular_unrated_albums(user_id, limit)
+
+        # Un seul produit matrice × vecteur donne le score de tous les albums
+        scores = album_factors @ user_factors[row]
+
+        # On retire les albums déjà notés (lus par l'index UNIQUE(user_id, album_id))
+        rated = self.db.get_user_rated_album_ids(user_id)
+        scores[np.isin(album_ids, rated)] = -np.inf
+
+        # argpartition trouve les meilleurs sans trier tout le tableau
+        candidates = min(limit, int(np.isfinite(scores).sum()))
+        if candidates == 0:
+            return self.db.get_popular_unrated_albums(user_id, limit)
+        best = np.argpartition(-scores, candidates - 1)[:candidates]
+        best = best[np.argsort(-scores[best])]
+        best_ids = [int(album_ids[i]) for i in best]
+
+        albums = self.db.get_albums_by_ids(best_ids)
+        stats = self.db.get_albums_stats(best_ids)
+        return [
+            {
+                'album': albums[album_id],
+                'avg_score': stats[album_id]['avg_score'],
+                'num_ratings': stats[album_id]['num_ratings'],
+                'reason': REASON
+            }
+            for album_id in best_ids if album_id in albums  # Album supprimé depuis l'entraînement
+        ]
+
+    def stats(self):
+        model = self._model
+        return {
+            'type': 'als',
+            'version': model[0] if model else None,
+            'users': len(model[1]) if model else 0,
+            'albums': len(model[2]) if model else 0,
+        }
+
+
+class CachedRecommender:
+    """
+    Garde en cache la liste de recommandations de chaque utilisateur : elle est demandée
+    à chaque visite mais ne change que quand l'utilisateur (ou un ami) note un album.
+    Le cache est propre à chaque processus ; chaque liste est gardée avec le numéro de version
+    de l'utilisateur en base (user_stats.recommendations_version, changé par des triggers).
+    À chaque lecture on relit ce numéro (une ligne, clé primaire) : si un autre processus a
+    enregistré une note entre-temps, la liste est recalculée au lieu d'attendre la fin du TTL.
+    Les routes préviennent aussi le cache de ce processus avec les méthodes on_... après chaque écriture.
+    """
+
+    def __init__(self, db, recommender, max_size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.db = db
+        self.recommender = recommender
+        self.cache = LRUCache(max_size, ttl)
+
+    def recommend(self, user_id, limit=12):
+        # En cache : (version, liste, exhaustive) ; exhaustive = il n'y avait pas plus de candidats
+        version = self.db.get_recommendations_version(user_id)
+        cached = self.cache.get(user_id)
+        if (cached is None or cached[0] != version
+                or (len(cached[1]) < limit and not cached[2])):
+            depth = max(limit, CACHE_DEPTH)
+            recommendations = self.recommender.recommend(user_id, depth)
+            cached = (version, recommendations, len(recommendations) < depth)
+            self.cache.set(user_id, cached)
+        # Copies : la route ajoute des clés (ex : 'artist') aux éléments retournés
+        return [dict(item) for item in cached[1][:limit]]
+
+    def on_rating_saved(self, user_id, album_id):
+        """
+        L'utilisateur vient de noter album_id : on le retire simplement de sa liste
+        (mise à jour partielle, pas de recalcul). Ses abonnés, eux, ont peut-être
+        un nouvel album "adoré par vos amis" : les triggers ont changé leur version,
+        leur liste est recalculée à leur prochaine visite (dans n'importe quel processus).
+        """
+        version = self.db.get_recommendations_version(user_id)
+
+        def without_album(cached):
+            cached_version, recommendations, exhaustive = cached
+            if cached_version != version - 1:
+                return None  # Autre changement que cette note (autre processus) : on recalculera
+            remaining = [item for item in recommendations if item['album'].id != album_id]
+            return (version, remaining, exhaustive) if remaining else None  # Liste vide = on la recalculera
+
+        self.cache.update(user_id, without_album)
+
+    def on_rating_deleted(self, user_id):
+        """L'album redevient un candidat : on recalcule la liste de l'utilisateur"""
+        self.cache.invalidate(user_id)
+
+    def on_follow_changed(self, follower_id):
+        """Les amis de follower_id ont changé, donc ses candidats aussi"""
+        self.cache.invalidate(follower_id)
+
+    def forget_user(self, user_id):
+        self.cache.invalidate(user_id)
+
+    def stats(self):
+        stats = self.recommender.stats()
+        stats['cache'] = self.cache.stats()
+        return stats
+
+
+def _solve_side(fixed, liked_matrix, regularization, alpha):
+    """
+    Une demi-itération d'ALS implicite (Hu, Koren, Volinsky 2008) : les vecteurs `fixed`
+    (ex : les albums) ne bougent pas, on calcule le meilleur vecteur de chaque ligne
+    de `liked_matrix` (ex : chaque utilisateur).
+    Pour une ligne u qui a aimé les colonnes I(u) :
+        (FᵀF + alpha · F_Iᵀ F_I + λ·Id) x_u = (1 + alpha) · somme des F_i pour i dans I(u)
+    FᵀF est commun à toutes les lignes : on ne le calcule qu'une fois.
+    """
+    factors = fixed.shape[1]
+    gram = fixed.T @ fixed + regularization * np.eye(factors, dtype=np.float64)
+    result = np.zeros((liked_matrix.shape[0], factors), dtype=np.float64)
+
+    for row in range(liked_matrix.shape[0]):
+        liked = liked_matrix.indices[liked_matrix.indptr[row]:liked_matrix.indptr[row + 1]]
+        if len(liked) == 0:
+            continue
+        f_liked = fixed[liked]
+        a = gram + alpha * (f_liked.T @ f_liked)
+        b = (1.0 + alpha) * f_liked.sum(axis=0)
+        result[row] = np.linalg.solve(a, b)
+
+    return result
+
+
+def train_als(db, model_dir=MODEL_DIR, factors=FACTORS, iterations=ITERATIONS,
+              regularization=REGULARIZATION, alpha=ALPHA, seed=0):
+    """
+    Entraîne le modèle à partir de toutes les notes et le publie dans model_dir.
+    Retourne un petit résumé (version, tailles, durée).
+    """
+    import scipy.sparse as sp
+
+    started = time.perf_counter()
+    conn = db.get_connection()
+    try:
+        rows = conn.execute(
+            'SELECT user_id, album_id FROM ratings WHERE score >= ?', (LIKE_SCORE,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    pairs = np.array([(row[0], row[1]) for row in rows], dtype=np.int64).reshape(-1, 2)
+    user_ids, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    album_ids, album_index = np.unique(pairs[:, 1], return_inverse=True)
+
+    likes = sp.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float64), (user_index, album_index)),
+        shape=(len(user_ids), len(album_ids))
+    )
+    likes.sum_duplicates()
+    likes_t = likes.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.01, (len(user_ids), factors))
+    album_factors = rng.normal(0, 0.01, (len(album_ids), factors))
+
+    for _ in range(iterations):
+        user_factors = _solve_side(album_factors, likes, regularization, alpha)
+        album_factors = _solve_side(user_factors, likes_t, regularization, alpha)
+
+    # Publication : nouveau dossier, puis bascule atomique du fichier CURRENT
+    version = time.strftime('%Y%m%d-%H%M%S') + f'-{os.getpid()}'
+    path = os.path.join(model_dir, version)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'user_ids.npy'), user_ids)
+    np.save(os.path.join(path, 'album_ids.npy'), album_ids)
+    np.save(os.path.join(path, 'user_factors.npy'), np.ascontiguousarray(user_factors, dtype=np.float32))
+    np.save(os.path.join(path, 'album_factors.npy'), np.ascontiguousarray(album_factors, dtype=np.float32))
+
+    current_tmp = os.path.join(model_dir, 'CURRENT.tmp')
+    with open(current_tmp, 'w') as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(model_dir, 'CURRENT'))
+
+    return {
+        'version': version,
+        'users': len(user_ids),
+        'albums': len(album_ids),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+
+def create_recommender(db, model_dir=MODEL_DIR):
+    """
+    Recommandations ALS si NumPy est installé, sinon l'ancien système (artistes / genres),
+    dans les deux cas derrière le cache par utilisateur
+    """
+    if np is None:
+        print("⚠️  NumPy non installé : recommandations ALS désactivées.")
+        return CachedRecommender(db, HeuristicRecommender(db))
+    return CachedRecommender(db, ALSRecommender(db, model_dir))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Calcul hors-ligne des albums similaires ("les fans de cet album ont aussi aimé...").
+On regarde la matrice utilisateurs × albums des bonnes notes (>= HIGH_SCORE) et on compare
+les colonnes deux à deux avec la similarité cosinus :
+    sim(a, b) = nombre de fans communs / racine(fans de a × fans de b)
+Tout est fait avec des matrices creuses (SciPy), jamais avec des boucles sur les notes.
+Le résultat (les TOP_K voisins de chaque album) est rangé dans la table album_neighbors :
+la page album n'a plus qu'à lire quelques lignes par clé primaire.
+
+À lancer avec : flask build-album-similarity [--full]
+"""
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+
+HIGH_SCORE = 7  # À partir de quelle note on considère que l'utilisateur a "aimé" l'album
+TOP_K = 20  # Nombre de voisins gardés par album
+MIN_COMMON_FANS = 2  # En dessous, deux albums ne sont pas considérés comme similaires (trop de bruit)
+BLOCK_SIZE = 2048  # Nombre d'albums calculés à la fois (limite la mémoire utilisée)
+
+
+def load_likes_matrix(conn):
+    """
+    Charge les bonnes notes sous forme de matrice creuse binaire utilisateurs × albums.
+    Retourne (matrice CSR, ids des albums de chaque colonne, ids des utilisateurs de chaque ligne)
+    """
+    rows = conn.execute(
+        'SELECT user_id, album_id FROM ratings WHERE score >= ?', (HIGH_SCORE,)
+    ).fetchall()
+    pairs = np.array([(row[0], row[1]) for row in rows], dtype=np.int64).reshape(-1, 2)
+
+    # np.unique renvoie les ids triés et, pour chaque note, l'indice de sa ligne / colonne
+    user_ids, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    album_ids, album_index = np.unique(pairs[:, 1], return_inverse=True)
+
+    likes = sp.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (user_index, album_index)),
+        shape=(len(user_ids), len(album_ids))
+    )
+    likes.sum_duplicates()
+    likes.data[:] = 1.0  # Binaire, même si une paire apparaissait deux fois
+    return likes, album_ids, user_ids
+
+
+def compute_neighbors(likes, album_ids, columns, top_k=TOP_K, min_common_fans=MIN_COMMON_FANS):
+    """
+    Calcule les top_k voisins des albums d'indices `columns` (indices de colonnes de `likes`).
+    Retourne {album_id: [(neighbor_id, score), ...]} trié du plus au moins similaire.
+    """
+    fans = np.asarray(likes.sum(axis=0)).ravel()  # Nombre de fans de chaque album
+    inv_norm = np.zeros_like(fans)
+    inv_norm[fans > 0] = 1.0 / np.sqrt(fans[fans > 0])
+
+    likes_csc = likes.tocsc()
+    neighbors = {}
+
+    for start in range(0, len(columns), BLOCK_SIZE):
+        block = np.asarray(columns[start:start + BLOCK_SIZE])
+
+        # Fans communs entre les albums du bloc et tous les albums (matrice creuse bloc × albums)
+        common = (likes_csc[:, block].T @ likes).tocsr()
+        common.data[common.data < min_common_fans] = 0
+        common.eliminate_zeros()
+
+        # Normalisation cosinus, ligne par ligne puis colonne par colonne
+        similarity = sp.diags(inv_norm[block]) @ common @ sp.diags(inv_norm)
+        similarity = similarity.tocsr()
+
+        for row, column in enumerate(block):
+            begin, end = similarity.indptr[row], similarity.indptr[row + 1]
+            cols = similarity.indices[begin:end]
+            scores = similarity.data[begin:end]
+
+            keep = cols != column  # Un album n'est pas son propre voisin
+            cols, scores = cols[keep], scores[keep]
+            if len(cols) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                cols, scores = cols[best], scores[best]
+            order = np.lexsort((album_ids[cols], -scores))  # Score décroissant, puis id croissant
+
+            neighbors[int(album_ids[column])] = [
+                (int(album_ids[cols[i]]), float(scores[i])) for i in order
+            ]
+
+    return neighbors
+
+
+def build_album_neighbors(db, full=False, top_k=TOP_K):
+    """
+    Met à jour la table album_neighbors.
+    - full=True : on recalcule tous les albums.
+    - sinon : seulement les albums dont les similarités ont pu changer depuis le dernier calcul,
+      c'est-à-dire les albums des notes modifiées (table similarity_dirty), les albums aimés
+      par les utilisateurs concernés, et les albums qui ont des fans en commun avec eux.
+    Retourne un petit résumé (nombre d'albums recalculés, de voisins écrits, durée).
+    """
+    started = time.perf_counter()
+    conn = db.get_connection()
+    try:
+        dirty = conn.execute('SELECT user_id, album_id FROM similarity_dirty').fetchall()
+        dirty = [(row['user_id'], row['album_id']) for row in dirty]
+        if not full and conn.execute('SELECT 1 FROM album_neighbors LIMIT 1').fetchone() is None:
+            full = True  # Premier calcul : on fait tout
+
+        likes, album_ids, user_ids = load_likes_matrix(conn)
+        column_of = {int(album_id): i for i, album_id in enumerate(album_ids)}
+
+        if full:
+            columns = np.arange(len(album_ids))
+            stale_album_ids = None  # On videra toute la table
+        else:
+            dirty_users = np.array(sorted({user_id for user_id, _ in dirty}), dtype=np.int64)
+            dirty_albums = {album_id for _, album_id in dirty}
+            dirty_columns = [column_of[a] for a in dirty_albums if a in column_of]
+
+            # Albums aimés par les utilisateurs concernés
+            # (user_ids est trié : searchsorted retrouve la ligne de chaque utilisateur,
+            # s'il a encore au moins une bonne note)
+            user_rows = np.searchsorted(user_ids, dirty_users)
+            found = user_rows < len(user_ids)
+            found[found] = user_ids[user_rows[found]] == dirty_users[found]
+            liked_by_dirty_users = likes[user_rows[found]].indices
+
+            # Albums qui ont au moins un fan en commun avec un album modifié
+            fans_of_dirty = likes.tocsc()[:, dirty_columns].indices
+            co_liked = likes[np.unique(fans_of_dirty)].indices
+
+            columns = np.unique(np.concatenate([
+                np.asarray(dirty_columns, dtype=np.int64),
+                liked_by_dirty_users.astype(np.int64),
+                co_liked.astype(np.int64),
+            ]))
+            stale_album_ids = dirty_albums | {int(album_ids[c]) for c in columns}
+
+        neighbors = compute_neighbors(likes, album_ids, columns, top_k)
+
+        rows = [
+            (album_id, rank, neighbor_id, score)
+            for album_id, items in neighbors.items()
+            for rank, (neighbor_id, score) in enumerate(items, start=1)
+        ]
+
+        # Écriture en une seule transaction : la page album voit l'ancien ou le nouveau résultat
+        conn.execute('BEGIN IMMEDIATE')
+        if stale_album_ids is None:
+            conn.execute('DELETE FROM album_neighbors')
+        else:
+            conn.executemany('DELETE FROM album_neighbors WHERE album_id = ?',
+                             [(album_id,) for album_id in stale_album_ids])
+        conn.executemany(
+            'INSERT INTO album_neighbors (album_id, rank, neighbor_id, score) VALUES (?, ?, ?, ?)',
+            rows
+        )
+        # On n'efface que les notes qu'on a vues : celles arrivées pendant le calcul
+        # restent marquées pour la prochaine fois
+        conn.executemany('DELETE FROM similarity_dirty WHERE user_id = ? AND album_id = ?', dirty)
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {
+        'full': full,
+        'albums_refreshed': len(columns),
+        'neighbors_written': len(rows),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
@@ -2,47 +2,383 @@
 
 """
 Intégration avec l'API Spotify
+
+Les réponses sont gardées en cache (mémoire + fichier SQLite partagé entre les workers) :
+les albums ne changent quasiment jamais, inutile de payer un appel réseau à chaque page.
+Chaque méthode publique appelle une fonction _fetch_... qui fait le vrai appel et laisse
+remonter les erreurs ; la méthode publique les attrape et renvoie [] ou None comme avant.
 """
+import random
+import threading
+import time
+
+import requests
 import spotipy
+from requests.adapters import HTTPAdapter
+from spotipy.exceptions import SpotifyException
 from spotipy.oauth2 import SpotifyClientCredentials
 
+from cache import ResponseCache
+from ratelimit import CircuitBreaker, LatencyHistogram, ThrottledError, TokenBucket
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Durées de cache par type d'appel : (ttl, stale)
+# ttl = durée pendant laquelle la réponse est servie telle quelle,
+# stale = durée supplémentaire pendant laquelle on la sert en la rafraîchissant en arrière-plan
+CACHE_TTLS = {
+    'album': (30 * DAY, 30 * DAY),  # Un album sorti ne change (presque) jamais
+    'artist': (DAY, 7 * DAY),  # Photo, genres, popularité : bougent un peu
+    'artist_albums': (DAY, 7 * DAY),
+    'artist_discography': (DAY, 7 * DAY),
+    'search_albums': (10 * 60, HOUR),
+    'search_artists': (10 * 60, HOUR),
+    'new_releases': (HOUR, 6 * HOUR),
+}
+CACHE_PATH = 'spotify_cache.db'
+ALBUMS_PER_REQUEST = 20  # Maximum d'ids acceptés par l'appel groupé /albums de Spotify
+ARTISTS_PER_REQUEST = 50  # Maximum d'ids acceptés par l'appel groupé /artists
+NEW_RELEASES_PAGE = 50  # Taille maximum d'une page de /browse/new-releases
+
+# Limitation côté client, réglée sur notre quota Spotify
+RATE_LIMIT = 5  # Appels par seconde en moyenne
+RATE_BURST = 10  # Appels possibles d'un coup après un moment calme
+TOKEN_TIMEOUT = 2  # Attente maximum d'un jeton avant d'abandonner l'appel (secondes)
+MAX_RETRIES = 2  # Nouvelles tentatives après une erreur 5xx / réseau / 429
+RETRY_BASE = 0.2  # Attente de base entre deux tentatives (doublée à chaque fois, avec du hasard)
+MAX_RETRY_AFTER = 5  # Au-delà, on n'attend pas le Retry-After d'un 429 pendant une requête web
+BREAKER_FAILURES = 5  # Échecs de suite avant d'ouvrir le disjoncteur
+BREAKER_RESET = 30  # Secondes pendant lesquelles on n'appelle plus Spotify une fois le disjoncteur ouvert
+
+# Connexions HTTP : gardées ouvertes et réutilisées (pas de nouvelle poignée de main TLS à chaque appel)
+POOL_SIZE = 16  # Connexions gardées vers Spotify : au moins le nombre de threads qui l'appellent
+CONNECT_TIMEOUT = 3  # Secondes pour ouvrir la connexion
+READ_TIMEOUT = 10  # Secondes sans recevoir de données avant d'abandonner (un socket bloqué ne bloque pas un worker)
+
+
+def create_session(pool_size=POOL_SIZE):
+    """
+    Session HTTP partagée par tous les appels à Spotify (API et jeton d'accès) :
+    connexions keep-alive réutilisées, pool dimensionné pour nos threads, réponses compressées.
+    """
+    session = requests.Session()
+    # max_retries=0 : les nouvelles tentatives sont gérées par SpotifyAPI._call
+    # pool_block=False : si toutes les connexions sont prises, on en ouvre une de plus plutôt que d'attendre
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+
+def full_release_date(release_date, precision=None):
+    """
+    Spotify donne les dates de sortie avec une précision variable ('2024', '2024-05' ou '2024-05-17',
+    voir release_date_precision). On complète au premier jour ('2024' → '2024-01-01') pour pouvoir
+    comparer les dates entre elles comme des chaînes : sinon '2024' < '2024-01-01'.
+    Retourne '' si la date est inconnue.
+    """
+    if not release_date:
+        return ''
+    if precision == 'year' or (precision is None and len(release_date) == 4):
+        return release_date[:4] + '-01-01'
+    if precision == 'month' or (precision is None and len(release_date) == 7):
+        return release_date[:7] + '-01'
+    return release_date
+
 
 class SpotifyAPI:
     """Classe pour interagir avec l'API Spotify"""
     
-    def __init__(self, client_id, client_secret):
-
+    def __init__(self, client_id, client_secret, cache_path=CACHE_PATH, session=None,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        """
+        cache_path=None : cache en mémoire seulement (pas de fichier partagé)
+        session : session HTTP à utiliser (par défaut create_session())
+        timeout : (connexion, lecture) en secondes, pour chaque appel HTTP
+        """
         assert isinstance(client_id, str) and len(client_id) > 0, "Client ID invalide"
         assert isinstance(client_secret, str) and len(client_secret) > 0, "Client Secret invalide"
         
+        self.session = session if session is not None else create_session()
         auth_manager = SpotifyClientCredentials(
             client_id=client_id,
-            client_secret=client_secret
+            client_secret=client_secret,
+            requests_session=self.session,
+            requests_timeout=timeout
         )
-        self.sp = spotipy.Spotify(auth_manager=auth_manager)
+        # retries=0 : les nouvelles tentatives sont gérées ici (_call), pas en double par spotipy
+        self.sp = spotipy.Spotify(auth_manager=auth_manager, retries=0, status_retries=0,
+                                  requests_session=self.session, requests_timeout=timeout)
+        self.cache = ResponseCache(CACHE_TTLS, cache_path)
+        self.bucket = TokenBucket(RATE_LIMIT, RATE_BURST)
+        self.breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET)
+        self.counters = {'calls': 0, 'retries': 0, 'throttled': 0, 'errors': 0}
+        self._counters_lock = threading.Lock()
+        self.latency = LatencyHistogram()  # Durée de chaque appel HTTP, par méthode spotipy
     
-    def search_albums(self, query, limit=10):
-        """Recherche des albums sur Spotify"""
-        assert isinstance(query, str) and len(query) > 0, "Query invalide"
-        assert isinstance(limit, int) and 1 <= limit <= 50, "Limit doit être entre 1 et 50"
-        
-        try:
-            results = self.sp.search(q=query, type='album', limit=limit)
-            albums = []
+    def cache_stats(self):
+        """Statistiques du cache (pour /metrics)"""
+        return self.cache.stats()
+    
+    def client_stats(self):
+        """Appels, limitations (429), disjoncteur, seau de jetons et latences (pour /metrics)"""
+        with self._counters_lock:
+            stats = dict(self.counters)
+        stats['breaker'] = self.breaker.stats()
+        stats['bucket'] = self.bucket.stats()
+        stats['latency'] = self.latency.stats()
+        return stats
+    
+    def _count(self, name):
+        with self._counters_lock:
+            self.counters[name] += 1
+    
+    def _call(self, method, *args, retries=MAX_RETRIES, **kwargs):
+        """
+        Fait un appel à Spotify en respectant notre quota (seau de jetons) et le disjoncteur.
+        - 429 : on attend le Retry-After demandé par Spotify (s'il est court) puis on réessaie ;
+        - 5xx / erreur réseau : nouvelles tentatives espacées au hasard, puis échec compté
+          par le disjoncteur ;
+        - autre 4xx : c'est notre requête qui est fausse, on ne réessaie pas.
+        retries : nombre maximum de nouvelles tentatives (0 = une seule requête HTTP, pour les
+        tâches qui ont un budget d'appels).
+        Lève l'exception finale (les méthodes publiques l'attrapent).
+        """
+        for attempt in range(retries + 1):
+            # Disjoncteur d'abord : quand Spotify est en panne, on refuse sans attendre de jeton
+            self.breaker.before_call()
+            if not self.bucket.acquire(timeout=TOKEN_TIMEOUT):
+                self.breaker.release()
+                self._count('throttled')
+                raise ThrottledError("Quota Spotify atteint côté client")
+            self._count('calls')
+            
+            try:
+                result = self._timed(method, *args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status == 429:
+                    # Spotify répond : ce n'est pas une panne, mais il faut ralentir
+                    self.breaker.record_success()
+                    self._count('throttled')
+                    retry_after = self._retry_after(e)
+                    self.bucket.pause(retry_after)  # Les autres threads attendent aussi
+                    if attempt == retries or retry_after > MAX_RETRY_AFTER:
+                        raise
+                    self._count('retries')
+                    time.sleep(retry_after)
+                    continue
+                if e.http_status < 500:
+                    self.breaker.record_success()
+                    raise
+                error = e
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            except Exception:
+                # Erreur imprévue (jeton refusé par Spotify, réponse inattendue...) : pas de nouvelle
+                # tentative, mais le disjoncteur doit le savoir (sinon un appel d'essai le bloque pour toujours)
+                self._count('errors')
+                self.breaker.record_failure()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
             
-            for item in results['albums']['items']:
+            # Panne probable de Spotify (5xx, réseau)
+            self._count('errors')
+            self.breaker.record_failure()
+            if attempt == retries:
+                raise error
+            self._count('retries')
+            # "Full jitter" : attente au hasard entre 0 et RETRY_BASE * 2^tentative
+            time.sleep(random.uniform(0, RETRY_BASE * 2 ** attempt))
+    
+    def _timed(self, method, *args, **kwargs):
+        """Appelle method et note sa durée, réussite ou échec (les appels en échec sont souvent les plus lents)"""
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.latency.record(getattr(method, '__name__', 'call'), time.perf_counter() - started)
+    
+    @staticmethod
+    def _retry_after(error):
+        """Durée d'attente demandée par Spotify dans l'en-tête Retry-After (1 s par défaut)"""
+        try:
+            return max(0, float((error.headers or {}).get('Retry-After', 1)))
+        except (TypeError, ValueError):
+            return 1
+    
+    # ========== APPELS À SPOTIFY (lèvent une exception en cas d'erreur) ==========
+    
+    def _fetch_search_albums(self, query, limit):
+        results = self._call(self.sp.search, q=query, type='album', limit=limit)
+        albums = []
+        
+        for item in results['albums']['items']:
+            album_data = {
+                'id': item['id'],
+                'name': item['name'],
+                'artist': item['artists'][0]['name'],
+                'artist_id': item['artists'][0]['id'],
+                'release_date': item['release_date'],
+                'image_url': item['images'][0]['url'] if item['images'] else None,
+                'spotify_url': item['external_urls']['spotify']
+            }
+            albums.append(album_data)
+        
+        return albums
+    
+    def _fetch_search_artists(self, query, limit):
+        results = self._call(self.sp.search, q=query, type='artist', limit=limit)
+        artists = []
+        
+        for item in results['artists']['items']:
+            artist_data = {
+                'id': item['id'],
+                'name': item['name'],
+                'genres': item['genres'],
+                'image_url': item['images'][0]['url'] if item['images'] else None,
+                'spotify_url': item['external_urls']['spotify'],
+                'popularity': item['popularity']
+            }
+            artists.append(artist_data)
+        
+        return artists
+    
+    def _fetch_album(self, album_id):
+        return self._format_album(self._call(self.sp.album, album_id))
+    
+    def _fetch_albums(self, album_ids):
+        """Plusieurs albums en un seul appel (Spotify accepte jusqu'à ALBUMS_PER_REQUEST ids)"""
+        results = self._call(self.sp.albums, album_ids)
+        return [self._format_album(album) for album in results['albums'] if album]
+    
+    def _format_album(self, album):
+        """Transforme la réponse complète d'un album (avec toutes ses pistes) en dictionnaire"""
+        album_data = {
+            'id': album['id'],
+            'name': album['name'],
+            'artist': album['artists'][0]['name'],
+            'artist_id': album['artists'][0]['id'],
+            'release_date': album['release_date'],
+            'total_tracks': album['total_tracks'],
+            'image_url': album['images'][0]['url'] if album['images'] else None,
+            'genres': album.get('genres', []),
+            'label': album.get('label', ''),
+            'popularity': album.get('popularity', 0),
+            'spotify_url': album['external_urls']['spotify'],
+            'tracks': []
+        }
+        
+        # Ajouter les pistes : Spotify n'en renvoie que 50 par page,
+        # on suit les liens "next" pour avoir toutes les pistes des gros albums
+        page = album['tracks']
+        while page:
+            for track in page['items']:
+                track_data = {
+                    'name': track['name'],
+                    'duration_ms': track['duration_ms'],
+                    'track_number': track['track_number'],
+                    'disc_number': track.get('disc_number', 1),
+                    'spotify_id': track.get('id')
+                }
+                album_data['tracks'].append(track_data)
+            page = self._call(self.sp.next, page) if page.get('next') else None
+        
+        album_data['total_duration_ms'] = sum(track['duration_ms'] for track in album_data['tracks'])
+        return album_data
+    
+    def _fetch_artist(self, artist_id):
+        return self._format_artist(self._call(self.sp.artist, artist_id))
+    
+    def _fetch_artists(self, artist_ids, retries=MAX_RETRIES):
+        """Plusieurs artistes en un seul appel (Spotify accepte jusqu'à ARTISTS_PER_REQUEST ids)"""
+        results = self._call(self.sp.artists, artist_ids, retries=retries)
+        return [self._format_artist(artist) for artist in results['artists'] if artist]
+    
+    @staticmethod
+    def _format_artist(artist):
+        return {
+            'id': artist['id'],
+            'name': artist['name'],
+            'genres': artist['genres'],
+            'image_url': artist['images'][0]['url'] if artist['images'] else None,
+            'popularity': artist['popularity'],
+            'followers': artist['followers']['total'],
+            'spotify_url': artist['external_urls']['spotify']
+        }
+    
+    def _fetch_artist_albums(self, artist_id, limit):
+        results = self._call(self.sp.artist_albums, artist_id, limit=limit, album_type='album')
+        albums = []
+        
+        for item in results['items']:
+            album_data = {
+                'id': item['id'],
+                'name': item['name'],
+                'release_date': item['release_date'],
+                'total_tracks': item['total_tracks'],
+                'image_url': item['images'][0]['url'] if item['images'] else None,
+                'spotify_url': item['external_urls']['spotify']
+            }
+            albums.append(album_data)
+        
+        return albums
+    
+    def _fetch_artist_discography(self, artist_id):
+        """Tous les albums et singles d'un artiste : on suit les pages de 50 jusqu'au bout"""
+        albums = []
+        page = self._call(self.sp.artist_albums, artist_id, include_groups='album,single', limit=50)
+        while page:
+            for item in page['items']:
                 album_data = {
                     'id': item['id'],
                     'name': item['name'],
-                    'artist': item['artists'][0]['name'],
-                    'artist_id': item['artists'][0]['id'],
+                    'album_type': item.get('album_type', 'album'),
                     'release_date': item['release_date'],
+                    'total_tracks': item['total_tracks'],
                     'image_url': item['images'][0]['url'] if item['images'] else None,
                     'spotify_url': item['external_urls']['spotify']
                 }
                 albums.append(album_data)
-            
-            return albums
+            page = self._call(self.sp.next, page) if page.get('next') else None
+        
+        return albums
+    
+    def _fetch_new_releases(self, limit):
+        results = self._call(self.sp.new_releases, limit=limit)
+        return [self._format_release(item) for item in results['albums']['items']]
+    
+    @staticmethod
+    def _format_release(item):
+        return {
+            'id': item['id'],
+            'name': item['name'],
+            'artist': item['artists'][0]['name'],
+            'artist_id': item['artists'][0]['id'],
+            'release_date': item['release_date'],
+            # Date complète (AAAA-MM-JJ), comparable aux autres : sert au high-water mark de l'ingestion
+            'release_day': full_release_date(item['release_date'], item.get('release_date_precision')),
+            'image_url': item['images'][0]['url'] if item['images'] else None,
+            'spotify_url': item['external_urls']['spotify']
+        }
+    
+    def _album(self, album_id):
+        """Détails d'un album, partagés par get_album_details et get_album_tracks (une seule entrée en cache)"""
+        return self.cache.get('album', [album_id], lambda: self._fetch_album(album_id))
+    
+    # ========== MÉTHODES PUBLIQUES (avec cache) ==========
+    
+    def search_albums(self, query, limit=10):
+        """Recherche des albums sur Spotify"""
+        assert isinstance(query, str) and len(query) > 0, "Query invalide"
+        assert isinstance(limit, int) and 1 <= limit <= 50, "Limit doit être entre 1 et 50"
+        
+        try:
+            return self.cache.get('search_albums', [query.lower(), limit],
+                                  lambda: self._fetch_search_albums(query, limit))
         except Exception as e:
             print(f"Erreur lors de la recherche d'albums: {e}")
             return []
@@ -53,21 +389,8 @@ class SpotifyAPI:
         assert isinstance(limit, int) and 1 <= limit <= 50, "Limit doit être entre 1 et 50"
         
         try:
-            results = self.sp.search(q=query, type='artist', limit=limit)
-            artists = []
-            
-            for item in results['artists']['items']:
-                artist_data = {
-                    'id': item['id'],
-                    'name': item['name'],
-                    'genres': item['genres'],
-                    'image_url': item['images'][0]['url'] if item['images'] else None,
-                    'spotify_url': item['external_urls']['spotify'],
-                    'popularity': item['popularity']
-                }
-                artists.append(artist_data)
-            
-            return artists
+            return self.cache.get('search_artists', [query.lower(), limit],
+                                  lambda: self._fetch_search_artists(query, limit))
         except Exception as e:
             print(f"Erreur lors de la recherche d'artistes: {e}")
             return []
@@ -77,33 +400,7 @@ class SpotifyAPI:
         assert isinstance(album_id, str) and len(album_id) > 0, "Album ID invalide"
         
         try:
-            album = self.sp.album(album_id)
-            
-            album_data = {
-                'id': album['id'],
-                'name': album['name'],
-                'artist': album['artists'][0]['name'],
-                'artist_id': album['artists'][0]['id'],
-                'release_date': album['release_date'],
-                'total_tracks': album['total_tracks'],
-                'image_url': album['images'][0]['url'] if album['images'] else None,
-                'genres': album.get('genres', []),
-                'label': album.get('label', ''),
-                'popularity': album.get('popularity', 0),
-                'spotify_url': album['external_urls']['spotify'],
-                'tracks': []
-            }
-            
-            # Ajouter les pistes
-            for track in album['tracks']['items']:
-                track_data = {
-                    'name': track['name'],
-                    'duration_ms': track['duration_ms'],
-                    'track_number': track['track_number']
-                }
-                album_data['tracks'].append(track_data)
-            
-            return album_data
+            return self._album(album_id)
         except Exception as e:
             print(f"Erreur lors de la récupération de l'album: {e}")
             return None
@@ -113,88 +410,153 @@ class SpotifyAPI:
         assert isinstance(artist_id, str) and len(artist_id) > 0, "Artist ID invalide"
         
         try:
-            artist = self.sp.artist(artist_id)
-            
-            artist_data = {
-                'id': artist['id'],
-                'name': artist['name'],
-                'genres': artist['genres'],
-                'image_url': artist['images'][0]['url'] if artist['images'] else None,
-                'popularity': artist['popularity'],
-                'followers': artist['followers']['total'],
-                'spotify_url': artist['external_urls']['spotify']
-            }
-            
-            return artist_data
+            return self.cache.get('artist', [artist_id], lambda: self._fetch_artist(artist_id))
         except Exception as e:
             print(f"Erreur lors de la récupération de l'artiste: {e}")
             return None
     
+    def get_artists_details(self, artist_ids, fresh=False, retry=True):
+        """
+        Détails de plusieurs artistes : cache d'abord, puis appels groupés par ARTISTS_PER_REQUEST.
+        fresh=True : on ignore le cache (le cache est quand même mis à jour avec les réponses).
+        retry=False : pas de nouvelle tentative, exactement une requête HTTP par paquet.
+        Retourne {spotify_id: artist_data} (les artistes introuvables sont absents).
+        """
+        assert all(isinstance(artist_id, str) and artist_id for artist_id in artist_ids), "Artist ID invalide"
+        
+        artists = {}
+        missing = []
+        for artist_id in dict.fromkeys(artist_ids):
+            cached = None if fresh else self.cache.peek('artist', [artist_id])
+            if cached is not None:
+                artists[artist_id] = cached
+            else:
+                missing.append(artist_id)
+        
+        for start in range(0, len(missing), ARTISTS_PER_REQUEST):
+            chunk = missing[start:start + ARTISTS_PER_REQUEST]
+            try:
+                for artist_data in self._fetch_artists(chunk, MAX_RETRIES if retry else 0):
+                    self.cache.put('artist', [artist_data['id']], artist_data)
+                    artists[artist_data['id']] = artist_data
+            except Exception as e:
+                print(f"Erreur lors de la récupération des artistes: {e}")
+        
+        return artists
+    
     def get_artist_albums(self, artist_id, limit=20):
         """Récupère les albums d'un artiste"""
         assert isinstance(artist_id, str) and len(artist_id) > 0, "Artist ID invalide"
         assert isinstance(limit, int) and 1 <= limit <= 50, "Limit doit être entre 1 et 50"
         
         try:
-            results = self.sp.artist_albums(artist_id, limit=limit, album_type='album')
-            albums = []
-            
-            for item in results['items']:
-                album_data = {
-                    'id': item['id'],
-                    'name': item['name'],
-                    'release_date': item['release_date'],
-                    'total_tracks': item['total_tracks'],
-                    'image_url': item['images'][0]['url'] if item['images'] else None,
-                    'spotify_url': item['external_urls']['spotify']
-                }
-                albums.append(album_data)
-            
-            return albums
+            return self.cache.get('artist_albums', [artist_id, limit],
+                                  lambda: self._fetch_artist_albums(artist_id, limit))
         except Exception as e:
             print(f"Erreur lors de la récupération des albums de l'artiste: {e}")
             return []
     
+    def get_artist_discography(self, artist_id):
+        """Récupère toute la discographie (albums + singles) d'un artiste"""
+        assert isinstance(artist_id, str) and len(artist_id) > 0, "Artist ID invalide"
+        
+        try:
+            return self.cache.get('artist_discography', [artist_id],
+                                  lambda: self._fetch_artist_discography(artist_id))
+        except Exception as e:
+            print(f"Erreur lors de la récupération de la discographie: {e}")
+            return []
+    
+    def get_albums_details(self, album_ids, fresh=False):
+        """
+        Détails complets de plusieurs albums : ceux déjà en cache sont lus dans le cache,
+        les autres sont demandés à Spotify par paquets de ALBUMS_PER_REQUEST.
+        fresh=True : on ignore le cache (le cache est quand même mis à jour avec les réponses).
+        Retourne {spotify_id: album_data} (les albums introuvables sont absents).
+        """
+        assert all(isinstance(album_id, str) and album_id for album_id in album_ids), "Album ID invalide"
+        
+        albums = {}
+        missing = []
+        for album_id in dict.fromkeys(album_ids):
+            cached = None if fresh else self.cache.peek('album', [album_id])
+            if cached is not None:
+                albums[album_id] = cached
+            else:
+                missing.append(album_id)
+        
+        for start in range(0, len(missing), ALBUMS_PER_REQUEST):
+            chunk = missing[start:start + ALBUMS_PER_REQUEST]
+            try:
+                for album_data in self._fetch_albums(chunk):
+                    self.cache.put('album', [album_data['id']], album_data)
+                    albums[album_data['id']] = album_data
+            except Exception as e:
+                print(f"Erreur lors de la récupération des albums: {e}")
+        
+        return albums
+    
+    def get_albums_metadata(self, album_ids, retry=True):
+        """
+        Nom, image et genres de plusieurs albums, toujours demandés à Spotify : exactement un appel
+        par paquet de ALBUMS_PER_REQUEST (on ne suit pas les pages de pistes des gros albums,
+        contrairement à get_albums_details). Sert au rafraîchissement des métadonnées, qui a un budget d'appels.
+        retry=False : pas de nouvelle tentative, exactement une requête HTTP par paquet.
+        Les réponses ne vont pas dans le cache (leurs pistes sont incomplètes).
+        Retourne {spotify_id: {'id', 'name', 'image_url', 'genres'}} (les albums introuvables sont absents).
+        """
+        assert all(isinstance(album_id, str) and album_id for album_id in album_ids), "Album ID invalide"
+        
+        album_ids = list(dict.fromkeys(album_ids))
+        albums = {}
+        for start in range(0, len(album_ids), ALBUMS_PER_REQUEST):
+            chunk = album_ids[start:start + ALBUMS_PER_REQUEST]
+            try:
+                results = self._call(self.sp.albums, chunk, retries=MAX_RETRIES if retry else 0)
+            except Exception as e:
+                print(f"Erreur lors de la récupération des albums: {e}")
+                continue
+            for album in results['albums']:
+                if album:
+                    albums[album['id']] = {
+                        'id': album['id'],
+                        'name': album['name'],
+                        'image_url': album['images'][0]['url'] if album['images'] else None,
+                        'genres': album.get('genres', []),
+                    }
+        
+        return albums
+    
     def get_new_releases(self, limit=20):
         """Récupère les nouvelles sorties"""
         assert isinstance(limit, int) and 1 <= limit <= 50, "Limit doit être entre 1 et 50"
         
         try:
-            results = self.sp.new_releases(limit=limit)
-            albums = []
-            
-            for item in results['albums']['items']:
-                album_data = {
-                    'id': item['id'],
-                    'name': item['name'],
-                    'artist': item['artists'][0]['name'],
-                    'artist_id': item['artists'][0]['id'],
-                    'release_date': item['release_date'],
-                    'image_url': item['images'][0]['url'] if item['images'] else None,
-                    'spotify_url': item['external_urls']['spotify']
-                }
-                albums.append(album_data)
-            
-            return albums
+            return self.cache.get('new_releases', [limit], lambda: self._fetch_new_releases(limit))
         except Exception as e:
             print(f"Erreur lors de la récupération des nouvelles sorties: {e}")
             return []
     
+    def iter_new_releases(self):
+        """
+        Parcourt toutes les pages des nouvelles sorties (NEW_RELEASES_PAGE albums par page),
+        sans cache : c'est la tâche d'ingestion qui l'utilise.
+        Les erreurs remontent (la tâche sera retentée plus tard).
+        """
+        page = self._call(self.sp.new_releases, limit=NEW_RELEASES_PAGE)['albums']
+        while page:
+            yield [self._format_release(item) for item in page['items']]
+            page = self._call(self.sp.next, page)['albums'] if page.get('next') else None
+    
     def get_album_tracks(self, spotify_album_id):
         """Récupère les pistes d'un album avec durée formatée"""
         assert isinstance(spotify_album_id, str) and len(spotify_album_id) > 0, "Album ID invalide"
         
         try:
-            album = self.sp.album(spotify_album_id)
             tracks = []
-            
-            for track in album['tracks']['items']:
-                track_data = {
-                    'name': track['name'],
-                    'duration_ms': track['duration_ms'],
-                    'track_number': track['track_number'],
-                    'duration_formatted': self._format_duration(track['duration_ms'])
-                }
+            for track in self._album(spotify_album_id)['tracks']:
+                track_data = dict(track)
+                track_data['duration_formatted'] = self._format_duration(track['duration_ms'])
                 tracks.append(track_data)
             
             return tracks
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""Outils communs aux tests : une base SQLite neuve (fichier temporaire) par test"""
+
+import os
+import sys
+
+import pytest
+
+# Les modules de l'appli sont à la racine du dépôt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Une base vide, déjà migrée à la dernière version du schéma"""
+    return Database(str(tmp_path / 'test.db'), pool_size=3)
+
+
+@pytest.fixture
+def seed(db):
+    """Deux utilisateurs, un artiste et un album"""
+    alice = db.create_user('alice', 'alice@example.com', 'secret1')
+    bob = db.create_user('bob', 'bob@example.com', 'secret2')
+    artist_id = db.create_artist('Artiste', 'sp_artist')
+    album_id = db.create_album('Album', artist_id, '2020-01-01', 'sp_album')
+    return {'alice': alice, 'bob': bob, 'artist_id': artist_id, 'album_id': album_id}
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de ResponseCache (fraîche, "stale-while-revalidate", "stale-if-error")"""
+
+import threading
+import time
+
+import pytest
+
+import cache
+from cache import ResponseCache
+
+
+class Clock:
+    """Fausse horloge : on avance le temps à la main au lieu d'attendre"""
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    return clock
+
+
+def make_cache(tmp_path=None):
+    # ttl = 10 secondes, puis 20 secondes pendant lesquelles on sert l'ancienne réponse
+    store_path = str(tmp_path / 'http_cache.db') if tmp_path else None
+    return ResponseCache({'album': (10, 20)}, store_path=store_path)
+
+
+def wait_for_refresh(responses):
+    """Attend la fin du rafraîchissement en arrière-plan"""
+    for _ in range(200):
+        with responses._lock:
+            if not responses._refreshing:
+                return
+        time.sleep(0.01)
+    raise AssertionError("le rafraîchissement en arrière-plan ne s'est pas terminé")
+
+
+def test_fresh_entry_is_served_without_calling_fetch(clock):
+    responses = make_cache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {'name': 'Album', 'tracks': []}
+
+    first = responses.get('album', {'id': 'a1'}, fetch)
+    first['tracks'].append('modifié par l\'appelant')
+    clock.now += 5
+    second = responses.get('album', {'id': 'a1'}, fetch)
+
+    assert calls == [1]
+    assert second == {'name': 'Album', 'tracks': []}  # Le cache garde sa propre copie
+    assert responses.stats()['memory_hits'] == 1
+
+
+def test_stale_entry_is_served_then_refreshed_in_background(clock):
+    responses = make_cache()
+    responses.get('album', {'id': 'a1'}, lambda: 'v1')
+
+    release = threading.Event()
+
+    def slow_fetch():
+        release.wait(2)
+        return 'v2'
+
+    clock.now += 15  # Entre ttl et ttl + stale
+    # L'ancienne réponse arrive tout de suite, même si l'API est lente
+    assert responses.get('album', {'id': 'a1'}, slow_fetch) == 'v1'
+    # Un seul rafraîchissement à la fois pour une même clé
+    assert responses.get('album', {'id': 'a1'}, slow_fetch) == 'v1'
+    assert len(responses._refreshing) == 1
+
+    release.set()
+    wait_for_refresh(responses)
+
+    assert responses.get('album', {'id': 'a1'}, lambda: 'v3') == 'v2'
+    stats = responses.stats()
+    assert stats['stale_hits'] == 2
+    assert stats['refreshes'] == 1
+
+
+def test_failed_background_refresh_keeps_old_value(clock):
+    responses = make_cache()
+    responses.get('album', {'id': 'a1'}, lambda: 'v1')
+
+    def broken():
+        raise RuntimeError('API en panne')
+
+    clock.now += 15
+    assert responses.get('album', {'id': 'a1'}, broken) == 'v1'
+    wait_for_refresh(responses)
+
+    assert responses.stats()['refresh_errors'] == 1
+    assert responses.get('album', {'id': 'a1'}, broken) == 'v1'
+
+
+def test_expired_entry_waits_for_new_value(clock):
+    responses = make_cache()
+    responses.get('album', {'id': 'a1'}, lambda: 'v1')
+
+    clock.now += 31  # Au-delà de ttl + stale
+    assert responses.get('album', {'id': 'a1'}, lambda: 'v2') == 'v2'
+    assert responses.stats()['misses'] == 2
+
+
+def test_expired_entry_is_served_from_store_when_api_fails(clock, tmp_path):
+    responses = make_cache(tmp_path)
+    responses.get('album', {'id': 'a1'}, lambda: 'v1')
+
+    def broken():
+        raise RuntimeError('API en panne')
+
+    clock.now += 31
+    # Un autre worker (cache mémoire vide) retrouve la vieille réponse dans le fichier
+    other_worker = make_cache(tmp_path)
+    assert other_worker.get('album', {'id': 'a1'}, broken) == 'v1'
+    assert other_worker.stats()['error_fallbacks'] == 1
+
+
+def test_miss_without_old_value_raises(clock):
+    responses = make_cache()
+
+    def broken():
+        raise RuntimeError('API en panne')
+
+    with pytest.raises(RuntimeError):
+        responses.get('album', {'id': 'a1'}, broken)
+    assert responses.peek('album', {'id': 'a1'}) is None
+
+
+def test_store_is_shared_between_caches(clock, tmp_path):
+    # Deux workers = deux caches mémoire devant le même fichier
+    worker_1 = make_cache(tmp_path)
+    worker_2 = make_cache(tmp_path)
+    worker_1.put('album', {'id': 'a1'}, 'v1')
+
+    assert worker_2.peek('album', {'id': 'a1'}) == 'v1'
+    assert worker_2.stats()['store_hits'] == 1
+    clock.now += 31
+    assert worker_2.peek('album', {'id': 'a1'}) is None
+
+
+def test_purge_removes_rows_no_endpoint_can_serve(clock, tmp_path):
+    # La plus longue période est celle de 'album' : 10 + 20 = 30 secondes
+    responses = ResponseCache({'album': (10, 20), 'search': (1, 2)}, store_path=str(tmp_path / 'http_cache.db'))
+    responses.put('album', {'id': 'vieux'}, 'v1')
+    responses.put('search', {'q': 'vieille'}, ['r1'])
+    clock.now += 20
+    responses.put('album', {'id': 'récent'}, 'v2')
+
+    clock.now += 11  # Les deux premières lignes ont 31 secondes, la dernière 11
+    assert responses.purge() == 2
+    assert responses.store.get(responses._key('album', {'id': 'vieux'})) is None
+    assert responses.store.get(responses._key('search', {'q': 'vieille'})) is None
+    assert responses.store.get(responses._key('album', {'id': 'récent'})) is not None
+    assert responses.purge() == 0
+
+
+def test_purge_without_store(clock):
+    assert make_cache().purge() == 0
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de concurrency.py (SingleFlight et FanOut)"""
+
+import threading
+import time
+
+import pytest
+
+from concurrency import FanOut, SingleFlight
+
+
+# ========== SINGLE FLIGHT ==========
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return 'résultat'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('clé', slow)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('clé', slow))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()['shared'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(2)
+
+    assert results == ['résultat'] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {'executed': 1, 'shared': 3, 'in_flight': 0}
+
+
+def test_single_flight_shares_errors_and_forgets_them():
+    flight = SingleFlight()
+
+    def broken():
+        raise ValueError('panne')
+
+    with pytest.raises(ValueError):
+        flight.do('clé', broken)
+    assert flight.do('clé', lambda: 'ok') == 'ok'  # L'erreur n'est pas gardée
+
+
+# ========== FAN OUT ==========
+
+def test_required_calls_run_in_caller_thread():
+    fan_out = FanOut(max_workers=2)
+    caller = threading.current_thread()
+    found = fan_out.run({'local': lambda: threading.current_thread()},
+                        {'remote': lambda: threading.current_thread()})
+    assert found['local'] is caller
+    assert found['remote'] is not caller
+
+
+def test_late_and_failing_optional_calls_get_defaults():
+    fan_out = FanOut(max_workers=2)
+
+    def broken():
+        raise RuntimeError('panne')
+
+    found = fan_out.run({'local': lambda: 1},
+                        {'slow': lambda: time.sleep(0.5) or 'trop tard', 'broken': broken},
+                        timeout=0.05, defaults={'slow': [], 'broken': []})
+    assert found == {'local': 1, 'slow': [], 'broken': []}
+    assert fan_out.stats()['late'] == 1
+    assert fan_out.stats()['errors'] == 1
+
+
+def test_required_error_is_raised():
+    fan_out = FanOut(max_workers=1)
+    with pytest.raises(KeyError):
+        fan_out.run({'local': lambda: {}['absent']})
+
+
+def test_deadline_covers_the_whole_call():
+    fan_out = FanOut(max_workers=2)
+    started = time.monotonic()
+    found = fan_out.run({'local': lambda: time.sleep(0.1)},
+                        {'remote': lambda: time.sleep(1) or 'trop tard'}, timeout=0.15)
+    assert time.monotonic() - started < 0.5
+    assert found['remote'] is None
+
+
+def test_saturated_pool_does_not_delay_local_work():
+    # Régression : les appels lents occupaient tout le pool partagé et les recherches
+    # locales attendaient derrière eux
+    fan_out = FanOut(max_workers=2)
+    release = threading.Event()
+    for _ in range(2):
+        fan_out.run(optional={'stuck': lambda: release.wait(2)}, timeout=0)
+
+    started = time.monotonic()
+    found = fan_out.run({'local': lambda: 'local'}, {'remote': lambda: 'jamais lancé'}, timeout=1)
+    assert time.monotonic() - started < 0.5
+    assert found == {'local': 'local', 'remote': None}
+    assert fan_out.stats()['skipped'] == 1
+
+    release.set()
+    while fan_out.stats()['in_flight']:
+        time.sleep(0.01)
+    assert fan_out.run(optional={'remote': lambda: 'ok'})['remote'] == 'ok'
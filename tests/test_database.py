@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de database.py (pool de connexions et requêtes)"""
+
+import sqlite3
+
+import pytest
+
+from database import Database
+from models import User
+
+
+def assert_pool_idle(db):
+    """Toutes les connexions empruntées ont bien été rendues au pool"""
+    assert db.get_pool_stats()['in_use'] == 0
+
+
+# ========== POOL DE CONNEXIONS ==========
+
+def test_connection_is_reused(db):
+    conn = db.get_connection()
+    raw = conn._conn
+    conn.close()
+    conn.close()  # Deux close() de suite : sans effet
+    again = db.get_connection()
+    assert again._conn is raw
+    again.close()
+    assert_pool_idle(db)
+
+
+def test_pool_timeout_when_exhausted(db):
+    db.pool.timeout = 0.05
+    borrowed = [db.get_connection() for _ in range(db.pool.max_size)]
+    with pytest.raises(sqlite3.OperationalError, match='épuisé'):
+        db.get_connection()
+    for conn in borrowed:
+        conn.close()
+    assert db.get_pool_stats()['timeouts'] == 1
+
+
+def test_release_rolls_back_unfinished_transaction(db, seed):
+    conn = db.get_connection()
+    conn.execute('UPDATE users SET bio = ? WHERE id = ?', ('pas validé', seed['alice']))
+    conn.close()
+    assert db.get_user_by_id(seed['alice']).bio != 'pas validé'
+
+
+def test_failed_write_releases_connection_and_lock(db, seed):
+    # Régression : l'IntegrityError (clé étrangère) laissait la connexion empruntée,
+    # avec sa transaction ouverte qui gardait le verrou d'écriture de SQLite
+    for _ in range(db.pool.max_size + 1):
+        assert db.create_tag(99999, 'rock', seed['alice']) is None
+        assert db.create_reply(99999, seed['alice'], 'bonjour') is None
+    assert_pool_idle(db)
+
+    # Les écritures suivantes passent toujours
+    db.pool.timeout = 0.5
+    assert db.create_tag(seed['artist_id'], 'Rock', seed['alice']) is not None
+    assert db.create_rating(seed['alice'], seed['album_id'], 8) is not None
+    assert_pool_idle(db)
+
+
+def test_rating_unknown_album_is_not_an_update(db, seed):
+    # Régression : la clé étrangère passait pour "déjà noté" et la fonction retournait True
+    assert db.create_rating(seed['alice'], 99999, 8) is None
+    assert db.get_user_ratings_page(seed['alice'])[0] == []
+    assert_pool_idle(db)
+
+    rating_id = db.create_rating(seed['alice'], seed['album_id'], 8)
+    assert isinstance(rating_id, int)
+    assert db.create_rating(seed['alice'], seed['album_id'], 9) is True
+    assert db.get_user_rating(seed['alice'], seed['album_id']).score == 9
+
+
+def test_unexpected_error_still_releases_connection(db):
+    with pytest.raises(sqlite3.OperationalError):
+        db._fetch_rows_by_ids('table_inconnue', [1])
+    assert_pool_idle(db)
+
+
+# ========== CACHE DES ENTITÉS ==========
+
+def test_albums_are_cached_and_copied(db, seed):
+    album = db.get_album_by_id(seed['album_id'])
+    album.title = 'modifié par l\'appelant'
+    stats = db.get_entity_cache_stats()
+    again = db.get_album_by_id(seed['album_id'])
+    assert again.title == 'Album'  # Le cache garde sa propre copie
+    assert db.get_entity_cache_stats()['hits'] == stats['hits'] + 1
+
+
+def test_users_are_always_read_from_the_database(db, seed, tmp_path):
+    # Un autre processus du serveur = une autre instance Database sur le même fichier
+    other = Database(str(tmp_path / 'test.db'))
+    assert db.get_user_by_id(seed['alice']).check_password('secret1')
+
+    other.update_user_password(seed['alice'], User.hash_password('nouveau'))
+    user = db.get_user_by_id(seed['alice'])
+    assert not user.check_password('secret1')
+    assert user.check_password('nouveau')
+
+
+# ========== FIL D'ACTUALITÉ ==========
+
+def add_users(db, count):
+    """Ajoute `count` utilisateurs directement en SQL (sans le coût du cryptage des mots de passe)"""
+    conn = db.get_connection()
+    try:
+        conn.executemany('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                         [(f'user{i}', f'user{i}@example.com', '') for i in range(count)])
+        conn.commit()
+        return [row[0] for row in conn.execute('SELECT id FROM users ORDER BY id DESC LIMIT ?', (count,))]
+    finally:
+        conn.close()
+
+
+def timeline_ids(db, user_id, limit=20):
+    """Tous les ids du fil, page par page"""
+    ids, before_id = [], None
+    while True:
+        items, before_id = db.get_friends_timeline(user_id, limit=limit, before_id=before_id)
+        ids.extend(item['rating'].id for item in items)
+        if before_id is None:
+            return ids
+
+
+def test_timeline_merges_push_and_pull_accounts(db, seed):
+    pushed = db.create_rating(seed['bob'], seed['album_id'], 7)
+    star = db.create_user('star', 'star@example.com', 'secret3')
+    db.follow_user(seed['alice'], seed['bob'])
+    db.follow_user(seed['alice'], star)
+    conn = db.get_connection()
+    try:
+        conn.execute('UPDATE users SET timeline_pull = 1 WHERE id = ?', (star,))
+        conn.commit()
+    finally:
+        conn.close()
+    second_album = db.create_album('Album 2', seed['artist_id'])
+    pulled = [db.create_rating(star, album_id, 9) for album_id in (seed['album_id'], second_album)]
+
+    assert timeline_ids(db, seed['alice'], limit=1) == [pulled[1], pulled[0], pushed]
+
+
+def test_timeline_with_many_pull_accounts(db, seed):
+    # Régression : une branche UNION ALL par compte "pull" dépassait la limite de 500 de SQLite
+    stars = add_users(db, 600)
+    conn = db.get_connection()
+    try:
+        conn.executemany('INSERT INTO follows (follower_id, following_id) VALUES (?, ?)',
+                         [(seed['alice'], star) for star in stars])
+        conn.execute(f'UPDATE users SET timeline_pull = 1 WHERE id IN ({",".join("?" * len(stars))})', stars)
+        conn.commit()
+    finally:
+        conn.close()
+    expected = [db.create_rating(star, seed['album_id'], 5) for star in stars[:30]]
+
+    assert timeline_ids(db, seed['alice'], limit=7) == sorted(expected, reverse=True)
+
+
+def test_trim_timelines_keeps_most_recent(db, seed):
+    db.follow_user(seed['alice'], seed['bob'])
+    albums = [db.create_album(f'Album {i}', seed['artist_id']) for i in range(5)]
+    ratings = [db.create_rating(seed['bob'], album_id, 6) for album_id in albums]
+
+    assert db.trim_timelines(keep=2) == 3
+    assert timeline_ids(db, seed['alice']) == ratings[:-3:-1]
+
+
+# ========== STATISTIQUES DES ALBUMS (triggers) ==========
+
+def test_album_stats_follow_rating_writes(db, seed):
+    carol = db.create_user('carol', 'carol@example.com', 'secret3')
+    album_id = seed['album_id']
+    db.create_rating(seed['alice'], album_id, 8)
+    db.create_rating(seed['bob'], album_id, 6.5)
+    rating_id = db.create_rating(carol, album_id, 10)
+    stats = db.get_album_stats(album_id)
+    assert stats['num_ratings'] == 3
+    assert stats['avg_score'] == round((8 + 6.5 + 10) / 3, 2)
+    assert stats['histogram'][6] == 1 and stats['histogram'][8] == 1 and stats['histogram'][10] == 1
+
+    db.create_rating(seed['bob'], album_id, 2)  # Nouvelle note du même utilisateur = mise à jour
+    db.delete_rating(rating_id, carol)
+    stats = db.get_album_stats(album_id)
+    assert stats['num_ratings'] == 2
+    assert stats['avg_score'] == 5
+    assert stats['histogram'][6] == 0 and stats['histogram'][2] == 1 and stats['histogram'][10] == 0
+
+    db.rebuild_album_stats()  # Le recalcul complet donne la même chose
+    assert db.get_album_stats(album_id) == stats
+
+
+def test_rankings_need_three_ratings(db, seed):
+    carol = db.create_user('carol', 'carol@example.com', 'secret3')
+    small = db.create_album('Une seule note', seed['artist_id'])
+    db.create_rating(seed['alice'], small, 10)
+    for user_id, score in ((seed['alice'], 7), (seed['bob'], 8), (carol, 9)):
+        db.create_rating(user_id, seed['album_id'], score)
+
+    assert [item['album'].id for item in db.get_top_rated_albums()] == [seed['album_id']]
+    assert db.get_album_stats(small)['num_ratings'] == 1
+
+
+def album_stats_row(db, album_id):
+    conn = db.get_connection()
+    try:
+        row = conn.execute('SELECT score_tenths, avg_score FROM album_stats WHERE album_id = ?',
+                           (album_id,)).fetchone()
+        exact = conn.execute('SELECT SUM(score), AVG(score) FROM ratings WHERE album_id = ?',
+                             (album_id,)).fetchone()
+    finally:
+        conn.close()
+    return (row['score_tenths'], row['avg_score']) if row else None, tuple(exact)
+
+
+def test_album_stats_have_no_rounding_drift(db, seed):
+    # Régression : avec une somme REAL, 7.1 + 8.2 + 6.3 puis 7.1 → 9.7 donnait 24.199999999999996
+    carol = db.create_user('carol', 'carol@example.com', 'secret3')
+    album_id = seed['album_id']
+    db.create_rating(seed['alice'], album_id, 7.1)
+    db.create_rating(seed['bob'], album_id, 8.2)
+    db.create_rating(carol, album_id, 6.3)
+    db.create_rating(seed['alice'], album_id, 9.7)
+
+    (tenths, avg), (exact_sum, exact_avg) = album_stats_row(db, album_id)
+    assert tenths == 242 and exact_sum == 24.2
+    assert avg == exact_avg == 24.2 / 3
+
+    before = album_stats_row(db, album_id)
+    db.rebuild_album_stats()  # Le recalcul complet tombe exactement sur les mêmes valeurs
+    assert album_stats_row(db, album_id) == before
+
+    # Toutes les notes retirées sauf une : pas de reste du genre 1e-15
+    for user_id in (seed['bob'], carol):
+        rating = db.get_user_rating(user_id, album_id)
+        db.delete_rating(rating.id, user_id)
+    assert album_stats_row(db, album_id)[0] == (97, 9.7)
+
+
+def test_rankings_break_ties_by_album_id(db, seed):
+    users = [seed['alice'], seed['bob'], db.create_user('carol', 'carol@example.com', 'secret3')]
+    album_ids = [db.create_album(f'Ex-aequo {i}', seed['artist_id']) for i in range(4)]
+    for album_id in album_ids:
+        for user_id, score in zip(users, (6.1, 7.2, 8.3)):
+            db.create_rating(user_id, album_id, score)
+
+    assert [item['album'].id for item in db.get_top_rated_albums(10)] == sorted(album_ids, reverse=True)
+    assert [item['album'].id for item in db.get_worst_rated_albums(10)] == sorted(album_ids)
+
+
+# ========== COMPTEURS DES UTILISATEURS (triggers) ==========
+
+def test_user_stats_follow_writes(db, seed):
+    alice, bob = seed['alice'], seed['bob']
+    assert db.get_user_stats(alice) == {'ratings_count': 0, 'followers_count': 0,
+                                        'following_count': 0, 'replies_count': 0}
+
+    rating_id = db.create_rating(alice, seed['album_id'], 8)
+    db.create_rating(alice, seed['album_id'], 9)  # Mise à jour : pas une note de plus
+    db.follow_user(bob, alice)
+    db.follow_user(bob, alice)  # Déjà suivie : rien ne change
+    db.create_reply(rating_id, bob, 'Pas d\'accord')
+    reply_id = db.create_reply(rating_id, bob, 'Vraiment pas')
+    db.delete_reply(reply_id, bob)
+
+    assert db.get_user_stats(alice) == {'ratings_count': 1, 'followers_count': 1,
+                                        'following_count': 0, 'replies_count': 0}
+    assert db.get_user_stats(bob) == {'ratings_count': 0, 'followers_count': 0,
+                                      'following_count': 1, 'replies_count': 1}
+
+    db.unfollow_user(bob, alice)
+    db.delete_rating(rating_id, alice)  # Ses réponses partent avec elle
+    assert db.get_user_stats(alice)['ratings_count'] == 0
+    assert db.get_user_stats(alice)['followers_count'] == 0
+    assert db.get_user_stats(bob)['following_count'] == 0
+    assert db.get_user_stats(bob)['replies_count'] == 0
+    assert db.reconcile_user_stats() == 0  # Les triggers ont tout tenu à jour
+
+
+def test_reconcile_user_stats_fixes_wrong_counters(db, seed):
+    db.create_rating(seed['alice'], seed['album_id'], 8)
+    db.follow_user(seed['bob'], seed['alice'])
+    conn = db.get_connection()
+    try:
+        # Compteurs abîmés à la main (ex : base restaurée à moitié)
+        conn.execute('UPDATE user_stats SET ratings_count = 5 WHERE user_id = ?', (seed['alice'],))
+        conn.execute('DELETE FROM user_stats WHERE user_id = ?', (seed['bob'],))
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert db.reconcile_user_stats() == 2
+    assert db.get_user_stats(seed['alice'])['ratings_count'] == 1
+    assert db.get_user_stats(seed['bob'])['following_count'] == 1
+    assert db.reconcile_user_stats() == 0
+
+
+# ========== CRITIQUES D'UN ALBUM (pagination par curseur) ==========
+
+def all_pages(fetch, limit):
+    """Suit les curseurs jusqu'à la dernière page ; retourne toutes les lignes et le nombre de pages"""
+    items, cursor, pages = [], None, 0
+    while True:
+        page, cursor = fetch(limit, cursor)
+        items += page
+        pages += 1
+        if cursor is None:
+            return items, pages
+
+
+def test_reply_count_follows_replies(db, seed):
+    rating_id = db.create_rating(seed['alice'], seed['album_id'], 8)
+    first = db.create_reply(rating_id, seed['bob'], 'Un')
+    db.create_reply(rating_id, seed['alice'], 'Deux')
+    assert db.get_replies_count(rating_id) == 2
+
+    db.delete_reply(first, seed['bob'])
+    assert db.get_replies_count(rating_id) == 1
+    assert db.get_replies_counts([rating_id, 999]) == {rating_id: 1, 999: 0}
+
+
+@pytest.mark.parametrize('sort', ['newest', 'highest', 'discussed'])
+def test_album_ratings_cursor_visits_every_rating_once(db, seed, sort):
+    album_id = seed['album_id']
+    # Des ex-aequo sur la note et sur le nombre de réponses : l'id départage
+    scores = [7, 9, 7, 5.5, 9, 7, 10]
+    reply_counts = [0, 2, 2, 1, 0, 3, 0]
+    for i, (score, replies) in enumerate(zip(scores, reply_counts)):
+        user_id = db.create_user(f'user{i}', f'user{i}@example.com', 'secret')
+        rating_id = db.create_rating(user_id, album_id, score)
+        for _ in range(replies):
+            db.create_reply(rating_id, seed['bob'], 'Réponse')
+
+    full = db.get_album_ratings(album_id)
+    key = {
+        'newest': lambda r: (r.id,),
+        'highest': lambda r: (r.score, r.id),
+        'discussed': lambda r: (db.get_replies_count(r.id), r.id),
+    }[sort]
+    expected = [r.id for r in sorted(full, key=key, reverse=True)]
+
+    ratings, pages = all_pages(lambda limit, cursor: db.get_album_ratings_page(album_id, sort, limit, cursor), 2)
+    assert [r.id for r in ratings] == expected
+    assert pages == 4
+    assert all(r.user['username'].startswith('user') for r in ratings)
+    assert [r.replies_count for r in ratings] == [db.get_replies_count(r.id) for r in ratings]
+
+
+def test_album_ratings_invalid_cursor_restarts_from_first_page(db, seed):
+    db.create_rating(seed['alice'], seed['album_id'], 8)
+    db.create_rating(seed['bob'], seed['album_id'], 6)
+    first, _ = db.get_album_ratings_page(seed['album_id'], 'highest', 1)
+    for cursor in ('pas-un-curseur', '8.0', 'a:b'):
+        page, _ = db.get_album_ratings_page(seed['album_id'], 'highest', 1, cursor)
+        assert [r.id for r in page] == [r.id for r in first]
+
+
+# ========== CONVERSATION D'UNE CRITIQUE ==========
+
+def test_rating_thread_pages_through_replies(db, seed):
+    rating_id = db.create_rating(seed['alice'], seed['album_id'], 8, 'Très bon')
+    reply_ids = [db.create_reply(rating_id, seed['bob'], f'Réponse {i}') for i in range(5)]
+
+    thread = db.get_rating_thread(rating_id, limit=2)
+    assert thread['rating'].user['username'] == 'alice'
+    assert thread['rating'].replies_count == 5
+    assert thread['album'].id == seed['album_id']
+    assert thread['artist'].id == seed['artist_id']
+
+    seen, after = [], None
+    while True:
+        thread = db.get_rating_thread(rating_id, after_reply_id=after, limit=2)
+        seen += [reply.id for reply in thread['replies']]
+        assert all(reply.user['username'] == 'bob' for reply in thread['replies'])
+        after = thread['next_after']
+        if after is None:
+            break
+    assert seen == reply_ids
+
+    # Une réponse écrite pendant la lecture apparaît à la page suivante
+    last_page = db.get_rating_thread(rating_id, after_reply_id=reply_ids[3], limit=2)
+    assert last_page['next_after'] is None
+    new_id = db.create_reply(rating_id, seed['alice'], 'Merci')
+    assert [r.id for r in db.get_rating_thread(rating_id, after_reply_id=reply_ids[4])['replies']] == [new_id]
+
+
+def test_rating_thread_unknown_rating(db, seed):
+    assert db.get_rating_thread(999) is None
+
+
+# ========== HISTORIQUE DES NOTES D'UN UTILISATEUR ==========
+
+def test_user_ratings_cursor_follows_created_at_then_id(db, seed):
+    alice = seed['alice']
+    rating_ids = []
+    for i in range(7):
+        album_id = db.create_album(f'Album {i}', seed['artist_id'])
+        rating_ids.append(db.create_rating(alice, album_id, i))
+    db.create_rating(seed['bob'], seed['album_id'], 5)  # Pas dans l'historique d'alice
+
+    # Dates dans le désordre, avec des ex-aequo (même seconde) départagés par l'id
+    dates = ['2024-01-01 10:00:00', '2024-03-01 10:00:00', '2024-03-01 10:00:00', '2023-06-01 10:00:00',
+             '2024-03-01 10:00:00', '2024-02-01 10:00:00', '2023-06-01 10:00:00']
+    conn = db.get_connection()
+    try:
+        conn.executemany('UPDATE ratings SET created_at = ? WHERE id = ?', zip(dates, rating_ids))
+        conn.commit()
+    finally:
+        conn.close()
+    expected = [rating_id for _, rating_id in sorted(zip(dates, rating_ids), reverse=True)]
+
+    ratings, pages = all_pages(lambda limit, cursor: db.get_user_ratings_page(alice, limit, cursor), 3)
+    assert [r.id for r in ratings] == expected
+    assert pages == 3
+
+    first, cursor = db.get_user_ratings_page(alice, 3)
+    assert cursor == f"2024-03-01 10:00:00:{expected[2]}"
+    # Curseur abîmé : on repart du début plutôt que de planter
+    assert [r.id for r in db.get_user_ratings_page(alice, 3, 'n-importe-quoi')[0]] == [r.id for r in first]
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de importer.py avec un faux client Spotify (aucun appel réseau)"""
+
+import pytest
+from spotipy.exceptions import SpotifyException
+
+import spotify_api
+from importer import HIGH_WATER_MARK, MetadataRefresher, NewReleasesIngester
+from spotify_api import SpotifyAPI, full_release_date
+
+
+def release(spotify_id, release_date, precision):
+    """Un élément de /browse/new-releases, tel que Spotify le renvoie"""
+    return SpotifyAPI._format_release({
+        'id': spotify_id,
+        'name': f'Album {spotify_id}',
+        'artists': [{'id': f'artist_{spotify_id}', 'name': f'Artiste {spotify_id}'}],
+        'release_date': release_date,
+        'release_date_precision': precision,
+        'images': [],
+        'external_urls': {'spotify': f'https://open.spotify.com/album/{spotify_id}'},
+    })
+
+
+class FakeSpotify:
+    """Répond avec des pages de nouveautés fixées d'avance et compte les pages demandées"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.pages_read = 0
+
+    def iter_new_releases(self):
+        for page in self.pages:
+            self.pages_read += 1
+            yield page
+
+    def get_albums_details(self, album_ids, fresh=False):
+        releases = {item['id']: item for page in self.pages for item in page}
+        return {album_id: dict(releases[album_id], genres=[], tracks=[]) for album_id in album_ids}
+
+    def get_artists_details(self, artist_ids, fresh=False):
+        return {artist_id: {'id': artist_id, 'name': artist_id, 'genres': []} for artist_id in artist_ids}
+
+
+def test_full_release_date():
+    assert full_release_date('2024', 'year') == '2024-01-01'
+    assert full_release_date('2024-05', 'month') == '2024-05-01'
+    assert full_release_date('2024-05-17', 'day') == '2024-05-17'
+    assert full_release_date('2024-05') == '2024-05-01'  # Précision inconnue : d'après la longueur
+    assert full_release_date(None) == ''
+
+
+def test_high_water_mark_with_mixed_precisions(db):
+    spotify = FakeSpotify([[release('a', '2024-06', 'month'), release('b', '2024-05-17', 'day'),
+                            release('c', '2023', 'year')]])
+    report = NewReleasesIngester(db, spotify).run()
+    assert report['added'] == 3
+    assert report['high_water_mark'] == '2024-06-01'
+    assert db.get_job_state(HIGH_WATER_MARK) == '2024-06-01'
+
+
+def test_year_precision_release_does_not_stop_early(db):
+    # Régression : '2024' < '2024-01-01' en comparant les chaînes brutes, la première page
+    # était prise pour "déjà vue" et on s'arrêtait avant d'avoir tout lu
+    db.set_job_state(HIGH_WATER_MARK, '2024-01-01')
+    spotify = FakeSpotify([[release('d', '2024', 'year')],
+                           [release('e', '2023-12-31', 'day')],
+                           [release('f', '2023-12-30', 'day')]])
+    report = NewReleasesIngester(db, spotify).run()
+    assert spotify.pages_read == 2
+    assert report['added'] == 2
+    assert report['high_water_mark'] == '2024-01-01'
+
+
+def test_old_unpadded_mark_is_normalized(db):
+    db.set_job_state(HIGH_WATER_MARK, '2024')
+    spotify = FakeSpotify([[release('g', '2024-01-01', 'day')]])
+    assert NewReleasesIngester(db, spotify).run()['high_water_mark'] == '2024-01-01'
+
+
+class FakeSpotipy:
+    """Remplace spotipy.Spotify : albums de 120 pistes (3 pages), artistes renommés"""
+
+    def albums(self, album_ids):
+        return {'albums': [{
+            'id': album_id, 'name': f'Nouveau titre {album_id}', 'artists': [{'id': 'a', 'name': 'A'}],
+            'release_date': '2020', 'total_tracks': 120, 'images': [], 'genres': ['rock'],
+            'external_urls': {'spotify': ''},
+            'tracks': {'items': [], 'next': 'page 2'},
+        } for album_id in album_ids]}
+
+    def artists(self, artist_ids):
+        return {'artists': [{
+            'id': artist_id, 'name': f'Nouveau nom {artist_id}', 'genres': [], 'images': [],
+            'popularity': 0, 'followers': {'total': 0}, 'external_urls': {'spotify': ''},
+        } for artist_id in artist_ids]}
+
+    def next(self, page):
+        return {'items': [], 'next': 'page 3' if page['next'] == 'page 2' else None}
+
+
+@pytest.fixture
+def api():
+    api = SpotifyAPI('client', 'secret', cache_path=None)
+    api.sp = FakeSpotipy()
+    return api
+
+
+def test_metadata_refresh_stays_within_budget(db, api):
+    # Régression : les pages de pistes des gros albums coûtaient des appels en plus du budget
+    artist_ids = [db.create_artist(f'Artiste {i}', f'artist{i}') for i in range(60)]
+    for i in range(45):
+        db.create_album(f'Album {i}', artist_ids[0], spotify_id=f'album{i}')
+
+    report = MetadataRefresher(db, api).run(budget=4)
+    assert api.client_stats()['calls'] <= 4
+    assert report['artists'] == {'checked': 60, 'changed': 60}
+    assert report['albums'] == {'checked': 40, 'changed': 40}
+    titles = [db.get_album_by_spotify_id(f'album{i}').title for i in range(45)]
+    assert sum(title.startswith('Nouveau titre') for title in titles) == 40
+
+
+class DownSpotipy(FakeSpotipy):
+    """Spotify en panne : chaque appel groupé répond 503"""
+
+    def albums(self, album_ids):
+        raise SpotifyException(503, -1, 'indisponible')
+
+    def artists(self, artist_ids):
+        raise SpotifyException(503, -1, 'indisponible')
+
+
+def test_metadata_refresh_does_not_retry_beyond_budget(db, api, monkeypatch):
+    # Régression : chaque appel groupé pouvait être réessayé MAX_RETRIES fois (3 × budget requêtes)
+    monkeypatch.setattr(spotify_api.time, 'sleep', lambda seconds: None)
+    api.sp = DownSpotipy()
+    artist_ids = [db.create_artist(f'Artiste {i}', f'artist{i}') for i in range(60)]
+    for i in range(45):
+        db.create_album(f'Album {i}', artist_ids[0], spotify_id=f'album{i}')
+
+    report = MetadataRefresher(db, api).run(budget=4)
+    assert api.client_stats()['calls'] == 4
+    assert api.client_stats()['retries'] == 0
+    assert report['artists'] == {'checked': 0, 'changed': 0}
+    assert report['albums'] == {'checked': 0, 'changed': 0}
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de jobs.py (dédoublonnage, nouvelles tentatives, planification)"""
+
+import time
+
+import pytest
+
+import jobs
+from jobs import JobQueue
+
+
+@pytest.fixture
+def queue(db, monkeypatch):
+    """File sans threads workers : les tests prennent et exécutent les tâches à la main"""
+    queue = JobQueue(db, workers=1)
+    monkeypatch.setattr(queue, 'start', lambda: None)
+    monkeypatch.setattr(jobs.random, 'uniform', lambda a, b: 1.0)  # Backoff sans hasard
+
+    @queue.handler('ok')
+    def ok(payload):
+        return {'double': payload['n'] * 2}
+
+    @queue.handler('broken')
+    def broken(payload):
+        raise RuntimeError('Spotify en panne')
+
+    return queue
+
+
+def run_next(queue):
+    """Prend la prochaine tâche prête et l'exécute ; retourne son id (ou None)"""
+    job = queue._claim()
+    if job is None:
+        return None
+    queue._run(job)
+    return job['id']
+
+
+def make_due(db, job_id):
+    """Fait comme si l'attente avant la prochaine tentative était passée"""
+    conn = db.get_connection()
+    try:
+        conn.execute('UPDATE jobs SET run_after = 0 WHERE id = ?', (job_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_after(db, job_id):
+    conn = db.get_connection()
+    try:
+        return conn.execute('SELECT run_after FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_enqueue_dedupes_pending_jobs(queue):
+    first = queue.enqueue('ok', {'n': 1}, dedupe_key='import:sp_artist')
+    again = queue.enqueue('ok', {'n': 1}, dedupe_key='import:sp_artist')
+    other = queue.enqueue('ok', {'n': 2}, dedupe_key='import:autre')
+
+    assert again == first
+    assert other != first
+    assert queue.stats()['pending'] == 2
+
+
+def test_dedupe_key_is_free_again_once_the_job_is_done(queue):
+    first = queue.enqueue('ok', {'n': 1}, dedupe_key='import:sp_artist')
+    assert run_next(queue) == first
+
+    second = queue.enqueue('ok', {'n': 1}, dedupe_key='import:sp_artist')
+    assert second != first
+
+
+def test_successful_job_stores_its_result(queue):
+    job_id = queue.enqueue('ok', {'n': 21})
+    run_next(queue)
+
+    job = queue.get_job(job_id)
+    assert job['status'] == 'done'
+    assert job['attempts'] == 1
+    assert job['result'] == {'double': 42}
+
+
+def test_delayed_job_is_not_claimed_early(queue):
+    queue.enqueue('ok', {'n': 1}, delay=60)
+    assert run_next(queue) is None
+
+
+def test_failed_job_is_retried_with_exponential_backoff(queue, db):
+    job_id = queue.enqueue('broken', {}, max_attempts=3)
+
+    for attempt in (1, 2):
+        before = time.time()
+        assert run_next(queue) == job_id
+        job = queue.get_job(job_id)
+        assert job['status'] == 'pending'
+        assert job['attempts'] == attempt
+        assert 'RuntimeError: Spotify en panne' in job['last_error']
+        expected = jobs.BACKOFF_BASE * 2 ** (attempt - 1)  # 5 s, puis 10 s
+        assert before + expected <= run_after(db, job_id) <= time.time() + expected
+        assert run_next(queue) is None  # Pas avant la fin de l'attente
+        make_due(db, job_id)
+
+    run_next(queue)
+    job = queue.get_job(job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 3
+    assert queue.stats()['failed'] == 1
+
+
+def test_backoff_is_capped(queue, db):
+    job_id = queue.enqueue('broken', {}, max_attempts=50)
+    job = queue._claim()
+    before = time.time()
+    queue._fail(job, 20, 'erreur')  # 5 * 2**19 secondes sans plafond
+
+    assert before + jobs.BACKOFF_MAX <= run_after(db, job_id) <= time.time() + jobs.BACKOFF_MAX
+
+
+def test_scheduled_job_is_added_once_across_processes(queue, db):
+    queue.schedule('ok', 3600, {'n': 1})
+    # Un deuxième processus du serveur avec la même planification
+    other = JobQueue(db, workers=1)
+    other.handlers = queue.handlers
+    other.schedule('ok', 3600, {'n': 1})
+
+    queue._enqueue_due()
+    other._enqueue_due()
+
+    assert queue.stats()['pending'] == 1
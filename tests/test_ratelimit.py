@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de ratelimit.py (seau de jetons et disjoncteur)"""
+
+import pytest
+
+from ratelimit import CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+# ========== DISJONCTEUR ==========
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()['short_circuited'] == 1
+    assert breaker.stats()['times_opened'] == 1
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_allows_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    breaker.before_call()  # Délai écoulé : appel d'essai
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Un seul essai à la fois
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.stats()['times_opened'] == 2
+
+
+def test_release_frees_the_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.release()  # L'essai n'a pas eu lieu (pas de jeton)
+    breaker.before_call()
+
+
+# ========== SEAU DE JETONS ==========
+
+def test_bucket_burst_then_reject():
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert all(bucket.acquire(timeout=0) for _ in range(3))
+    assert not bucket.acquire(timeout=0)
+    assert bucket.stats()['rejected'] == 1
+
+
+def test_bucket_pause_empties_the_bucket():
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.pause(5)
+    assert not bucket.acquire(timeout=0.1)
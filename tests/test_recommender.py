@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""Tests du cache des recommandations (recommender.CachedRecommender)"""
+
+import pytest
+
+from database import Database
+from recommender import CachedRecommender
+
+
+class FakeRecommender:
+    """Recommande les albums dans l'ordre des ids, sans ceux déjà notés ; compte les calculs"""
+
+    def __init__(self, db):
+        self.db = db
+        self.calls = 0
+
+    def recommend(self, user_id, limit=12):
+        self.calls += 1
+        rated = self.db.get_user_rated_album_ids(user_id)
+        albums = self.db.get_albums_by_ids(range(1, 50))
+        return [{'album': album} for album_id, album in sorted(albums.items())
+                if album_id not in rated][:limit]
+
+    def stats(self):
+        return {'type': 'fake'}
+
+
+@pytest.fixture
+def albums(db, seed):
+    return [seed['album_id']] + [db.create_album(f'Album {i}', seed['artist_id']) for i in range(3)]
+
+
+def recommended_ids(recommender, user_id):
+    return [item['album'].id for item in recommender.recommend(user_id, limit=3)]
+
+
+def test_cache_hit_and_partial_update(db, seed, albums):
+    fake = FakeRecommender(db)
+    recommender = CachedRecommender(db, fake)
+    assert recommended_ids(recommender, seed['alice']) == albums[:3]
+    assert recommended_ids(recommender, seed['alice']) == albums[:3]
+    assert fake.calls == 1
+
+    db.create_rating(seed['alice'], albums[0], 9)
+    recommender.on_rating_saved(seed['alice'], albums[0])
+    assert recommended_ids(recommender, seed['alice']) == albums[1:4]
+    assert fake.calls == 1  # Album retiré de la liste en cache, sans recalcul
+
+
+def test_rating_saved_by_another_process_is_seen(db, seed, albums, tmp_path):
+    # Régression : le cache n'était invalidé que dans le processus qui avait enregistré la note
+    fake = FakeRecommender(db)
+    recommender = CachedRecommender(db, fake)
+    other_db = Database(str(tmp_path / 'test.db'))
+    other = CachedRecommender(other_db, FakeRecommender(other_db))
+    recommended_ids(recommender, seed['alice'])
+
+    other_db.create_rating(seed['alice'], albums[0], 9)
+    other.on_rating_saved(seed['alice'], albums[0])
+    assert recommended_ids(recommender, seed['alice']) == albums[1:4]
+    assert fake.calls == 2
+
+
+def test_friend_activity_changes_follower_version(db, seed, albums):
+    db.follow_user(seed['alice'], seed['bob'])
+    before = db.get_recommendations_version(seed['alice'])
+    db.create_rating(seed['bob'], albums[0], 9)
+    db.create_rating(seed['bob'], albums[0], 3)  # Mise à jour de la note
+    assert db.get_recommendations_version(seed['alice']) == before + 2
+
+    db.unfollow_user(seed['alice'], seed['bob'])
+    assert db.get_recommendations_version(seed['alice']) == before + 3
+
+
+def test_pull_accounts_do_not_touch_followers(db, seed, albums):
+    db.follow_user(seed['alice'], seed['bob'])
+    conn = db.get_connection()
+    try:
+        conn.execute('UPDATE users SET timeline_pull = 1 WHERE id = ?', (seed['bob'],))
+        conn.commit()
+    finally:
+        conn.close()
+    before = db.get_recommendations_version(seed['alice'])
+    db.create_rating(seed['bob'], albums[0], 9)
+    assert db.get_recommendations_version(seed['alice']) == before
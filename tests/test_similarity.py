@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de similarity.py : le calcul incrémental doit donner le même résultat que le calcul complet"""
+
+import random
+
+import pytest
+
+from similarity import build_album_neighbors
+
+
+@pytest.fixture
+def catalog(db):
+    """30 utilisateurs et 25 albums (insérés en SQL, sans le cryptage des mots de passe)"""
+    conn = db.get_connection()
+    try:
+        conn.execute("INSERT INTO artists (name) VALUES ('Artiste')")
+        conn.executemany('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
+                         [(f'user{i}', f'user{i}@example.com', '') for i in range(30)])
+        conn.executemany('INSERT INTO albums (title, artist_id) VALUES (?, 1)',
+                         [(f'Album {i}',) for i in range(25)])
+        conn.commit()
+    finally:
+        conn.close()
+    return list(range(1, 31)), list(range(1, 26))
+
+
+def execute(db, sql, rows):
+    conn = db.get_connection()
+    try:
+        conn.executemany(sql, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def neighbors_table(db):
+    conn = db.get_connection()
+    try:
+        rows = conn.execute('SELECT album_id, rank, neighbor_id, score FROM album_neighbors '
+                            'ORDER BY album_id, rank').fetchall()
+    finally:
+        conn.close()
+    return [(row[0], row[1], row[2], round(row[3], 5)) for row in rows]
+
+
+def test_incremental_build_matches_full_build(db, catalog):
+    user_ids, album_ids = catalog
+    generator = random.Random(7)
+    ratings = {(user_id, album_id): generator.choice([3, 8, 9])
+               for user_id in user_ids for album_id in generator.sample(album_ids, 8)}
+    execute(db, 'INSERT INTO ratings (user_id, album_id, score) VALUES (?, ?, ?)',
+            [(user_id, album_id, score) for (user_id, album_id), score in ratings.items()])
+    first = build_album_neighbors(db)
+    assert first['full']  # Premier calcul : tout
+    assert neighbors_table(db)
+
+    # Quelques notes changent : nouvelles, modifiées, supprimées
+    changed = generator.sample(sorted(ratings), 6)
+    execute(db, 'UPDATE ratings SET score = 10 - score WHERE user_id = ? AND album_id = ?', changed[:3])
+    execute(db, 'DELETE FROM ratings WHERE user_id = ? AND album_id = ?', changed[3:])
+    new = [(user_id, album_id) for user_id in user_ids[:3] for album_id in album_ids
+           if (user_id, album_id) not in ratings][:4]
+    execute(db, 'INSERT INTO ratings (user_id, album_id, score) VALUES (?, ?, 9)', new)
+
+    report = build_album_neighbors(db)
+    assert not report['full']
+    assert report['albums_refreshed'] > 0
+    incremental = neighbors_table(db)
+
+    build_album_neighbors(db, full=True)
+    assert incremental == neighbors_table(db)
+
+
+def test_nothing_to_do_without_changes(db, catalog):
+    user_ids, album_ids = catalog
+    execute(db, 'INSERT INTO ratings (user_id, album_id, score) VALUES (?, ?, 9)',
+            [(user_id, album_id) for user_id in user_ids[:5] for album_id in album_ids[:3]])
+    build_album_neighbors(db)
+    before = neighbors_table(db)
+
+    report = build_album_neighbors(db)
+    assert report['albums_refreshed'] == 0
+    assert neighbors_table(db) == before
+    assert db.get_album_neighbors(album_ids[0])[0]['album'].id == album_ids[1]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""Tests de SpotifyAPI._call (nouvelles tentatives et disjoncteur), sans appel réseau"""
+
+import pytest
+import requests
+from spotipy.exceptions import SpotifyException
+from spotipy.oauth2 import SpotifyOauthError
+
+import spotify_api
+from ratelimit import CircuitBreaker, CircuitOpenError
+from spotify_api import SpotifyAPI
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(spotify_api.time, 'sleep', lambda seconds: None)  # Pas d'attente entre les essais
+    return SpotifyAPI('client', 'secret', cache_path=None)
+
+
+def failing(error):
+    def call(*args, **kwargs):
+        raise error
+    return call
+
+
+def test_server_errors_are_retried_then_counted(api):
+    with pytest.raises(SpotifyException):
+        api._call(failing(SpotifyException(503, -1, 'indisponible')))
+    stats = api.client_stats()
+    assert stats['calls'] == spotify_api.MAX_RETRIES + 1
+    assert api.breaker.stats()['consecutive_failures'] == spotify_api.MAX_RETRIES + 1
+
+
+def test_client_errors_are_not_retried(api):
+    with pytest.raises(SpotifyException):
+        api._call(failing(SpotifyException(404, -1, 'introuvable')))
+    assert api.client_stats()['calls'] == 1
+    assert api.breaker.state == 'closed'
+
+
+def test_network_error_then_success(api):
+    answers = [requests.exceptions.ConnectionError('coupé'), {'ok': True}]
+
+    def flaky():
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert api._call(flaky) == {'ok': True}
+    assert api.breaker.state == 'closed'
+
+
+@pytest.mark.parametrize('error', [SpotifyOauthError('jeton refusé'), ValueError('JSON'), KeyError('albums')])
+def test_unexpected_error_during_trial_does_not_block_breaker(api, error):
+    # Régression : une exception imprévue pendant l'appel d'essai laissait le disjoncteur
+    # refuser tous les appels suivants jusqu'au redémarrage
+    api.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    api.breaker.record_failure()
+
+    with pytest.raises(type(error)):
+        api._call(failing(error))
+    assert api.client_stats()['calls'] == 1  # Pas de nouvelle tentative
+
+    assert api._call(lambda: 'ok') == 'ok'  # Nouvel essai possible, qui referme le disjoncteur
+    assert api.breaker.state == 'closed'
+
+
+def test_open_breaker_short_circuits(api):
+    api.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    api.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        api._call(lambda: 'jamais appelé')
+    assert api.client_stats()['calls'] == 0
+
+
+def test_no_retries_means_one_request(api):
+    with pytest.raises(SpotifyException):
+        api._call(failing(SpotifyException(503, -1, 'indisponible')), retries=0)
+    with pytest.raises(SpotifyException):
+        api._call(failing(SpotifyException(429, -1, 'trop vite', headers={'Retry-After': '0'})), retries=0)
+    stats = api.client_stats()
+    assert stats['calls'] == 2
+    assert stats['retries'] == 0